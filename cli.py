@@ -1,149 +1,415 @@
 #!/usr/bin/env python3
 """
 Hivra CapsuleNet CLI - Stateful version.
+
+Commands import the model modules they need when they run, so read-only
+commands (``list``, ``status``, ``invitations``) start without loading the
+core model at all.
 """
 import argparse
 import json
+import os
 import sys
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Optional, List, Dict, Any
-from datetime import datetime
+from typing import TYPE_CHECKING, Optional, List, Dict, Any, Iterator, Tuple
+
+from src.storage import BACKENDS, open_store
+from src.storage.layout import LAYOUTS
+from src.storage.files import (
+    ADMISSION_LOCK, INVITATIONS_LOCK, PROJECTIONS_LOCK, STARTERS_LOCK, atomic_write_json,
+    capsule_lock, locked,
+)
+
+if TYPE_CHECKING:
+    from src.core.capsule import Capsule
+    from src.core.ledger import Ledger
+    from src.core.projections import Projector
+    from src.core.query import Query
+    from src.core.registry import StarterRegistry
+    from src.modules.admission import AdmissionController
+    from src.storage.cached import CachedStore
 
-from src.core.capsule import Capsule, CapsuleType
-from src.core.ledger import Ledger
-from src.core.state import State
-from src.events import Event, create_invitation_event
+DEFAULT_DATA_DIR = Path.home() / ".capsulenet"
+
+# Capsules plus ledger entries kept decoded in memory (see CachedStore)
+CACHE_SIZE = 100_000
 
 
 class CapsuleManager:
     """Manages capsules with state persistence."""
     
-    def __init__(self, data_dir: Path = Path.home() / ".capsulenet"):
+    def __init__(self, data_dir: Path = DEFAULT_DATA_DIR, backend: Optional[str] = None,
+                 cache_size: Optional[int] = CACHE_SIZE):
         self.data_dir = data_dir
-        self.data_dir.mkdir(exist_ok=True)
-        self._invitations_file = data_dir / "invitations.json"
+        self._backend = backend
+        self._cache_size = cache_size
+        self._store = None
         self._state_file = data_dir / "cli_state.json"
+        self._starters_file = data_dir / "starters.json"
+        self._admission_file = data_dir / "admission.json"
+        self._projections_file = data_dir / "projections.json"
         self._current_capsule: Optional[str] = None
+        # Set by enable_cache(): registry/admission objects kept between commands
+        self._cached = False
+        self._write_back = False
+        self._registry: Optional["StarterRegistry"] = None
+        self._admission: Optional["AdmissionController"] = None
+        self._projector: Optional["Projector"] = None
+        self._dirty: set = set()
+        # Versions of the files the objects above were read from or written to
+        self._versions: Dict[str, Optional[Tuple[int, int, int]]] = {}
+    
+    @staticmethod
+    def _version(path: Path) -> Optional[Tuple[int, int, int]]:
+        # Files are replaced by rename, so the inode changes on every save
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+    
+    def _is_current(self, name: str, path: Path) -> bool:
+        """
+        Whether what is held in memory for ``path`` is still what it holds:
+        deferred saves always are, anything else only if no other process
+        replaced the file since (as ``CachedStore`` checks for capsules).
+        """
+        return self._write_back or self._versions.get(name, False) == self._version(path)
+    
+    @property
+    def store(self) -> "CachedStore":
+        """
+        Storage backend, opened (and the data directory created) on first use.
+        
+        Wrapped in a validating LRU cache: repeated loads of a capsule or
+        ledger cost a ``stat`` (JSON) or one query (SQLite) instead of a parse,
+        and changes by other processes are still seen.
+        """
+        if self._store is None:
+            from src.storage.cached import CachedStore
+            
+            self._store = CachedStore(
+                open_store(self.data_dir, self._backend),
+                validate=True, max_size=self._cache_size,
+            )
+        return self._store
+    
+    @store.setter
+    def store(self, store: Optional["CachedStore"]) -> None:
+        self._store = store
     
     def get_current_capsule_id(self) -> Optional[str]:
         """Get currently loaded capsule ID."""
+        if self._current_capsule is not None and self._is_current("state", self._state_file):
+            return self._current_capsule
+        self._current_capsule = None
+        self._versions["state"] = self._version(self._state_file)
         if self._state_file.exists():
             try:
                 with open(self._state_file, 'r') as f:
                     state = json.load(f)
-                return state.get('current_capsule')
+                self._current_capsule = state.get('current_capsule')
             except:
                 pass
-        return None
+        return self._current_capsule
     
     def set_current_capsule(self, capsule_id: str) -> None:
         """Set current capsule."""
+        self._current_capsule = capsule_id
+        if self._write_back:
+            self._dirty.add("state")
+            return
         state = {'current_capsule': capsule_id}
-        with open(self._state_file, 'w') as f:
-            json.dump(state, f, indent=2)
+        atomic_write_json(self._state_file, state, indent=2)
+        self._versions["state"] = self._version(self._state_file)
     
     def clear_current_capsule(self) -> None:
         """Clear current capsule."""
         if self._state_file.exists():
             self._state_file.unlink()
+        self._current_capsule = None
     
     def load_capsule(self, capsule_id: str) -> Optional[Dict]:
         """Load capsule data."""
-        capsule_file = self.data_dir / f"{capsule_id}_capsule.json"
-        if not capsule_file.exists():
-            return None
-        
-        try:
-            with open(capsule_file, 'r') as f:
-                data = json.load(f)
-            return data
-        except:
-            return None
+        return self.store.load_capsule(capsule_id)
     
     def save_capsule(self, capsule_id: str, data: Dict) -> None:
         """Save capsule data."""
-        capsule_file = self.data_dir / f"{capsule_id}_capsule.json"
-        with open(capsule_file, 'w') as f:
-            json.dump(data, f, indent=2)
+        self.store.save_capsule(capsule_id, data)
     
-    def load_ledger(self, capsule_id: str) -> Ledger:
+    def get_capsule(self, capsule_id: str) -> Optional["Capsule"]:
+        """Load a decoded capsule (cached: call ``put_capsule`` after changing it)."""
+        from src.core.capsule import Capsule
+        
+        return self.store.load_capsule_object(capsule_id, Capsule.from_dict)
+    
+    def put_capsule(self, capsule: "Capsule") -> None:
+        """Save a capsule, keeping the decoded object in the cache."""
+        self.store.save_capsule(capsule.capsule_id, capsule.to_dict(), decoded=capsule)
+    
+    def load_ledger(self, capsule_id: str) -> "Ledger":
         """Load or create ledger."""
-        ledger_file = self.data_dir / f"{capsule_id}_ledger.json"
-        if ledger_file.exists():
-            return Ledger.load_from_file(str(ledger_file))
-        return Ledger(capsule_id)
+        return self.store.load_ledger(capsule_id)
     
-    def save_ledger(self, capsule_id: str, ledger: Ledger) -> None:
+    def save_ledger(self, capsule_id: str, ledger: "Ledger") -> None:
         """Save ledger."""
-        ledger_file = self.data_dir / f"{capsule_id}_ledger.json"
-        ledger.save_to_file(str(ledger_file))
+        self.store.save_ledger(capsule_id, ledger)
+    
+    def replace_ledger(self, capsule_id: str, ledger: "Ledger") -> None:
+        """Save a ledger whose entries were rewritten, not only appended to."""
+        self.store.replace_ledger(capsule_id, ledger)
     
     def load_invitations(self) -> List[Dict]:
-        """Load invitations."""
-        if not self._invitations_file.exists():
-            return []
-        try:
-            with open(self._invitations_file, 'r') as f:
-                return json.load(f)
-        except:
-            return []
+        """Load all pending invitations."""
+        return self.store.load_invitations()
     
     def save_invitations(self, invitations: List[Dict]) -> None:
-        """Save invitations."""
-        with open(self._invitations_file, 'w') as f:
-            json.dump(invitations, f, indent=2)
+        """Replace all pending invitations."""
+        self.store.save_invitations(invitations)
     
-    def list_capsules(self) -> List[Dict]:
-        """List all capsules."""
-        capsules = []
-        for file in self.data_dir.glob("*_capsule.json"):
-            caps_id = file.name.replace("_capsule.json", "")
+    def get_invitation(self, invitation_id: str) -> Optional[Dict]:
+        return self.store.get_invitation(invitation_id)
+    
+    def invitations_for(self, capsule_id: str) -> List[Dict]:
+        """Pending invitations addressed to a capsule, oldest first."""
+        return self.store.invitations_for(capsule_id)
+    
+    def count_invitations(self) -> int:
+        return self.store.count_invitations()
+    
+    def next_invitation_expiry(self) -> Optional[int]:
+        """Earliest deadline of any pending invitation (``None``: nothing expires)."""
+        return self.store.next_invitation_expiry()
+    
+    def expired_invitations(self, now_ns: int) -> List[Dict]:
+        """Pending invitations whose deadline is at or before ``now_ns``."""
+        return self.store.expired_invitations(now_ns)
+    
+    def add_invitation(self, invitation: Dict) -> None:
+        self.store.add_invitation(invitation)
+    
+    def remove_invitations(self, invitation_ids: List[str]) -> None:
+        self.store.remove_invitations(invitation_ids)
+    
+    def load_starter_registry(self) -> "StarterRegistry":
+        """Load starter ownership registry, rebuilding it from capsules if missing."""
+        if self._registry is not None and self._is_current("registry", self._starters_file):
+            return self._registry
+        from src.core.capsule import Capsule
+        from src.core.registry import StarterRegistry
+        
+        self._versions["registry"] = self._version(self._starters_file)
+        if self._starters_file.exists():
+            registry = StarterRegistry.load_from_file(str(self._starters_file))
+        else:
+            registry = StarterRegistry.from_capsules(
+                Capsule.from_dict(data) for data in self.store.iter_capsules()
+            )
+        if self._cached:
+            self._registry = registry
+        return registry
+    
+    def save_starter_registry(self, registry: "StarterRegistry") -> None:
+        """Save starter ownership registry."""
+        if self._cached:
+            self._registry = registry
+        if self._write_back:
+            self._dirty.add("registry")
+        else:
+            atomic_write_json(self._starters_file, registry.to_dict(), indent=2)
+            self._versions["registry"] = self._version(self._starters_file)
+    
+    def load_admission(self) -> "AdmissionController":
+        """Load invitation admission state (token buckets)."""
+        if self._admission is not None and self._is_current("admission", self._admission_file):
+            return self._admission
+        from src.modules.admission import AdmissionController
+        
+        self._versions["admission"] = self._version(self._admission_file)
+        admission = AdmissionController()
+        if self._admission_file.exists():
             try:
-                with open(file, 'r') as f:
-                    data = json.load(f)
-                caps_type = data.get("capsule_type", "unknown").upper()
-                
-                slots = data.get("slots", {})
-                starter_count = sum(1 for s in slots.values() if s.get("starter_id"))
-                total_slots = len(slots)
-                
-                capsules.append({
-                    'id': caps_id,
-                    'type': caps_type,
-                    'starters': f"{starter_count}/{total_slots}",
-                    'is_genesis': caps_type == "GENESIS"
-                })
+                with open(self._admission_file, 'r') as f:
+                    admission = AdmissionController.from_dict(json.load(f))
             except:
+                pass
+        if self._cached:
+            self._admission = admission
+        return admission
+    
+    def save_admission(self, admission: "AdmissionController") -> None:
+        """Save invitation admission state."""
+        if self._cached:
+            self._admission = admission
+        if self._write_back:
+            self._dirty.add("admission")
+        else:
+            atomic_write_json(self._admission_file, admission.to_dict())
+            self._versions["admission"] = self._version(self._admission_file)
+    
+    def load_projections(self) -> "Projector":
+        """
+        Ledger projections (see ``src/core/projections.py``), caught up first.
+        
+        The checkpoint in ``projections.json`` records how far each ledger was
+        read; only ledgers that grew since are loaded, and the checkpoint is
+        rewritten when something new was applied.
+        """
+        from src.core.projections import Projector
+        
+        with self.lock(projections=True):
+            projector = self._projector
+            if projector is None:
+                projector = Projector()
+                if self._projections_file.exists():
+                    try:
+                        with open(self._projections_file, 'r') as f:
+                            projector = Projector.from_dict(json.load(f))
+                    except ValueError:
+                        pass  # unreadable checkpoint: rebuilt below
+            
+            lengths = {s['capsule_id']: s['ledger_length'] for s in self.store.capsule_summaries()}
+            if any(length < projector.position(cid) for cid, length in lengths.items()):
+                projector.reset()  # a ledger was rewritten: start over
+            applied = sum(
+                projector.catch_up(self.load_ledger(capsule_id))
+                for capsule_id, length in lengths.items()
+                if length != projector.position(capsule_id)
+            )
+            if applied or not self._projections_file.exists():
+                atomic_write_json(self._projections_file, projector.to_dict())
+        if self._cached:
+            self._projector = projector
+        return projector
+    
+    def reset_projections(self) -> None:
+        """Drop the projections checkpoint; the next ``load_projections`` rebuilds it."""
+        with self.lock(projections=True):
+            self._projector = None
+            if self._projections_file.exists():
+                self._projections_file.unlink()
+    
+    @contextmanager
+    def lock(self, *capsule_ids: str, invitations: bool = False, starters: bool = False,
+             admission: bool = False, projections: bool = False) -> Iterator[None]:
+        """
+        Lock capsules and shared files for a read-modify-write by this process.
+        
+        Load them after taking the lock. Saves are flushed to the store before
+        the locks are released, so the next holder reads them.
+        """
+        names = [capsule_lock(capsule_id) for capsule_id in capsule_ids]
+        for name, wanted in ((INVITATIONS_LOCK, invitations), (STARTERS_LOCK, starters),
+                             (ADMISSION_LOCK, admission), (PROJECTIONS_LOCK, projections)):
+            if wanted:
+                names.append(name)
+        with locked(self.data_dir, *names):
+            yield
+            if not self._write_back:
+                self.store.flush()
+    
+    def list_capsules(self) -> List[Dict]:
+        """List all capsules (from the store's summaries, not the capsule files)."""
+        capsules = []
+        for summary in self.store.capsule_summaries():
+            if not summary['capsule_type']:
                 capsules.append({
-                    'id': caps_id,
+                    'id': summary['capsule_id'],
                     'type': "ERROR",
                     'starters': "?/?",
+                    'events': 0,
                     'is_genesis': False
                 })
+                continue
+            
+            caps_type = summary['capsule_type'].upper()
+            capsules.append({
+                'id': summary['capsule_id'],
+                'type': caps_type,
+                'starters': f"{summary['occupied']}/{summary['slots']}",
+                'events': summary['ledger_length'],
+                'is_genesis': caps_type == "GENESIS"
+            })
         return capsules
+    
+    def enable_cache(self, write_back: bool = False) -> None:
+        """
+        Also keep the starter registry and admission state in memory; they
+        are reloaded when another process replaced their file. With
+        ``write_back`` saves of those and of capsules, ledgers and invitations
+        are deferred until ``flush`` (single-writer processes only).
+        """
+        self.store.write_back = write_back
+        self._cached = True
+        self._write_back = write_back
+    
+    def invalidate_cache(self) -> None:
+        """Drop everything held in memory, including unflushed saves."""
+        if self._store is not None:
+            self._store.invalidate()
+        self._registry = None
+        self._admission = None
+        self._projector = None
+        self._dirty = set()
+    
+    def flush(self) -> None:
+        """Write deferred saves: each dirty capsule, ledger and index once."""
+        self.store.flush()
+        if "registry" in self._dirty:
+            atomic_write_json(self._starters_file, self._registry.to_dict(), indent=2)
+            self._versions["registry"] = self._version(self._starters_file)
+        if "admission" in self._dirty:
+            atomic_write_json(self._admission_file, self._admission.to_dict())
+            self._versions["admission"] = self._version(self._admission_file)
+        if "state" in self._dirty:
+            atomic_write_json(self._state_file, {'current_capsule': self._current_capsule}, indent=2)
+            self._versions["state"] = self._version(self._state_file)
+        self._dirty = set()
+    
+    def close(self) -> None:
+        """Flush pending writes and release the store."""
+        if self._store is None:
+            return
+        self.flush()
+        self._store.close()
 
 
-def create_capsule(capsule_type: str, capsule_id: str, manager: CapsuleManager) -> None:
+def create_capsule(capsule_type: str, capsule_id: str, manager: CapsuleManager) -> bool:
     """Create new capsule."""
+    from src.core.capsule import Capsule, CapsuleType
+    from src.core.ledger import Ledger
+    from src.events import StarterEvent
+    
     try:
         caps_type = CapsuleType(capsule_type.lower())
     except ValueError:
         print(f"Error: Use 'genesis' or 'proto'")
-        return
+        return False
     
     capsule = Capsule(capsule_id=capsule_id, capsule_type=caps_type)
-    manager.save_capsule(capsule_id, capsule.to_dict())
+    with manager.lock(capsule_id, starters=True):
+        registry = manager.load_starter_registry()
+        registry.register_capsule(capsule)
+        manager.put_capsule(capsule)
+        manager.save_starter_registry(registry)
+        
+        # The ledger starts with the starters the capsule was created with
+        ledger = Ledger(capsule_id)
+        ledger.append_many(
+            (StarterEvent(starter_id=starter_id, source=capsule_id,
+                          metadata={"action": "starter_generated", "slot": slot}), ["starter"])
+            for slot, starter_id in capsule.occupied_slots()
+        )
+        manager.save_ledger(capsule_id, ledger)
     manager.set_current_capsule(capsule_id)
     
-    # Create empty ledger
-    ledger = Ledger(capsule_id)
-    manager.save_ledger(capsule_id, ledger)
-    
     print(f"✓ Created {capsule_type.upper()} capsule: {capsule_id}")
     if caps_type == CapsuleType.GENESIS:
         print(f"  🎉 All 5 starters created automatically")
     else:
         print(f"  ⏳ Empty slots - needs invitation to get starters")
+    return True
 
 
 def load_capsule(capsule_id: str, manager: CapsuleManager) -> bool:
@@ -165,19 +431,19 @@ def show_status(capsule_id: str, manager: CapsuleManager) -> None:
         print(f"Error: Capsule '{capsule_id}' not found")
         return
     
-    capsule = Capsule.from_dict(data)
-    ledger = manager.load_ledger(capsule_id)
-    invitations = manager.load_invitations()
-    my_invitations = [inv for inv in invitations if inv['recipient'] == capsule_id]
+    # Read-only: works on the stored dict and summary, no model objects
+    capsule_type = data["capsule_type"]
+    summary = manager.store.capsule_summary(capsule_id)
+    my_invitations = _pending(manager.invitations_for(capsule_id))
     
     print(f"\n{'='*50}")
     print(f"CAPSULE: {capsule_id}")
-    print(f"TYPE: {capsule.capsule_type.value.upper()}")
+    print(f"TYPE: {capsule_type.upper()}")
     print(f"{'='*50}")
     
     print("\n🧪 STARTER SLOTS:")
-    for slot_name, slot in capsule.slots.items():
-        if slot.starter_id:
+    for slot_name, slot in data["slots"].items():
+        if slot.get("starter_id"):
             print(f"  {slot_name:15} ✅ OCCUPIED")
         else:
             print(f"  {slot_name:15} ⭕ EMPTY")
@@ -189,9 +455,9 @@ def show_status(capsule_id: str, manager: CapsuleManager) -> None:
         if len(my_invitations) > 3:
             print(f"  ... and {len(my_invitations) - 3} more")
     
-    print(f"\n📊 Ledger events: {len(ledger.entries)}")
+    print(f"\n📊 Ledger events: {summary['ledger_length'] if summary else 0}")
     
-    if capsule.capsule_type == CapsuleType.GENESIS:
+    if capsule_type == "genesis":
         print(f"\n💡 This GENESIS capsule can send invitations")
         print(f"   Command: cli.py invite <recipient> <slot>")
     else:
@@ -215,7 +481,7 @@ def list_capsules(manager: CapsuleManager) -> None:
     
     for caps in capsules:
         type_icon = "👑" if caps['is_genesis'] else "🆕"
-        print(f"  {type_icon} {caps['id']:20} - {caps['type']:8} [{caps['starters']} starters]")
+        print(f"  {type_icon} {caps['id']:20} - {caps['type']:8} [{caps['starters']} starters, {caps['events']} events]")
     
     current = manager.get_current_capsule_id()
     if current:
@@ -223,57 +489,176 @@ def list_capsules(manager: CapsuleManager) -> None:
     print(f"💡 Load capsule: cli.py load <id>")
 
 
-def send_invitation(sender_id: str, recipient_id: str, slot_name: str, manager: CapsuleManager) -> None:
+def _pending(invitations: List[Dict]) -> List[Dict]:
+    """Drop invitations that expired but have not been swept yet."""
+    from src.clock import now_ns
+    from src.storage.invitations import is_expired
+    
+    now = now_ns()
+    return [inv for inv in invitations if not is_expired(inv, now)]
+
+
+def _local_time(value_ns: int) -> str:
+    from datetime import datetime
+    
+    return datetime.fromtimestamp(value_ns / 1e9).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def expire_invitations(manager: CapsuleManager, now_ns: Optional[int] = None) -> int:
+    """
+    Sweep invitations past their deadline; returns how many expired.
+    
+    Runs before every command that changes pending invitations. When nothing
+    is due it costs one look at the store's expiry index.
+    """
+    from src import clock
+    
+    now_ns = clock.now_ns() if now_ns is None else now_ns
+    due = manager.next_invitation_expiry()
+    if due is None or due > now_ns:
+        return 0
+    # Peek at the senders so their ledgers can be locked; re-read under the lock
+    senders = {inv['sender'] for inv in manager.expired_invitations(now_ns)}
+    with manager.lock(*senders, invitations=True, starters=True):
+        return _expire_invitations(manager, senders, now_ns)
+
+
+def _expire_invitations(manager: CapsuleManager, locked_senders: set, now_ns: int) -> int:
+    from src.modules.expiry import record_expiry
+    
+    expired = [inv for inv in manager.expired_invitations(now_ns) if inv['sender'] in locked_senders]
+    if not expired:
+        return 0
+    manager.remove_invitations([inv['id'] for inv in expired])
+    
+    registry = manager.load_starter_registry()
+    ledgers = record_expiry(expired, manager.load_ledger, registry)
+    for sender_id, ledger in ledgers.items():
+        manager.save_ledger(sender_id, ledger)
+    manager.save_starter_registry(registry)
+    return len(expired)
+
+
+def backfill_expiry(manager: CapsuleManager) -> int:
+    """Give invitations written before expiry existed a deadline from their timestamp."""
+    from src.core.capsule import CapsuleType
+    from src.modules.expiry import expiry_policy_for, legacy_expiry_ns
+    
+    with manager.lock(invitations=True):
+        invitations = manager.load_invitations()
+        recipient_types: Dict[str, Optional[str]] = {}
+        updated = 0
+        result = []
+        for inv in invitations:
+            if 'expires_ns' in inv:
+                result.append(inv)
+                continue
+            recipient = inv['recipient']
+            if recipient not in recipient_types:
+                data = manager.load_capsule(recipient)
+                recipient_types[recipient] = data["capsule_type"] if data else None
+            capsule_type = CapsuleType(recipient_types[recipient] or CapsuleType.PROTO.value)
+            result.append(dict(inv, expires_ns=legacy_expiry_ns(inv, expiry_policy_for(capsule_type))))
+            updated += 1
+        if updated:
+            manager.save_invitations(result)
+    return updated
+
+
+def expire_command(manager: CapsuleManager) -> None:
+    """Sweep expired invitations now, dating any that predate expiry first."""
+    backfilled = backfill_expiry(manager)
+    expired = expire_invitations(manager)
+    
+    print(f"\n⌛ EXPIRY:")
+    if backfilled:
+        print(f"  Deadlines given to older invitations: {backfilled}")
+    print(f"  Expired: {expired}")
+    print(f"  Still pending: {manager.count_invitations()}")
+    due = manager.next_invitation_expiry()
+    if due is not None:
+        print(f"  Next expiry: {_local_time(due)}")
+
+
+def send_invitation(sender_id: str, recipient_id: str, slot_name: str, manager: CapsuleManager) -> Optional[str]:
     """Send invitation from Genesis to Proto."""
-    sender_data = manager.load_capsule(sender_id)
-    if not sender_data:
+    expire_invitations(manager)
+    # The recipient is only read; its capsule is not locked. Shared files
+    # are locked only around their own read-modify-write, so sends from
+    # other capsules are not held up by this one
+    with manager.lock(sender_id):
+        return _send_invitation(sender_id, recipient_id, slot_name, manager)
+
+
+def _held_by_other(registry, starter_id: str, sender_id: str, slot_name: str) -> bool:
+    owner = registry.owner_of(starter_id)
+    if owner is not None and owner != sender_id:
+        print(f"Error: Starter in '{slot_name}' is held by {owner}")
+        return True
+    return False
+
+
+def _send_invitation(sender_id: str, recipient_id: str, slot_name: str, manager: CapsuleManager) -> Optional[str]:
+    from datetime import datetime
+    from src.clock import now_ns
+    from src.core.capsule import CapsuleType
+    from src.events import create_invitation_event
+    from src.modules.expiry import expiry_policy_for
+    
+    sender = manager.get_capsule(sender_id)
+    if not sender:
         print(f"Error: Sender capsule '{sender_id}' not found")
-        return
+        return None
     
-    sender = Capsule.from_dict(sender_data)
     if sender.capsule_type != CapsuleType.GENESIS:
         print(f"Error: Only GENESIS capsules can send invitations")
-        return
+        return None
     
-    recipient_data = manager.load_capsule(recipient_id)
-    if not recipient_data:
+    recipient = manager.get_capsule(recipient_id)
+    if not recipient:
         print(f"Error: Recipient capsule '{recipient_id}' not found")
         print(f"  Create it first: cli.py create proto {recipient_id}")
-        return
+        return None
     
-    recipient = Capsule.from_dict(recipient_data)
     if recipient.capsule_type != CapsuleType.PROTO:
         print(f"Error: Recipient must be a PROTO capsule")
-        return
+        return None
     
     slot = sender.get_slot(slot_name)
     if not slot:
         print(f"Error: Slot '{slot_name}' not found")
         print(f"  Available: {', '.join(sender.slots.keys())}")
-        return
+        return None
     
     if not slot.starter_id:
         print(f"Error: Slot '{slot_name}' is empty")
-        return
+        return None
+    
+    # Checked again under the starters lock before the offer is recorded
+    if _held_by_other(manager.load_starter_registry(), slot.starter_id, sender_id, slot_name):
+        return None
+    
+    # Admission control: reject floods before anything is written
+    with manager.lock(admission=True):
+        admission = manager.load_admission()
+        admission.in_flight = manager.count_invitations()
+        rejection = admission.admit(sender_id, recipient_id, recipient.capsule_type)
+        manager.save_admission(admission)
+    if rejection:
+        print(f"Error: Invitation rejected: {rejection}")
+        return None
     
     # Create invitation
-    invitation_id = f"inv_{sender_id}_{recipient_id}_{datetime.now().strftime('%Y%m%d%H%M%S')}"
+    invitation_id = f"inv_{sender_id}_{recipient_id}_{datetime.now().strftime('%Y%m%d%H%M%S')}_{os.urandom(3).hex()}"
     invitation = {
         'id': invitation_id,
         'sender': sender_id,
         'recipient': recipient_id,
         'slot': slot_name,
         'starter_id': slot.starter_id,
-        'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        'expires_ns': expiry_policy_for(recipient.capsule_type).expires_ns(now_ns()),
     }
-    
-    # Save invitation
-    invitations = manager.load_invitations()
-    invitations.append(invitation)
-    manager.save_invitations(invitations)
-    
-    # Record in sender's ledger
-    ledger = manager.load_ledger(sender_id)
     event = create_invitation_event(
         invitation_id=invitation_id,
         sender_id=sender_id,
@@ -282,6 +667,19 @@ def send_invitation(sender_id: str, recipient_id: str, slot_name: str, manager:
         capsule_id=sender_id,
         slot_type=slot_name
     )
+    event.metadata["expires_ns"] = invitation['expires_ns']
+    
+    # Save invitation and offer
+    with manager.lock(invitations=True, starters=True):
+        registry = manager.load_starter_registry()
+        if _held_by_other(registry, slot.starter_id, sender_id, slot_name):
+            return None
+        manager.add_invitation(invitation)
+        registry.mark_offered(slot.starter_id, event.event_id)
+        manager.save_starter_registry(registry)
+    
+    # Record in sender's ledger
+    ledger = manager.load_ledger(sender_id)
     ledger.append(event, tags=["invitation", "outgoing"])
     manager.save_ledger(sender_id, ledger)
     
@@ -290,77 +688,181 @@ def send_invitation(sender_id: str, recipient_id: str, slot_name: str, manager:
     print(f"  To: {recipient_id} (PROTO)")
     print(f"  Starter: {slot_name}")
     print(f"  Invitation ID: {invitation_id}")
+    if invitation['expires_ns'] is not None:
+        print(f"  Expires: {_local_time(invitation['expires_ns'])}")
     print(f"\n💡 {recipient_id} can accept with:")
     print(f"    cli.py accept {invitation_id}")
+    return invitation_id
 
 
-def accept_invitation(capsule_id: str, invitation_id: str, manager: CapsuleManager) -> None:
+def accept_invitation(capsule_id: str, invitation_id: str, manager: CapsuleManager) -> bool:
     """Accept invitation (Proto only)."""
-    capsule_data = manager.load_capsule(capsule_id)
-    if not capsule_data:
+    expire_invitations(manager)
+    # The sender's capsule is not changed, so it is not locked. The shared
+    # files are locked only while the invitation is claimed
+    with manager.lock(capsule_id):
+        return _accept_invitation(capsule_id, invitation_id, manager)
+
+
+def _accept_invitation(capsule_id: str, invitation_id: str, manager: CapsuleManager) -> bool:
+    from src.core.capsule import CapsuleType, allocate_starter_ids
+    from src.core.registry import StarterConflictError
+    from src.events import Event
+    
+    capsule = manager.get_capsule(capsule_id)
+    if not capsule:
         print(f"Error: Capsule '{capsule_id}' not found")
-        return
+        return False
     
-    capsule = Capsule.from_dict(capsule_data)
     if capsule.capsule_type != CapsuleType.PROTO:
         print(f"Error: Only PROTO capsules can accept invitations")
-        return
+        return False
     
-    invitations = manager.load_invitations()
-    invitation = next((inv for inv in invitations if inv['id'] == invitation_id), None)
+    invitation = manager.get_invitation(invitation_id)
     
     if not invitation:
         print(f"Error: Invitation '{invitation_id}' not found")
-        return
+        return False
     
     if invitation['recipient'] != capsule_id:
         print(f"Error: Invitation is for {invitation['recipient']}, not {capsule_id}")
-        return
+        return False
+    
+    if not _pending([invitation]):
+        print(f"Error: Invitation '{invitation_id}' has expired")
+        return False
     
     slot_name = invitation['slot']
     slot = capsule.get_slot(slot_name)
     if not slot:
         print(f"Error: Slot '{slot_name}' not found")
-        return
+        return False
     
     if slot.starter_id:
         print(f"Error: Slot '{slot_name}' is already occupied")
-        return
-    
-    # Accept invitation
-    slot.starter_id = invitation['starter_id']
-    
-    # Save updated capsule
-    manager.save_capsule(capsule_id, capsule.to_dict())
+        return False
     
-    # Record in ledger
-    ledger = manager.load_ledger(capsule_id)
+    # Accept invitation: the empty slot gets a new own starter (spec §4),
+    # the sender keeps the one it offered
+    new_starter_id = allocate_starter_ids(1)[0]
     event = Event(event_type="invitation_accepted")
     event.metadata.update({
         "invitation_id": invitation_id,
         "sender": invitation['sender'],
         "slot": slot_name,
-        "new_starter_id": slot.starter_id
+        "starter_id": invitation['starter_id'],
+        "new_starter_id": new_starter_id
     })
+    
+    # Claim the invitation: whoever removes it first has accepted it
+    with manager.lock(invitations=True, starters=True):
+        if manager.get_invitation(invitation_id) is None:
+            print(f"Error: Invitation '{invitation_id}' not found")
+            return False
+        registry = manager.load_starter_registry()
+        try:
+            registry.validate_transfer(invitation['starter_id'], invitation['sender'], capsule_id)
+        except StarterConflictError as e:
+            print(f"Error: {e}")
+            return False
+        registry.accept_offer(invitation['starter_id'], invitation['sender'], capsule_id, slot_name,
+                              new_starter_id, event.event_id)
+        manager.save_starter_registry(registry)
+        manager.remove_invitations([invitation_id])
+    
+    # Save updated capsule
+    slot.starter_id = new_starter_id
+    manager.put_capsule(capsule)
+    
+    # Record in ledger
+    ledger = manager.load_ledger(capsule_id)
     ledger.append(event, tags=["invitation", "accepted"])
     manager.save_ledger(capsule_id, ledger)
     
-    # Remove invitation
-    invitations = [inv for inv in invitations if inv['id'] != invitation_id]
-    manager.save_invitations(invitations)
-    
     print(f"\n✅ INVITATION ACCEPTED:")
     print(f"  By: {capsule_id} (PROTO)")
     print(f"  From: {invitation['sender']} (GENESIS)")
     print(f"  Starter: {slot_name}")
     print(f"  Starter ID: {slot.starter_id[:12]}...")
     print(f"\n🎉 {capsule_id} now has {slot_name} starter!")
+    return True
+
+
+def process_inbox_command(capsule_id: str, action: str, manager: CapsuleManager,
+                          sender: Optional[str] = None, slot: Optional[str] = None) -> bool:
+    """Accept or reject all matching pending invitations at once."""
+    expire_invitations(manager)
+    # Handle the senders seen now; invitations from newer senders stay pending
+    senders = {inv['sender'] for inv in manager.invitations_for(capsule_id)}
+    if sender:
+        senders &= {sender}
+    # Senders' capsules only change when a rejection burns their starter
+    locked = senders if action != "accept" else ()
+    with manager.lock(capsule_id, *locked, invitations=True, starters=True):
+        return _process_inbox(capsule_id, action, manager, senders, sender, slot)
+
+
+def _process_inbox(capsule_id: str, action: str, manager: CapsuleManager, locked_senders: set,
+                   sender: Optional[str] = None, slot: Optional[str] = None) -> bool:
+    from src.core.capsule import CapsuleType
+    from src.modules.inbox import (
+        accept_if_empty, accept_if_empty_else_reject, process_inbox, reject_all,
+    )
+    
+    capsule = manager.get_capsule(capsule_id)
+    if not capsule:
+        print(f"Error: Capsule '{capsule_id}' not found")
+        return False
+    
+    if action != "reject" and capsule.capsule_type != CapsuleType.PROTO:
+        print(f"Error: Only PROTO capsules can accept invitations")
+        return False
+    
+    policy = {
+        "accept": accept_if_empty,
+        "accept-or-reject": accept_if_empty_else_reject,
+        "reject": reject_all,
+    }[action]
+    if sender or slot:
+        base_policy = policy
+        
+        def policy(inv, slot_empty):
+            if sender and inv['sender'] != sender:
+                return None
+            if slot and inv['slot'] != slot:
+                return None
+            return base_policy(inv, slot_empty)
+    
+    invitations = [
+        inv for inv in _pending(manager.invitations_for(capsule_id)) if inv['sender'] in locked_senders
+    ]
+    ledger = manager.load_ledger(capsule_id)
+    registry = manager.load_starter_registry()
+    
+    result = process_inbox(capsule, ledger, invitations, policy, registry, manager.get_capsule)
+    
+    if result.changed:
+        manager.put_capsule(capsule)
+        for sender_capsule in result.senders.values():
+            manager.put_capsule(sender_capsule)
+        manager.save_ledger(capsule_id, ledger)
+        manager.save_starter_registry(registry)
+        manager.remove_invitations(
+            [inv['id'] for inv in result.accepted + result.rejected]
+        )
+    
+    print(f"\n📥 INBOX for {capsule_id}:")
+    print(f"  Accepted: {len(result.accepted)}")
+    print(f"  Rejected: {len(result.rejected)} ({len(result.burned)} starters burned)")
+    for inv, reason in result.skipped:
+        print(f"  Skipped {inv['id'][:8]}... ({inv['slot']}): {reason}")
+    print(f"  Still pending: {len(result.remaining)}")
+    return True
 
 
 def show_invitations(capsule_id: str, manager: CapsuleManager) -> None:
     """Show pending invitations for capsule."""
-    invitations = manager.load_invitations()
-    my_invitations = [inv for inv in invitations if inv['recipient'] == capsule_id]
+    my_invitations = _pending(manager.invitations_for(capsule_id))
     
     if not my_invitations:
         print(f"\n📭 No pending invitations for {capsule_id}")
@@ -374,10 +876,375 @@ def show_invitations(capsule_id: str, manager: CapsuleManager) -> None:
         print(f"   From: {inv['sender']}")
         print(f"   Starter: {inv['slot']}")
         print(f"   Sent: {inv['timestamp']}")
+        if inv.get('expires_ns') is not None:
+            print(f"   Expires: {_local_time(inv['expires_ns'])}")
         print(f"   Accept: cli.py accept {inv['id']}")
 
 
-def main():
+def show_views(capsule_id: str, manager: CapsuleManager) -> None:
+    """Show what the ledger projections know about a capsule."""
+    if not manager.load_capsule(capsule_id):
+        print(f"Error: Capsule '{capsule_id}' not found")
+        return
+    
+    projector = manager.load_projections()
+    pending = projector["pending_invitations"].pending_for(capsule_id)
+    counts = projector["starter_counts"].counts_for(capsule_id)
+    
+    print(f"\n🔭 VIEWS for {capsule_id}:")
+    print(f"  Pending invitations: {len(pending)}")
+    print(f"  Starters: {counts['generated']} generated, {counts['received']} received, "
+          f"{counts['burned']} burned")
+    print(f"  Accepted invitations sent: {projector['accepted_invitations'].count_for(capsule_id)}")
+
+
+def query_ledgers(args: argparse.Namespace, manager: CapsuleManager) -> None:
+    """Run a ledger query built from ``query`` command arguments."""
+    from datetime import datetime
+    from src.clock import datetime_to_ns
+    from src.core.query import Query
+    
+    capsule_ids = args.capsule or manager.store.ledger_ids()
+    query = Query(manager.load_ledger(capsule_id) for capsule_id in capsule_ids)
+    
+    equals = {}
+    for condition in args.where or ():
+        field, sep, value = condition.partition("=")
+        if not sep:
+            print(f"Error: Expected FIELD=VALUE, got {condition!r}")
+            return
+        try:
+            equals[field] = json.loads(value)
+        except ValueError:
+            equals[field] = value
+    if args.type:
+        equals["event_type"] = args.type
+    if equals:
+        query = query.where(**equals)
+    if args.tag:
+        query = query.tagged(*args.tag)
+    if args.since or args.until:
+        try:
+            since, until = (
+                datetime_to_ns(datetime.fromisoformat(value)) if value else None
+                for value in (args.since, args.until)
+            )
+        except ValueError as e:
+            print(f"Error: {e}")
+            return
+        query = query.between(since, until)
+    if args.order:
+        query = query.order_by(args.order, descending=args.desc)
+    if args.limit is not None:
+        query = query.limit(args.limit)
+    
+    try:
+        _print_query(query, args)
+    except TypeError:
+        # Ordering compares the field's values, which may mix types across entries
+        if not args.order:
+            raise
+        print(f"Error: Cannot order by '{args.order}': its values are not comparable")
+
+
+def _print_query(query: "Query", args: argparse.Namespace) -> None:
+    if args.explain:
+        print(query.explain())
+    elif args.count:
+        print(query.count())
+    elif args.count_by:
+        for value, count in sorted(query.count_by(args.count_by).items(), key=lambda kv: -kv[1]):
+            print(f"  {count:8}  {value}")
+    elif args.select:
+        for row in query.select(*args.select.split(",")):
+            print(json.dumps(row, ensure_ascii=False))
+    else:
+        for entry in query:
+            print(f"  {entry.capsule_id:15} #{entry.sequence_number:<5} "
+                  f"{entry.timestamp.isoformat(timespec='seconds')}  {entry.event.event_type:22} "
+                  f"{','.join(entry.tags)}")
+
+
+def run_batch_op(op: Dict[str, Any], manager: CapsuleManager, refs: Dict[str, str]) -> bool:
+    """Execute one batch operation; see ``run_batch``."""
+    kind = op.get("op")
+    if kind == "create":
+        return create_capsule(op["type"], op["id"], manager)
+    
+    if kind == "load":
+        if not manager.load_capsule(op["id"]):
+            print(f"Error: Capsule '{op['id']}' not found")
+            return False
+        manager.set_current_capsule(op["id"])
+        return True
+    
+    capsule_id = op.get("capsule") or op.get("sender") or manager.get_current_capsule_id()
+    if not capsule_id:
+        print("Error: No capsule given and no current capsule")
+        return False
+    
+    if kind == "invite":
+        invitation_id = send_invitation(capsule_id, op["recipient"], op["slot"], manager)
+        if invitation_id and op.get("ref"):
+            refs[op["ref"]] = invitation_id
+        return invitation_id is not None
+    
+    if kind == "accept":
+        invitation_id = op.get("invitation_id") or refs.get(op.get("ref", ""))
+        if not invitation_id and op.get("from"):
+            invitation_id = next((
+                inv['id'] for inv in manager.invitations_for(capsule_id)
+                if inv['sender'] == op["from"] and inv['slot'] == op.get("slot", inv['slot'])
+            ), None)
+        if not invitation_id:
+            print("Error: No matching invitation")
+            return False
+        return accept_invitation(capsule_id, invitation_id, manager)
+    
+    if kind == "inbox":
+        return process_inbox_command(capsule_id, op.get("action", "accept"), manager,
+                                     op.get("from"), op.get("slot"))
+    
+    print(f"Error: Unknown operation {kind!r}")
+    return False
+
+
+def run_batch(source: str, manager: CapsuleManager, checkpoint: int = 0, verbose: bool = False) -> int:
+    """
+    Run operations from a JSON-lines file (``-`` for stdin) in one process.
+    
+    One object per line, e.g.::
+    
+        {"op": "create", "type": "genesis", "id": "alice"}
+        {"op": "invite", "sender": "alice", "recipient": "bob", "slot": "⚡ Juice", "ref": "j"}
+        {"op": "accept", "capsule": "bob", "ref": "j"}
+        {"op": "accept", "capsule": "bob", "from": "alice", "slot": "🌱 Seed"}
+        {"op": "inbox", "capsule": "bob", "action": "accept"}
+    
+    Saves are held in memory and written once at the end, or every
+    ``checkpoint`` operations. Returns the number of failed operations.
+    Flushes rewrite whole files from memory, so the data directory is held
+    exclusively until the end: other commands wait for the batch.
+    """
+    from src.daemon import is_running
+    from src.storage.files import exclusive_layout
+    
+    if is_running(manager.data_dir):
+        print("Error: Stop the daemon first (cli.py daemon stop)")
+        return 1
+    
+    # The open store holds the directory shared
+    manager.close()
+    manager.store = None
+    with exclusive_layout(manager.data_dir):
+        return _run_batch(source, manager, checkpoint, verbose)
+
+
+def _run_batch(source: str, manager: CapsuleManager, checkpoint: int, verbose: bool) -> int:
+    import io
+    from contextlib import redirect_stdout
+    
+    manager.enable_cache(write_back=True)
+    refs: Dict[str, str] = {}
+    done = failed = 0
+    stream = sys.stdin if source == "-" else open(source, 'r', encoding='utf-8')
+    try:
+        for line_no, line in enumerate(stream, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            out = io.StringIO()
+            with redirect_stdout(out):
+                try:
+                    op = json.loads(line)
+                    if not isinstance(op, dict):
+                        raise TypeError("expected a JSON object")
+                    ok = run_batch_op(op, manager, refs)
+                except (ValueError, KeyError, TypeError) as e:
+                    print(f"Error: Bad operation: {e}")
+                    ok = False
+            if ok:
+                done += 1
+                if verbose:
+                    print(out.getvalue(), end="")
+            else:
+                failed += 1
+                print(f"  line {line_no}: {out.getvalue().strip()}")
+            if checkpoint and (done + failed) % checkpoint == 0:
+                manager.flush()
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+    
+    manager.flush()
+    print(f"\n📦 BATCH: {done} succeeded, {failed} failed")
+    return failed
+
+
+def audit_starters(manager: CapsuleManager) -> None:
+    """Report starters held by more than one capsule slot."""
+    from src.core.registry import audit_capsules
+    
+    conflicts = audit_capsules(manager.store.iter_capsules())
+    audit_invitations(manager)
+    
+    if not conflicts:
+        print("\n✅ No starter conflicts found")
+        return
+    
+    print(f"\n⚠️  STARTER CONFLICTS: {len(conflicts)}")
+    print("-" * 50)
+    for starter_id, holders in conflicts.items():
+        print(f"\n  Starter {starter_id[:12]}...")
+        for holder_id, slot_name in holders:
+            print(f"    {holder_id:20} {slot_name}")
+
+
+def audit_invitations(manager: CapsuleManager) -> None:
+    """Report pending invitations the store and the ledgers disagree on."""
+    in_ledgers = manager.load_projections()["pending_invitations"].ids()
+    in_store = {inv['id'] for inv in manager.load_invitations()}
+    
+    for label, ids in (("missing from the store", in_ledgers - in_store),
+                       ("not recorded in any ledger", in_store - in_ledgers)):
+        if ids:
+            print(f"\n⚠️  PENDING INVITATIONS {label.upper()}: {len(ids)}")
+            for invitation_id in sorted(ids):
+                print(f"    {invitation_id}")
+    if in_ledgers == in_store:
+        print("\n✅ Pending invitations match the ledgers")
+
+
+def migrate_storage(target_backend: str, manager: CapsuleManager) -> None:
+    """Copy capsules, ledgers and invitations into another storage backend."""
+    from src.daemon import is_running
+    
+    if is_running(manager.data_dir):
+        print("Error: Stop the daemon first (cli.py daemon stop)")
+        return
+    
+    source_backend = manager.store.backend
+    if source_backend == target_backend:
+        print(f"Error: Data is already stored in {target_backend}")
+        return
+    
+    from src.storage import migrate
+    from src.storage.files import exclusive_layout
+    
+    # No other process may write while the data is copied
+    manager.close()
+    manager.store = None
+    with exclusive_layout(manager.data_dir):
+        source = open_store(manager.data_dir, source_backend)
+        target = open_store(manager.data_dir, target_backend)
+        counts = migrate(source, target)
+        target.close()
+        source.close()
+        
+        # The database takes precedence when present, so set it aside
+        if source_backend == "sqlite":
+            db = source.path
+            db.rename(db.with_name(db.name + ".migrated"))
+    
+    print(f"\n✓ Migrated {source_backend} -> {target_backend}:")
+    for kind, count in counts.items():
+        print(f"  {kind:12} {count}")
+
+
+def change_layout(target: Optional[str], manager: CapsuleManager) -> None:
+    """Show the data directory layout, or move capsule files into ``target``."""
+    from src.storage.layout import detect_layout, migrate_layout
+    
+    current = detect_layout(manager.data_dir)
+    if target is None or target == current.name:
+        print(f"Layout: {current.name}")
+        return
+    
+    from src.daemon import is_running
+    
+    if is_running(manager.data_dir):
+        print("Error: Stop the daemon first (cli.py daemon stop)")
+        return
+    if manager.store.backend != "json":
+        print(f"Error: Layouts apply to the json backend, data is stored in {manager.store.backend}")
+        return
+    
+    # The open store resolves paths through the old layout (and holds it)
+    manager.close()
+    moved = migrate_layout(manager.data_dir, target)
+    manager.store = None  # reopened through the new layout on next use
+    
+    print(f"✓ Layout {current.name} -> {target}: moved {moved} files")
+
+
+def sync_replica(capsule_id: str, replica_dir: str, manager: CapsuleManager) -> bool:
+    """
+    Reconcile a capsule's ledger with its replica in another data directory.
+    
+    Only the entries one side lacks are copied (see ``src/core/replication.py``).
+    If both sides appended since they last agreed, the histories are merged:
+    the entries from the fork on are ordered by time and numbered anew.
+    """
+    from contextlib import ExitStack
+    from src.core.replication import LoopbackTransport, ReplicaPeer, ReplicationError, reconcile
+    from src.daemon import is_running
+    
+    replica = CapsuleManager(Path(replica_dir).expanduser())
+    if replica.data_dir.resolve() == manager.data_dir.resolve():
+        print("Error: The replica must be another data directory")
+        return False
+    # A daemon would keep serving the ledgers (and projections) it had loaded
+    if is_running(manager.data_dir):
+        print("Error: Stop the daemon first (cli.py daemon stop)")
+        return False
+    if is_running(replica.data_dir):
+        print("Error: Stop the replica's daemon first")
+        return False
+    for side in (manager, replica):
+        if not side.load_capsule(capsule_id):
+            print(f"Error: Capsule '{capsule_id}' not found in {side.data_dir}")
+            return False
+    
+    # Both directories are locked in one order, whichever side started the sync
+    sides = sorted((manager, replica), key=lambda side: str(side.data_dir.resolve()))
+    with ExitStack() as stack:
+        for side in sides:
+            stack.enter_context(side.lock(capsule_id))
+        ledger = manager.load_ledger(capsule_id)
+        replica_ledger = replica.load_ledger(capsule_id)
+        lengths = len(ledger.entries), len(replica_ledger.entries)
+        transport = LoopbackTransport(ReplicaPeer(replica_ledger))
+        try:
+            result, error = reconcile(ledger, transport), None
+        except ReplicationError as e:
+            result, error = None, e
+        if result is not None and result.merged_from is not None:
+            manager.replace_ledger(capsule_id, ledger)
+            replica.replace_ledger(capsule_id, replica_ledger)
+        else:
+            # Batches copied before an error are kept: they extend both ledgers
+            if len(ledger.entries) != lengths[0]:
+                manager.save_ledger(capsule_id, ledger)
+            if len(replica_ledger.entries) != lengths[1]:
+                replica.save_ledger(capsule_id, replica_ledger)
+    if result is not None and result.merged_from is not None:
+        # Re-sequenced entries would be skipped by the checkpointed positions
+        for side in (manager, replica):
+            side.reset_projections()
+    replica.close()
+    
+    if error is not None:
+        print(f"Error: {error}")
+        return False
+    traffic = transport.bytes_sent + transport.bytes_received
+    print(f"✓ Synced {capsule_id}: pulled {result.pulled}, pushed {result.pushed} entries "
+          f"({result.round_trips} round trips, {traffic} bytes)")
+    if result.merged_from is not None:
+        print(f"  Both had diverged: merged their histories from entry #{result.merged_from} on")
+    return True
+
+
+def build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(
         description="Hivra CapsuleNet V1 - Genesis sends, Proto receives",
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -400,12 +1267,43 @@ Examples:
   %(prog)s load bob
   %(prog)s invitations
   %(prog)s accept <invitation-id>
+  %(prog)s inbox accept            # accept everything that fits
+  %(prog)s inbox reject --sender alice
+  
+  # Drop invitations nobody answered in time (also done before each invitation command)
+  %(prog)s expire
   
   # Show current capsule status
   %(prog)s status
+  
+  # Counts kept up to date from the ledgers
+  %(prog)s views bob
+  
+  # Query ledgers (add --explain to see which index is used)
+  %(prog)s query --type invitation --where sender_id=alice --order timestamp_ns --desc --limit 5
+  
+  # Find starters held by more than one capsule, invitations the ledgers disagree on
+  %(prog)s audit
+  
+  # Move the data directory to SQLite (used automatically afterwards)
+  %(prog)s migrate sqlite
+  
+  # Copy only the ledger entries another replica of alice lacks, both ways
+  %(prog)s sync alice /mnt/laptop/.capsulenet
+  
+  # Run many operations in one process, writing each file once
+  %(prog)s batch ops.jsonl
+  
+  # Keep everything in memory in a background node; commands are forwarded to it
+  %(prog)s daemon start &
+  %(prog)s daemon stop
         """
     )
     
+    parser.add_argument("--backend", choices=sorted(BACKENDS),
+                        help="Storage backend (default: sqlite if capsulenet.db exists, else json)")
+    parser.add_argument("--no-daemon", action="store_true",
+                        help="Run in this process even if a daemon is running")
     subparsers = parser.add_subparsers(dest="command", help="Command")
     
     # Create
@@ -433,59 +1331,245 @@ Examples:
     accept_p = subparsers.add_parser("accept", help="Accept invitation")
     accept_p.add_argument("invitation_id", help="Invitation ID")
     
+    # Inbox
+    inbox_p = subparsers.add_parser("inbox", help="Accept/reject pending invitations in bulk")
+    inbox_p.add_argument("action", choices=["accept", "reject", "accept-or-reject"])
+    inbox_p.add_argument("--sender", help="Only invitations from this capsule")
+    inbox_p.add_argument("--slot", help='Only invitations for this slot, e.g., "⚡ Juice"')
+    
     # Invitations
     invitations_p = subparsers.add_parser("invitations", help="Show invitations")
     invitations_p.add_argument("id", nargs="?", help="Capsule ID (optional)")
     
-    args = parser.parse_args()
+    # Expire
+    subparsers.add_parser("expire", help="Sweep invitations past their deadline")
+    
+    # Views
+    views_p = subparsers.add_parser("views", help="Show ledger projections for a capsule")
+    views_p.add_argument("id", nargs="?", help="Capsule ID (optional)")
+    
+    # Query
+    query_p = subparsers.add_parser("query", help="Filter, order and count ledger entries")
+    query_p.add_argument("--capsule", action="append", help="Only this capsule's ledger (repeatable)")
+    query_p.add_argument("--type", help="Event type")
+    query_p.add_argument("--where", action="append", metavar="FIELD=VALUE",
+                         help="Field equals value, e.g. sender_id=alice (repeatable)")
+    query_p.add_argument("--tag", action="append", help="Carrying any of these tags (repeatable)")
+    query_p.add_argument("--since", help="From this UTC time (ISO format)")
+    query_p.add_argument("--until", help="Before this UTC time (ISO format)")
+    query_p.add_argument("--order", metavar="FIELD", help="Order by field, e.g. timestamp_ns")
+    query_p.add_argument("--desc", action="store_true", help="Descending order")
+    query_p.add_argument("--limit", type=int, help="At most this many entries")
+    query_p.add_argument("--select", metavar="FIELDS", help="Print these comma-separated fields as JSON")
+    query_p.add_argument("--count", action="store_true", help="Print the number of matches")
+    query_p.add_argument("--count-by", metavar="FIELD", help="Count matches per value of a field")
+    query_p.add_argument("--explain", action="store_true", help="Show the query plan instead")
+    
+    # Audit
+    subparsers.add_parser("audit", help="Find starters held by more than one capsule")
+    
+    # Migrate
+    migrate_p = subparsers.add_parser("migrate", help="Move data to another storage backend")
+    migrate_p.add_argument("target", choices=sorted(BACKENDS))
+    
+    # Layout
+    layout_p = subparsers.add_parser("layout", help="Show or change the data directory layout")
+    layout_p.add_argument("target", nargs="?", choices=LAYOUTS,
+                          help="Move capsule and ledger files into this layout")
+    
+    # Sync
+    sync_p = subparsers.add_parser("sync", help="Reconcile a capsule's ledger with another replica")
+    sync_p.add_argument("id", help="Capsule ID")
+    sync_p.add_argument("replica", help="Data directory holding the other replica")
+    
+    # Batch
+    batch_p = subparsers.add_parser("batch", help="Run many operations from a JSON-lines file")
+    batch_p.add_argument("file", help='Operations file, or "-" for stdin')
+    batch_p.add_argument("--checkpoint", type=int, default=0, metavar="N",
+                         help="Write to disk every N operations (default: only at the end)")
+    batch_p.add_argument("--verbose", action="store_true", help="Print output of every operation")
+    
+    # Daemon
+    daemon_p = subparsers.add_parser("daemon", help="Run or stop the node daemon")
+    daemon_p.add_argument("action", choices=["start", "stop", "status"])
+    
+    return parser
+
+
+def run_command(args: argparse.Namespace, manager: CapsuleManager) -> None:
+    """Execute one parsed subcommand against ``manager``."""
+    if args.command == "create":
+        create_capsule(args.type, args.id, manager)
+    
+    elif args.command == "load":
+        load_capsule(args.id, manager)
+    
+    elif args.command == "status":
+        capsule_id = args.id or manager.get_current_capsule_id()
+        if not capsule_id:
+            print("Error: No capsule specified and no current capsule")
+            print("  Use: cli.py load <id>  or  cli.py status <id>")
+            return
+        show_status(capsule_id, manager)
+    
+    elif args.command == "list":
+        list_capsules(manager)
+    
+    elif args.command == "invite":
+        sender_id = manager.get_current_capsule_id()
+        if not sender_id:
+            print("Error: No current capsule")
+            print("  Use: cli.py load <sender-id>  first")
+            return
+        send_invitation(sender_id, args.recipient, args.slot, manager)
+    
+    elif args.command == "accept":
+        capsule_id = manager.get_current_capsule_id()
+        if not capsule_id:
+            print("Error: No current capsule")
+            print("  Use: cli.py load <your-id>  first")
+            return
+        accept_invitation(capsule_id, args.invitation_id, manager)
+    
+    elif args.command == "inbox":
+        capsule_id = manager.get_current_capsule_id()
+        if not capsule_id:
+            print("Error: No current capsule")
+            print("  Use: cli.py load <your-id>  first")
+            return
+        process_inbox_command(capsule_id, args.action, manager, args.sender, args.slot)
+    
+    elif args.command == "invitations":
+        capsule_id = args.id or manager.get_current_capsule_id()
+        if not capsule_id:
+            print("Error: No capsule specified")
+            print("  Use: cli.py invitations <id>  or  cli.py load <id> first")
+            return
+        show_invitations(capsule_id, manager)
+    
+    elif args.command == "expire":
+        expire_command(manager)
+    
+    elif args.command == "views":
+        capsule_id = args.id or manager.get_current_capsule_id()
+        if not capsule_id:
+            print("Error: No capsule specified")
+            print("  Use: cli.py views <id>  or  cli.py load <id> first")
+            return
+        show_views(capsule_id, manager)
+    
+    elif args.command == "query":
+        query_ledgers(args, manager)
+    
+    elif args.command == "audit":
+        audit_starters(manager)
+    
+    elif args.command == "migrate":
+        migrate_storage(args.target, manager)
+    
+    elif args.command == "layout":
+        change_layout(args.target, manager)
+    
+    elif args.command == "sync":
+        sync_replica(args.id, args.replica, manager)
+
+
+# Commands always run in the calling process, never in the daemon
+LOCAL_COMMANDS = ("daemon", "migrate", "layout", "batch", "sync")
+
+
+def serve_daemon(manager: CapsuleManager) -> None:
+    """Serve CLI commands over the data directory's socket until stopped."""
+    import io
+    import traceback
+    from contextlib import redirect_stderr, redirect_stdout
+    from src.daemon import NodeDaemon
+    
+    parser = build_parser()
+    manager.enable_cache()
+    
+    def execute(argv: List[str]):
+        out = io.StringIO()
+        with redirect_stdout(out), redirect_stderr(out):
+            try:
+                args = parser.parse_args(argv)
+            except SystemExit as e:
+                return out.getvalue(), e.code or 0
+            if args.command is None or args.command in LOCAL_COMMANDS:
+                print(f"Error: '{args.command}' is not available through the daemon")
+                return out.getvalue(), 1
+            if args.backend and args.backend != manager.store.backend:
+                print(f"Error: The daemon serves the {manager.store.backend} backend, not {args.backend}")
+                print("  Use --no-daemon, or stop the daemon first")
+                return out.getvalue(), 1
+            try:
+                run_command(args, manager)
+                exit_code = 0
+            except Exception as e:
+                print(f"\n❌ Error: {e}")
+                traceback.print_exc()
+                manager.invalidate_cache()
+                exit_code = 1
+            manager.flush()
+        return out.getvalue(), exit_code
+    
+    server = NodeDaemon(manager.data_dir, execute)
+    print(f"🛰️  Node daemon listening on {server.path}")
+    server.serve()
+
+
+def daemon_command(action: str, manager: CapsuleManager) -> None:
+    from src import daemon
+    
+    if action == "start":
+        serve_daemon(manager)
+    elif action == "stop":
+        if daemon.stop(manager.data_dir):
+            print("✓ Daemon stopped")
+        else:
+            print("No daemon running")
+    elif daemon.is_running(manager.data_dir):
+        print(f"Daemon running on {daemon.socket_path(manager.data_dir)}")
+    else:
+        print("No daemon running")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = build_parser()
+    argv = sys.argv[1:] if argv is None else argv
+    args = parser.parse_args(argv)
     
     if not args.command:
         parser.print_help()
         return
     
-    manager = CapsuleManager()
+    manager = CapsuleManager(backend=args.backend)
     
-    try:
-        if args.command == "create":
-            create_capsule(args.type, args.id, manager)
+    if args.command not in LOCAL_COMMANDS and not args.no_daemon:
+        from src.daemon import DaemonError, forward
         
-        elif args.command == "load":
-            load_capsule(args.id, manager)
-        
-        elif args.command == "status":
-            capsule_id = args.id or manager.get_current_capsule_id()
-            if not capsule_id:
-                print("Error: No capsule specified and no current capsule")
-                print("  Use: cli.py load <id>  or  cli.py status <id>")
-                return
-            show_status(capsule_id, manager)
-        
-        elif args.command == "list":
-            list_capsules(manager)
-        
-        elif args.command == "invite":
-            sender_id = manager.get_current_capsule_id()
-            if not sender_id:
-                print("Error: No current capsule")
-                print("  Use: cli.py load <sender-id>  first")
-                return
-            send_invitation(sender_id, args.recipient, args.slot, manager)
-        
-        elif args.command == "accept":
-            capsule_id = manager.get_current_capsule_id()
-            if not capsule_id:
-                print("Error: No current capsule")
-                print("  Use: cli.py load <your-id>  first")
-                return
-            accept_invitation(capsule_id, args.invitation_id, manager)
-        
-        elif args.command == "invitations":
-            capsule_id = args.id or manager.get_current_capsule_id()
-            if not capsule_id:
-                print("Error: No capsule specified")
-                print("  Use: cli.py invitations <id>  or  cli.py load <id> first")
-                return
-            show_invitations(capsule_id, manager)
+        try:
+            response = forward(manager.data_dir, argv)
+        except DaemonError as e:
+            # The command may have run in the daemon: running it here too could repeat it
+            print(f"Error: {e}")
+            print("  Check the result before retrying (cli.py daemon status)")
+            sys.exit(1)
+        if response is not None:
+            output, exit_code = response
+            print(output, end="")
+            if exit_code:
+                sys.exit(exit_code)
+            return
+    
+    try:
+        if args.command == "daemon":
+            daemon_command(args.action, manager)
+        elif args.command == "batch":
+            if run_batch(args.file, manager, args.checkpoint, args.verbose):
+                sys.exit(1)
+        else:
+            run_command(args, manager)
     
     except KeyboardInterrupt:
         print("\n⏹️  Cancelled")
@@ -494,6 +1578,8 @@ Examples:
         import traceback
         traceback.print_exc()
         sys.exit(1)
+    finally:
+        manager.close()
 
 
 if __name__ == "__main__":
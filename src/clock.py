@@ -0,0 +1,121 @@
+"""
+Clock abstraction - integer nanosecond timestamps.
+
+Events and ledger entries keep their timestamps as integer nanoseconds since
+the Unix epoch and only build a ``datetime`` when one is asked for. The clock
+used to stamp new objects is injectable so replays and benchmarks can run
+against a deterministic ``FakeClock``.
+"""
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+class Clock:
+    """Wall clock returning integer nanoseconds since the epoch."""
+
+    def now_ns(self) -> int:
+        return time.time_ns()
+
+    def now(self) -> datetime:
+        return ns_to_datetime(self.now_ns())
+
+
+class CoarseClock(Clock):
+    """
+    Cached clock for high-rate paths.
+
+    The system clock is read once every ``refresh_every`` calls; the calls in
+    between return the cached reading. Timestamps lose precision but stay
+    monotone, and bulk appends stop paying for a syscall per event.
+    """
+
+    def __init__(self, refresh_every: int = 64):
+        if refresh_every < 1:
+            raise ValueError("refresh_every must be >= 1")
+        self.refresh_every = refresh_every
+        self._calls = 0
+        self._cached_ns = time.time_ns()
+
+    def now_ns(self) -> int:
+        self._calls += 1
+        if self._calls >= self.refresh_every:
+            self.refresh()
+        return self._cached_ns
+
+    def refresh(self) -> None:
+        """Force a fresh reading of the system clock."""
+        self._calls = 0
+        self._cached_ns = max(self._cached_ns, time.time_ns())
+
+
+class FakeClock(Clock):
+    """Deterministic clock for tests, replay and benchmarks."""
+
+    def __init__(self, start_ns: int = 0, step_ns: int = 0):
+        self._now_ns = start_ns
+        self.step_ns = step_ns
+
+    def now_ns(self) -> int:
+        current = self._now_ns
+        self._now_ns += self.step_ns
+        return current
+
+    def advance(self, delta_ns: int) -> None:
+        self._now_ns += delta_ns
+
+    def set(self, now_ns: int) -> None:
+        self._now_ns = now_ns
+
+
+_default_clock: Clock = Clock()
+
+
+def get_clock() -> Clock:
+    """Return the process-wide default clock."""
+    return _default_clock
+
+
+def set_clock(clock: Optional[Clock]) -> Clock:
+    """Install ``clock`` as the default (``None`` restores the wall clock). Returns the previous one."""
+    global _default_clock
+    previous = _default_clock
+    _default_clock = clock if clock is not None else Clock()
+    return previous
+
+
+def now_ns() -> int:
+    """Current time from the default clock."""
+    return _default_clock.now_ns()
+
+
+def ns_to_datetime(value_ns: int) -> datetime:
+    """Render nanoseconds as a naive UTC datetime (microsecond precision)."""
+    return _EPOCH + timedelta(microseconds=value_ns // 1000)
+
+
+def datetime_to_ns(value: datetime) -> int:
+    """Convert a datetime to nanoseconds. Naive values are taken as UTC."""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    delta = value - _EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1_000_000_000 + delta.microseconds * 1000
+
+
+def parse_timestamp(data: dict, key: str = "timestamp") -> Optional[int]:
+    """
+    Read a serialized timestamp as nanoseconds.
+
+    Prefers the integer ``<key>_ns`` field and falls back to the ISO string
+    written by older versions.
+    """
+    value_ns = data.get(f"{key}_ns")
+    if value_ns is not None:
+        return int(value_ns)
+    value = data.get(key)
+    if value:
+        return datetime_to_ns(datetime.fromisoformat(value))
+    return None
@@ -1,7 +1,7 @@
 """
 Event Bus - simple version.
 """
-from typing import Dict, List, Callable, Any, Optional
+from typing import Dict, List, Callable, Any, Optional, Type, Union
 from dataclasses import dataclass
 
 from src.events import Event
@@ -16,27 +16,42 @@ class EventHandler:
 
 
 class EventBus:
+    """
+    Routes events to handlers.
+    
+    Handlers subscribe either to an ``event_type`` string or to an event class;
+    class subscriptions also receive events of their subclasses.
+    """
+    
     def __init__(self):
-        self._handlers: Dict[str, List[EventHandler]] = {}
+        self._handlers: Dict[Union[str, Type[Event]], List[EventHandler]] = {}
     
-    def subscribe(self, event_type: str, handler: Callable, priority: int = 0) -> None:
+    def subscribe(self, event_type: Union[str, Type[Event]], handler: Callable, priority: int = 0) -> None:
         if event_type not in self._handlers:
             self._handlers[event_type] = []
         self._handlers[event_type].append(EventHandler(handler, priority))
         self._handlers[event_type].sort(key=lambda h: h.priority, reverse=True)
     
-    def unsubscribe(self, event_type: str, handler: Callable) -> None:
+    def unsubscribe(self, event_type: Union[str, Type[Event]], handler: Callable) -> None:
         if event_type in self._handlers:
             self._handlers[event_type] = [
                 h for h in self._handlers[event_type] if h.handler != handler
             ]
     
+    def _handlers_for(self, event: Event) -> List[EventHandler]:
+        handlers = list(self._handlers.get(event.event_type, ()))
+        for cls in type(event).__mro__:
+            if cls in self._handlers:
+                handlers.extend(self._handlers[cls])
+        handlers.sort(key=lambda h: h.priority, reverse=True)
+        return handlers
+    
     def publish(self, event: Event, ledger: Ledger, state: State) -> List[Event]:
         event_type = event.event_type
         generated_events: List[Event] = []
         
-        if event_type in self._handlers:
-            for handler_info in self._handlers[event_type]:
+        if self._handlers:
+            for handler_info in self._handlers_for(event):
                 try:
                     result = handler_info.handler(event, ledger, state)
                     if result:
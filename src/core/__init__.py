@@ -1,7 +1,7 @@
 """
 Core modules for Hivra CapsuleNet.
 """
-from src.core.capsule import Capsule, CapsuleType, Starter, Slot
+from src.core.capsule import Capsule, CapsuleType, Starter, StarterHistory, Slot
 from src.core.ledger import Ledger, LedgerEntry
 from src.core.state import State
 
@@ -9,6 +9,7 @@ __all__ = [
     'Capsule',
     'CapsuleType', 
     'Starter',
+    'StarterHistory',
     'Slot',
     'Ledger',
     'LedgerEntry',
@@ -1,10 +1,16 @@
 """
 Capsule, Starter, and Slot classes with binary starter nature.
 """
-from dataclasses import dataclass, field
+import os
+import sys
+from array import array
+from base64 import b64decode, b64encode
+from bisect import bisect_right
 from enum import Enum
-from typing import List, Dict, Optional, Set, Any
-from uuid import uuid4
+from typing import List, Dict, Iterable, Iterator, Optional, Sequence, Set, Tuple, Union, Any
+from uuid import UUID, uuid4
+
+from src.core.relationships import Relationship, RelationshipStore
 
 
 class CapsuleType(Enum):
@@ -20,35 +26,191 @@ class StarterStatus(Enum):
     ON = "on"
 
 
-@dataclass
+# Starter types with emojis: display name -> internal name
+SLOT_TYPES: Dict[str, str] = {
+    "⚡ Juice": "juice",
+    "💥 Spark": "spark",
+    "🌱 Seed": "seed",
+    "📡 Pulse": "pulse",
+    "🔥 Kick": "kick",
+}
+
+# Slot kinds are small integer indices; display names are presentation only
+SLOT_NAMES: Tuple[str, ...] = tuple(SLOT_TYPES)
+SLOT_COUNT = len(SLOT_NAMES)
+SLOT_INDEX: Dict[str, int] = {}
+for _index, (_display_name, _internal_name) in enumerate(SLOT_TYPES.items()):
+    SLOT_INDEX[_display_name] = _index
+    SLOT_INDEX[_internal_name] = _index
+ALL_SLOTS_MASK = (1 << SLOT_COUNT) - 1
+
+
+def slot_index(slot: Union[int, str]) -> Optional[int]:
+    """Index of a slot given by index, display name or internal name."""
+    if isinstance(slot, int):
+        return slot if 0 <= slot < SLOT_COUNT else None
+    return SLOT_INDEX.get(slot)
+
+
+def allocate_starter_ids(count: int) -> List[str]:
+    """Generate ``count`` random UUID4 starter IDs from a single entropy read."""
+    raw = os.urandom(16 * count)
+    return [str(UUID(bytes=raw[i:i + 16], version=4)) for i in range(0, len(raw), 16)]
+
+
 class Slot:
-    """Slot for holding a starter."""
-    slot_type: str
-    starter_id: Optional[str] = None
-    is_locked: bool = False
+    """Slot for holding a starter - a live view onto one capsule slot."""
+    __slots__ = ("_capsule", "index")
+    
+    def __init__(self, capsule: "Capsule", index: int):
+        self._capsule = capsule
+        self.index = index
+    
+    @property
+    def slot_type(self) -> str:
+        return SLOT_NAMES[self.index]
+    
+    @property
+    def starter_id(self) -> Optional[str]:
+        return self._capsule._starters[self.index]
+    
+    @starter_id.setter
+    def starter_id(self, starter_id: Optional[str]) -> None:
+        self._capsule.set_starter(self.index, starter_id)
+    
+    @property
+    def is_locked(self) -> bool:
+        return bool(self._capsule._locked >> self.index & 1)
+    
+    @is_locked.setter
+    def is_locked(self, locked: bool) -> None:
+        self._capsule.set_locked(self.index, locked)
+    
+    def __eq__(self, other: Any) -> bool:
+        if not isinstance(other, Slot):
+            return NotImplemented
+        return (self.slot_type, self.starter_id, self.is_locked) == (
+            other.slot_type, other.starter_id, other.is_locked
+        )
+    
+    __hash__ = None
+    
+    def __repr__(self) -> str:
+        return f"Slot(slot_type={self.slot_type!r}, starter_id={self.starter_id!r}, is_locked={self.is_locked!r})"
+
+
+class StarterHistory:
+    """
+    Compact toggle history of a starter.
+    
+    Holds the ledger sequence numbers of the starter's events in an integer
+    array. Older references can be folded into a checkpoint that keeps only
+    the number of dropped toggles and the status they left behind, so the
+    status is always ``checkpoint status XOR parity of remaining events``.
+    """
+    __slots__ = ("refs", "checkpoint_count", "checkpoint_on")
+    
+    def __init__(self, refs: Iterable[int] = (), checkpoint_count: int = 0,
+                 checkpoint_on: bool = False):
+        self.refs = array("q", refs)
+        self.checkpoint_count = checkpoint_count
+        self.checkpoint_on = checkpoint_on
+    
+    def __len__(self) -> int:
+        return len(self.refs)
+    
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.refs)
+    
+    @property
+    def toggle_count(self) -> int:
+        """Total toggles, including those folded into the checkpoint."""
+        return self.checkpoint_count + len(self.refs)
+    
+    @property
+    def is_on(self) -> bool:
+        return self.checkpoint_on ^ bool(len(self.refs) & 1)
+    
+    def append(self, ref: int) -> None:
+        self.refs.append(ref)
+    
+    def flip(self) -> None:
+        """Toggle without a ledger reference."""
+        self.checkpoint_on = not self.checkpoint_on
+    
+    def truncate(self, up_to: int) -> int:
+        """Fold references ``<= up_to`` into the checkpoint. Returns how many were dropped."""
+        keep = bisect_right(self.refs, up_to)
+        if keep:
+            self.checkpoint_count += keep
+            self.checkpoint_on ^= bool(keep & 1)
+            del self.refs[:keep]
+        return keep
+    
+    def to_dict(self) -> Dict[str, Any]:
+        refs = self.refs
+        if sys.byteorder != "little":
+            refs = array("q", refs)
+            refs.byteswap()
+        return {
+            "refs": b64encode(refs.tobytes()).decode("ascii"),
+            "checkpoint_count": self.checkpoint_count,
+            "checkpoint_on": self.checkpoint_on,
+        }
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "StarterHistory":
+        history = cls(
+            checkpoint_count=data.get("checkpoint_count", 0),
+            checkpoint_on=data.get("checkpoint_on", False),
+        )
+        history.refs.frombytes(b64decode(data.get("refs", "")))
+        if sys.byteorder != "little":
+            history.refs.byteswap()
+        return history
 
 
-@dataclass
 class Starter:
     """
     Binary starter - abstract switch controlled by events.
+    
+    Status is not stored: it follows from the parity of the toggle history.
     """
-    starter_id: str
-    capsule_id: str
-    slot_type: str
-    status: StarterStatus = StarterStatus.OFF
-    created_at: str = field(default_factory=lambda: str(uuid4()))
-    history: List[str] = field(default_factory=list)  # List of event IDs
-    traits: Dict[str, Any] = field(default_factory=dict)
-    current_connection_id: Optional[str] = None
+    __slots__ = ("starter_id", "capsule_id", "slot_type", "created_at", "history",
+                 "traits", "current_connection_id")
+    
+    def __init__(
+        self,
+        starter_id: str,
+        capsule_id: str,
+        slot_type: str,
+        status: StarterStatus = StarterStatus.OFF,
+        created_at: Optional[str] = None,
+        history: Optional[StarterHistory] = None,
+        traits: Optional[Dict[str, Any]] = None,
+        current_connection_id: Optional[str] = None,
+    ):
+        self.starter_id = starter_id
+        self.capsule_id = capsule_id
+        self.slot_type = slot_type
+        self.created_at = created_at if created_at is not None else str(uuid4())
+        self.history = history if history is not None else StarterHistory()
+        self.traits = traits if traits is not None else {}
+        self.current_connection_id = current_connection_id
+        if self.status != status:
+            self.history.flip()
+    
+    @property
+    def status(self) -> StarterStatus:
+        return StarterStatus.ON if self.history.is_on else StarterStatus.OFF
     
     def toggle(self) -> None:
         """Toggle status - only called by event mechanics."""
-        self.status = StarterStatus.ON if self.status == StarterStatus.OFF else StarterStatus.OFF
+        self.history.flip()
     
-    def add_event(self, event_id: str) -> None:
-        """Add event to history."""
-        self.history.append(event_id)
+    def add_event(self, sequence_number: int) -> None:
+        """Record a toggle event by its ledger sequence number."""
+        self.history.append(sequence_number)
     
     def to_dict(self) -> Dict[str, Any]:
         """Convert to serializable dict."""
@@ -58,7 +220,7 @@ class Starter:
             "slot_type": self.slot_type,
             "status": self.status.value,
             "created_at": self.created_at,
-            "history": self.history.copy(),
+            "history": self.history.to_dict(),
             "traits": self.traits.copy(),
             "current_connection_id": self.current_connection_id,
         }
@@ -66,67 +228,179 @@ class Starter:
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> "Starter":
         """Create from dict."""
+        history = data["history"]
+        if isinstance(history, list):
+            # Legacy list of event IDs: keep the count and the stored status
+            history = StarterHistory(checkpoint_count=len(history))
+        else:
+            history = StarterHistory.from_dict(history)
         starter = cls(
             starter_id=data["starter_id"],
             capsule_id=data["capsule_id"],
             slot_type=data["slot_type"],
             status=StarterStatus(data["status"]),
             created_at=data["created_at"],
-            history=data["history"].copy(),
+            history=history,
             traits=data["traits"].copy(),
             current_connection_id=data.get("current_connection_id"),
         )
         return starter
+    
+    def __eq__(self, other: Any) -> bool:
+        if not isinstance(other, Starter):
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+    
+    __hash__ = None
 
 
-@dataclass
 class Capsule:
-    """Capsule entity."""
-    capsule_id: str
-    capsule_type: CapsuleType
-    slots: Dict[str, Slot] = field(default_factory=dict)
-    connections: Set[str] = field(default_factory=set)  # Set of connection IDs
-    ledger_id: Optional[str] = None
-    
-    def __post_init__(self):
-        """Initialize capsule based on type."""
-        # Define starter types with emojis
-        slot_types = {
-            "⚡ Juice": "juice",
-            "💥 Spark": "spark", 
-            "🌱 Seed": "seed",
-            "📡 Pulse": "pulse",
-            "🔥 Kick": "kick"
-        }
+    """
+    Capsule entity.
+    
+    The five slots live in a fixed-size list of starter IDs indexed by slot
+    kind, with occupancy and lock flags packed into integer bitmasks.
+    ``slots`` exposes them keyed by display name for presentation.
+    """
+    __slots__ = ("capsule_id", "capsule_type", "connections", "ledger_id",
+                 "relationships", "_starters", "_occupied", "_locked")
+    
+    def __init__(
+        self,
+        capsule_id: str,
+        capsule_type: CapsuleType,
+        connections: Optional[Set[str]] = None,  # Set of connection IDs
+        ledger_id: Optional[str] = None,
+    ):
+        self._init(capsule_id, capsule_type, connections, ledger_id)
+        # If genesis, generate starters for all slots
+        if capsule_type == CapsuleType.GENESIS:
+            self._fill_slots(allocate_starter_ids(SLOT_COUNT))
+    
+    def _init(
+        self,
+        capsule_id: str,
+        capsule_type: CapsuleType,
+        connections: Optional[Set[str]],
+        ledger_id: Optional[str],
+    ) -> None:
+        self.capsule_id = capsule_id
+        self.capsule_type = capsule_type
+        self.connections = connections if connections is not None else set()
+        self.ledger_id = ledger_id
+        self.relationships = RelationshipStore()
+        self._starters: List[Optional[str]] = [None] * SLOT_COUNT
+        self._occupied = 0
+        self._locked = 0
+    
+    def _fill_slots(self, starter_ids: Sequence[str]) -> None:
+        self._starters[:] = starter_ids
+        self._occupied = ALL_SLOTS_MASK
+    
+    @classmethod
+    def _new(
+        cls,
+        capsule_id: str,
+        capsule_type: CapsuleType,
+        connections: Optional[Set[str]] = None,
+        ledger_id: Optional[str] = None,
+    ) -> "Capsule":
+        """Construct with empty slots regardless of type (no starter generation)."""
+        capsule = cls.__new__(cls)
+        capsule._init(capsule_id, capsule_type, connections, ledger_id)
+        return capsule
+    
+    @classmethod
+    def create_many(cls, capsule_ids: Iterable[str], capsule_type: CapsuleType) -> List["Capsule"]:
+        """
+        Create capsules in bulk.
         
-        # Initialize empty slots with display names
-        for display_name, internal_name in slot_types.items():
-            self.slots[display_name] = Slot(slot_type=display_name)
+        Starter IDs for genesis capsules are allocated for the whole batch at
+        once instead of one ``uuid4()`` call per slot.
+        """
+        capsule_ids = list(capsule_ids)
+        starter_ids = None
+        if capsule_type == CapsuleType.GENESIS:
+            starter_ids = allocate_starter_ids(SLOT_COUNT * len(capsule_ids))
         
-        # If genesis, generate starters for all slots
-        if self.capsule_type == CapsuleType.GENESIS:
-            for display_name in slot_types.keys():
-                starter = Starter(
-                    starter_id=str(uuid4()),
-                    capsule_id=self.capsule_id,
-                    slot_type=display_name,
-                    status=StarterStatus.OFF,
-                )
-                self.slots[display_name].starter_id = starter.starter_id
-    
-    def get_slot(self, slot_display_name: str) -> Optional[Slot]:
-        """Get slot by display name."""
-        return self.slots.get(slot_display_name)
-    
-    def is_slot_empty(self, slot_display_name: str) -> bool:
+        capsules = []
+        for i, capsule_id in enumerate(capsule_ids):
+            capsule = cls._new(capsule_id, capsule_type)
+            if starter_ids:
+                capsule._fill_slots(starter_ids[i * SLOT_COUNT:(i + 1) * SLOT_COUNT])
+            capsules.append(capsule)
+        return capsules
+    
+    @property
+    def slots(self) -> Dict[str, Slot]:
+        """Slots keyed by display name."""
+        return {name: Slot(self, index) for index, name in enumerate(SLOT_NAMES)}
+    
+    @property
+    def occupied_mask(self) -> int:
+        return self._occupied
+    
+    @property
+    def empty_mask(self) -> int:
+        return ~self._occupied & ALL_SLOTS_MASK
+    
+    def get_slot(self, slot_display_name: Union[int, str]) -> Optional[Slot]:
+        """Get slot by display name (or index / internal name)."""
+        index = slot_index(slot_display_name)
+        return Slot(self, index) if index is not None else None
+    
+    def is_slot_empty(self, slot_display_name: Union[int, str]) -> bool:
         """Check if slot is empty."""
-        slot = self.get_slot(slot_display_name)
-        return slot is None or slot.starter_id is None
+        index = slot_index(slot_display_name)
+        return index is None or not self._occupied >> index & 1
+    
+    def has_empty_slot(self) -> bool:
+        return self._occupied != ALL_SLOTS_MASK
+    
+    def find_empty_slot(self) -> Optional[int]:
+        """Index of the first empty slot, if any."""
+        empty = self.empty_mask
+        return (empty & -empty).bit_length() - 1 if empty else None
     
-    def get_starter_id(self, slot_display_name: str) -> Optional[str]:
+    def get_starter_id(self, slot_display_name: Union[int, str]) -> Optional[str]:
         """Get starter ID in slot, if any."""
-        slot = self.get_slot(slot_display_name)
-        return slot.starter_id if slot else None
+        index = slot_index(slot_display_name)
+        return self._starters[index] if index is not None else None
+    
+    def occupied_slots(self) -> List[Tuple[str, str]]:
+        """(display name, starter ID) for every occupied slot."""
+        return [
+            (SLOT_NAMES[index], starter_id)
+            for index, starter_id in enumerate(self._starters)
+            if starter_id is not None
+        ]
+    
+    def set_starter(self, slot: Union[int, str], starter_id: Optional[str]) -> None:
+        """Place a starter in a slot (``None`` empties it)."""
+        index = slot_index(slot)
+        if index is None:
+            raise KeyError(f"Unknown slot: {slot!r}")
+        self._starters[index] = starter_id
+        if starter_id is None:
+            self._occupied &= ~(1 << index)
+        else:
+            self._occupied |= 1 << index
+    
+    def occupy_slot(self, slot: Union[int, str], starter_id: str) -> None:
+        self.set_starter(slot, starter_id)
+    
+    def set_locked(self, slot: Union[int, str], locked: bool) -> None:
+        index = slot_index(slot)
+        if index is None:
+            raise KeyError(f"Unknown slot: {slot!r}")
+        if locked:
+            self._locked |= 1 << index
+        else:
+            self._locked &= ~(1 << index)
+    
+    def get_relationship(self, peer_capsule_id: str) -> Relationship:
+        """Relationship states with a peer capsule (spec §3)."""
+        return self.relationships.get(peer_capsule_id)
     
     def add_connection(self, connection_id: str) -> None:
         """Add connection to capsule."""
@@ -142,36 +416,58 @@ class Capsule:
             "capsule_id": self.capsule_id,
             "capsule_type": self.capsule_type.value,
             "slots": {
-                slot_type: {
-                    "slot_type": slot.slot_type,
-                    "starter_id": slot.starter_id,
-                    "is_locked": slot.is_locked,
+                name: {
+                    "slot_type": name,
+                    "starter_id": self._starters[index],
+                    "is_locked": bool(self._locked >> index & 1),
                 }
-                for slot_type, slot in self.slots.items()
+                for index, name in enumerate(SLOT_NAMES)
             },
             "connections": list(self.connections),
             "ledger_id": self.ledger_id,
+            "relationships": self.relationships.to_dict(),
         }
     
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> "Capsule":
-        """Create capsule from dict."""
-        capsule = cls(
+        """Create capsule from dict (skips starter generation)."""
+        capsule = cls._new(
             capsule_id=data["capsule_id"],
             capsule_type=CapsuleType(data["capsule_type"]),
+            connections=set(data["connections"]),
+            ledger_id=data.get("ledger_id"),
         )
         
         # Restore slots
         for slot_type, slot_data in data["slots"].items():
-            slot = Slot(
-                slot_type=slot_data["slot_type"],
-                starter_id=slot_data["starter_id"],
-                is_locked=slot_data["is_locked"],
-            )
-            capsule.slots[slot_type] = slot
+            index = slot_index(slot_type)
+            if index is None:
+                continue
+            if slot_data["starter_id"] is not None:
+                capsule.set_starter(index, slot_data["starter_id"])
+            if slot_data["is_locked"]:
+                capsule._locked |= 1 << index
         
-        # Restore connections
-        capsule.connections = set(data["connections"])
-        capsule.ledger_id = data.get("ledger_id")
+        if data.get("relationships"):
+            capsule.relationships = RelationshipStore.from_dict(data["relationships"])
         
         return capsule
+    
+    def __eq__(self, other: Any) -> bool:
+        if not isinstance(other, Capsule):
+            return NotImplemented
+        return (
+            self.capsule_id == other.capsule_id
+            and self.capsule_type == other.capsule_type
+            and self._starters == other._starters
+            and self._locked == other._locked
+            and self.connections == other.connections
+            and self.ledger_id == other.ledger_id
+            and self.relationships.to_dict() == other.relationships.to_dict()
+        )
+    
+    __hash__ = None
+    
+    def __repr__(self) -> str:
+        return (f"Capsule(capsule_id={self.capsule_id!r}, capsule_type={self.capsule_type!r}, "
+                f"starters={self._starters!r})")
@@ -0,0 +1,283 @@
+"""
+Columnar ledger view - array-backed columns for analytics scans.
+
+A ``LedgerColumns`` flattens one or many ledgers into parallel columns:
+sequence numbers, integer timestamps, dictionary-encoded event types and
+capsule IDs, tag bitmasks and dictionary-encoded metadata fields. Filters and
+group-bys run vectorized over NumPy arrays when NumPy is installed and fall
+back to plain ``array`` loops otherwise.
+"""
+from array import array
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from src.core.ledger import Ledger, LedgerEntry, TAGS
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+
+MISSING = -1
+_MAX_TAG_BITS = 64
+
+
+def _hashable(value: Any) -> Any:
+    """A hashable equivalent of ``value``: lists and dicts become tuples, sets frozensets."""
+    if isinstance(value, (list, tuple)):
+        return tuple(_hashable(item) for item in value)
+    if isinstance(value, dict):
+        return tuple(sorted(((key, _hashable(item)) for key, item in value.items()),
+                            key=lambda pair: str(pair[0])))
+    if isinstance(value, (set, frozenset)):
+        return frozenset(_hashable(item) for item in value)
+    return value
+
+
+class Dictionary:
+    """
+    Dictionary encoding: value <-> small integer code. Unhashable values
+    (lists, dicts from JSON metadata) are encoded, and decoded, as tuples.
+    """
+
+    def __init__(self):
+        self._codes: Dict[Any, int] = {}
+        self.values: List[Any] = []
+
+    def encode(self, value: Any) -> int:
+        if value is None:
+            return MISSING
+        try:
+            code = self._codes.get(value)
+        except TypeError:
+            value = _hashable(value)
+            code = self._codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self._codes[value] = code
+            self.values.append(value)
+        return code
+
+    def lookup(self, value: Any) -> Optional[int]:
+        """Code for ``value`` or ``None`` if it never occurs."""
+        try:
+            return self._codes.get(value)
+        except TypeError:
+            return self._codes.get(_hashable(value))
+
+    def decode(self, code: int) -> Any:
+        return None if code == MISSING else self.values[code]
+
+
+def _event_field(entry: LedgerEntry, name: str) -> Any:
+    event = entry.event
+    metadata = event._metadata
+    if metadata and name in metadata:
+        return metadata[name]
+    if name in event.FIELDS:
+        return event._field_value(name)
+    return None
+
+
+class LedgerColumns:
+    """Column store over ledger entries. Row order is insertion order."""
+
+    def __init__(self, fields: Iterable[str] = (), use_numpy: Optional[bool] = None):
+        self.fields: Tuple[str, ...] = tuple(fields)
+        self.use_numpy = (np is not None) if use_numpy is None else (use_numpy and np is not None)
+
+        self.sequence = array("q")
+        self.timestamp_ns = array("q")
+        self.event_type = array("q")
+        self.capsule_id = array("q")
+        self.tag_mask = array("Q")
+        self.field_codes: Dict[str, array] = {name: array("q") for name in self.fields}
+
+        self.event_types = Dictionary()
+        self.capsule_ids = Dictionary()
+        self.field_values: Dict[str, Dictionary] = {name: Dictionary() for name in self.fields}
+        self._np_cache: Dict[str, Any] = {}
+
+    @classmethod
+    def from_ledgers(cls, ledgers: Iterable[Ledger], fields: Iterable[str] = (),
+                     use_numpy: Optional[bool] = None) -> "LedgerColumns":
+        columns = cls(fields, use_numpy=use_numpy)
+        for ledger in ledgers:
+            columns.extend(ledger.entries)
+        return columns
+
+    @classmethod
+    def from_ledger(cls, ledger: Ledger, fields: Iterable[str] = (),
+                    use_numpy: Optional[bool] = None) -> "LedgerColumns":
+        return cls.from_ledgers([ledger], fields, use_numpy=use_numpy)
+
+    def __len__(self) -> int:
+        return len(self.sequence)
+
+    def append(self, entry: LedgerEntry) -> None:
+        if entry.tag_mask >> _MAX_TAG_BITS:
+            raise OverflowError(f"Columnar view supports at most {_MAX_TAG_BITS} distinct tags")
+        self.sequence.append(entry.sequence_number)
+        self.timestamp_ns.append(entry.timestamp_ns)
+        self.event_type.append(self.event_types.encode(entry.event.event_type))
+        self.capsule_id.append(self.capsule_ids.encode(entry.capsule_id))
+        self.tag_mask.append(entry.tag_mask)
+        for name in self.fields:
+            self.field_codes[name].append(self.field_values[name].encode(_event_field(entry, name)))
+        self._np_cache.clear()
+
+    def extend(self, entries: Iterable[LedgerEntry]) -> None:
+        for entry in entries:
+            self.append(entry)
+
+    # -- column access -------------------------------------------------
+
+    def _column(self, name: str) -> array:
+        if name in self.field_codes:
+            return self.field_codes[name]
+        return getattr(self, name)
+
+    def _dictionary(self, name: str) -> Dictionary:
+        if name == "event_type":
+            return self.event_types
+        if name == "capsule_id":
+            return self.capsule_ids
+        if name in self.field_values:
+            return self.field_values[name]
+        raise KeyError(f"Column '{name}' is not dictionary-encoded")
+
+    def _np(self, name: str):
+        column = self._np_cache.get(name)
+        if column is None:
+            # Copy so the source array is not locked against further appends
+            source = self._column(name)
+            column = np.frombuffer(source, dtype=source.typecode).copy()
+            self._np_cache[name] = column
+        return column
+
+    # -- filters -------------------------------------------------------
+
+    def select(
+        self,
+        event_type: Optional[str] = None,
+        tags: Optional[Iterable[str]] = None,
+        since_ns: Optional[int] = None,
+        until_ns: Optional[int] = None,
+        capsule_id: Optional[str] = None,
+        **field_equals: Any
+    ) -> Sequence[int]:
+        """
+        Row indices matching every given condition.
+
+        ``tags`` matches rows carrying any of the tags; ``since_ns`` is
+        inclusive and ``until_ns`` exclusive; keyword arguments compare
+        dictionary-encoded metadata fields for equality.
+        """
+        equals: List[Tuple[str, int]] = []
+        for name, value in (("event_type", event_type), ("capsule_id", capsule_id)):
+            if value is not None:
+                equals.append((name, self._dictionary(name).lookup(value)))
+        for name, value in field_equals.items():
+            equals.append((name, self._dictionary(name).lookup(value)))
+        if any(code is None for _, code in equals):
+            return []
+        tag_mask = TAGS.query_mask(tags) if tags is not None else None
+        if tag_mask == 0:
+            return []
+
+        if self.use_numpy:
+            return self._select_numpy(equals, tag_mask, since_ns, until_ns)
+        return self._select_python(equals, tag_mask, since_ns, until_ns)
+
+    def _select_numpy(self, equals, tag_mask, since_ns, until_ns):
+        keep = np.ones(len(self), dtype=bool)
+        for name, code in equals:
+            keep &= self._np(name) == code
+        if tag_mask is not None:
+            keep &= (self._np("tag_mask") & np.uint64(tag_mask)) != 0
+        if since_ns is not None:
+            keep &= self._np("timestamp_ns") >= since_ns
+        if until_ns is not None:
+            keep &= self._np("timestamp_ns") < until_ns
+        return np.flatnonzero(keep)
+
+    def _select_python(self, equals, tag_mask, since_ns, until_ns):
+        rows: Iterable[int] = range(len(self))
+        for name, code in equals:
+            column = self._column(name)
+            rows = [i for i in rows if column[i] == code]
+        if tag_mask is not None:
+            masks = self.tag_mask
+            rows = [i for i in rows if masks[i] & tag_mask]
+        if since_ns is not None or until_ns is not None:
+            times = self.timestamp_ns
+            low = since_ns if since_ns is not None else -(1 << 63)
+            high = until_ns if until_ns is not None else 1 << 63
+            rows = [i for i in rows if low <= times[i] < high]
+        return list(rows)
+
+    def count(self, **conditions: Any) -> int:
+        return len(self.select(**conditions))
+
+    # -- group-bys -----------------------------------------------------
+
+    def count_by(self, column: str, rows: Optional[Sequence[int]] = None) -> Dict[Any, int]:
+        """Row counts per decoded value of a dictionary-encoded column."""
+        dictionary = self._dictionary(column)
+        if self.use_numpy:
+            codes = self._np(column)
+            if rows is not None:
+                codes = codes[np.asarray(rows, dtype=np.intp)]
+            codes = codes[codes != MISSING]
+            counts = np.bincount(codes, minlength=len(dictionary.values))
+            return {dictionary.values[code]: int(n) for code, n in enumerate(counts) if n}
+
+        codes = self._column(column)
+        counts: Dict[int, int] = {}
+        for i in (range(len(self)) if rows is None else rows):
+            code = codes[i]
+            if code != MISSING:
+                counts[code] = counts.get(code, 0) + 1
+        return {dictionary.decode(code): n for code, n in counts.items()}
+
+    def tag_counts(self, rows: Optional[Sequence[int]] = None) -> Dict[str, int]:
+        """Row counts per tag (a row with several tags counts once for each)."""
+        names = TAGS.names((1 << _MAX_TAG_BITS) - 1)
+        if self.use_numpy:
+            masks = self._np("tag_mask")
+            if rows is not None:
+                masks = masks[np.asarray(rows, dtype=np.intp)]
+            result = {}
+            for bit, name in enumerate(names):
+                n = int(np.count_nonzero(masks & np.uint64(1 << bit)))
+                if n:
+                    result[name] = n
+            return result
+
+        counts = [0] * len(names)
+        masks = self.tag_mask
+        for i in (range(len(self)) if rows is None else rows):
+            mask = masks[i]
+            bit = 0
+            while mask:
+                if mask & 1:
+                    counts[bit] += 1
+                mask >>= 1
+                bit += 1
+        return {name: n for name, n in zip(names, counts) if n}
+
+    def rate(self, bucket_ns: int, rows: Optional[Sequence[int]] = None) -> Dict[int, int]:
+        """Row counts per time bucket, keyed by bucket start in nanoseconds."""
+        if self.use_numpy:
+            times = self._np("timestamp_ns")
+            if rows is not None:
+                times = times[np.asarray(rows, dtype=np.intp)]
+            buckets, counts = np.unique(times // bucket_ns, return_counts=True)
+            return {int(b) * bucket_ns: int(n) for b, n in zip(buckets, counts)}
+
+        times = self.timestamp_ns
+        counts: Dict[int, int] = {}
+        for i in (range(len(self)) if rows is None else rows):
+            start = times[i] // bucket_ns * bucket_ns
+            counts[start] = counts.get(start, 0) + 1
+        return dict(sorted(counts.items()))
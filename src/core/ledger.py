@@ -1,56 +1,174 @@
 """
 Ledger - append-only log of events.
+
+Entries are only ever appended, so a reader can hold a ``LedgerSnapshot``:
+the ledger's entry list plus the length it had when the snapshot was taken.
+Later appends land past that length and never show up in the snapshot,
+which therefore needs neither a copy nor a lock, even while another thread
+keeps appending.
 """
 import json
+import sys
 from datetime import datetime
-from typing import List, Any, Dict, Optional
+from itertools import islice
+from typing import List, Any, Callable, Dict, Iterable, Iterator, Optional, Sequence, Tuple, Union, overload
 
+from src.clock import Clock, get_clock, ns_to_datetime, datetime_to_ns, parse_timestamp
 from src.events import Event
 
 
+class TagTable:
+    """
+    Process-wide table mapping tag names to bit positions.
+
+    Entries keep their tags as an integer bitmask; the tuple of interned names
+    for each distinct mask is built once and shared.
+    """
+
+    def __init__(self):
+        self._bits: Dict[str, int] = {}
+        self._names: List[str] = []
+        self._tuples: Dict[int, Tuple[str, ...]] = {0: ()}
+
+    def bit(self, tag: str) -> int:
+        bit = self._bits.get(tag)
+        if bit is None:
+            bit = 1 << len(self._names)
+            tag = sys.intern(tag)
+            self._bits[tag] = bit
+            self._names.append(tag)
+        return bit
+
+    def mask(self, tags: Optional[Iterable[str]]) -> int:
+        """Mask for ``tags``, registering unseen names."""
+        mask = 0
+        for tag in tags or ():
+            mask |= self.bit(tag)
+        return mask
+
+    def query_mask(self, tags: Iterable[str]) -> int:
+        """Mask for ``tags`` without registering unseen names."""
+        mask = 0
+        for tag in tags:
+            mask |= self._bits.get(tag, 0)
+        return mask
+
+    def names(self, mask: int) -> Tuple[str, ...]:
+        names = self._tuples.get(mask)
+        if names is None:
+            names = tuple(name for i, name in enumerate(self._names) if mask >> i & 1)
+            self._tuples[mask] = names
+        return names
+
+
+TAGS = TagTable()
+
+
 class LedgerEntry:
+    __slots__ = ("event", "timestamp_ns", "capsule_id", "sequence_number", "tag_mask")
+
     def __init__(
         self,
         event: Event,
         timestamp: Optional[datetime] = None,
         capsule_id: Optional[str] = None,
         sequence_number: int = 0,
-        tags: Optional[List[str]] = None,
+        tags: Optional[Iterable[str]] = None,
+        timestamp_ns: Optional[int] = None,
     ):
-        self.id = event.event_id
         self.event = event
-        self.timestamp = timestamp or datetime.utcnow()
+        if timestamp_ns is None:
+            timestamp_ns = datetime_to_ns(timestamp) if timestamp else get_clock().now_ns()
+        self.timestamp_ns = timestamp_ns
         self.capsule_id = capsule_id
         self.sequence_number = sequence_number
-        self.tags = tags or []
+        self.tag_mask = TAGS.mask(tags)
+
+    @property
+    def id(self) -> str:
+        return self.event.event_id
+
+    @property
+    def tags(self) -> Tuple[str, ...]:
+        return TAGS.names(self.tag_mask)
+
+    @property
+    def timestamp(self) -> datetime:
+        return ns_to_datetime(self.timestamp_ns)
 
     def to_dict(self) -> Dict[str, Any]:
         return {
             "id": self.id,
             "event": self.event.to_dict(),
-            "timestamp": self.timestamp.isoformat(),
+            "timestamp_ns": self.timestamp_ns,
             "capsule_id": self.capsule_id,
             "sequence_number": self.sequence_number,
-            "tags": self.tags,
+            "tags": list(self.tags),
         }
 
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> "LedgerEntry":
         event = Event.from_dict(data["event"])
+        capsule_id = data["capsule_id"]
         return cls(
             event=event,
-            timestamp=datetime.fromisoformat(data["timestamp"]),
-            capsule_id=data["capsule_id"],
+            timestamp_ns=parse_timestamp(data),
+            capsule_id=sys.intern(capsule_id) if capsule_id else capsule_id,
             sequence_number=data["sequence_number"],
             tags=data["tags"],
         )
 
 
+class LedgerSnapshot(Sequence[LedgerEntry]):
+    """Read-only view of the first ``len(self)`` entries of a ledger."""
+    __slots__ = ("_entries", "_length")
+
+    def __init__(self, entries: List[LedgerEntry], length: Optional[int] = None):
+        self._entries = entries
+        self._length = len(entries) if length is None else length
+
+    def __len__(self) -> int:
+        return self._length
+
+    @overload
+    def __getitem__(self, index: int) -> LedgerEntry: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> List[LedgerEntry]: ...
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[LedgerEntry, List[LedgerEntry]]:
+        positions = range(self._length)
+        if isinstance(index, slice):
+            entries = self._entries
+            return [entries[i] for i in positions[index]]
+        return self._entries[positions[index]]
+
+    def __iter__(self) -> Iterator[LedgerEntry]:
+        return islice(self._entries, self._length)
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, (LedgerSnapshot, list, tuple)):
+            return len(self) == len(other) and all(a is b or a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"LedgerSnapshot({self._length} entries)"
+
+
 class Ledger:
-    def __init__(self, capsule_id: str):
+    def __init__(self, capsule_id: str, clock: Optional[Clock] = None):
         self.capsule_id = capsule_id
         self.entries: List[LedgerEntry] = []
         self._sequence_counter = 0
+        self._clock = clock
+        self._listeners: List[Callable[[LedgerEntry], Any]] = []
+
+    def subscribe(self, listener: Callable[[LedgerEntry], Any]) -> None:
+        """Call ``listener`` with every entry appended from now on."""
+        self._listeners.append(listener)
+
+    def unsubscribe(self, listener: Callable[[LedgerEntry], Any]) -> None:
+        self._listeners = [l for l in self._listeners if l != listener]
 
     def append(self, event: Event, tags: Optional[List[str]] = None) -> LedgerEntry:
         self._sequence_counter += 1
@@ -58,15 +176,87 @@ class Ledger:
             event=event,
             capsule_id=self.capsule_id,
             sequence_number=self._sequence_counter,
-            tags=tags or [],
+            tags=tags,
+            timestamp_ns=(self._clock or get_clock()).now_ns(),
         )
         self.entries.append(entry)
+        for listener in self._listeners:
+            listener(entry)
         return entry
 
-    def get_entries(self, tags: Optional[List[str]] = None) -> List[LedgerEntry]:
+    def append_many(self, items: Iterable[Tuple[Event, Optional[List[str]]]]) -> List[LedgerEntry]:
+        """Append several ``(event, tags)`` pairs sharing one timestamp."""
+        timestamp_ns = (self._clock or get_clock()).now_ns()
+        new_entries = []
+        for event, tags in items:
+            self._sequence_counter += 1
+            new_entries.append(LedgerEntry(
+                event=event,
+                capsule_id=self.capsule_id,
+                sequence_number=self._sequence_counter,
+                tags=tags,
+                timestamp_ns=timestamp_ns,
+            ))
+        self.entries.extend(new_entries)
+        for listener in self._listeners:
+            for entry in new_entries:
+                listener(entry)
+        return new_entries
+
+    def append_replicated(self, entries: Iterable[LedgerEntry]) -> List[LedgerEntry]:
+        """
+        Append entries copied from another replica of this ledger, keeping
+        their sequence numbers and timestamps. They must continue this
+        ledger's sequence without gaps.
+        """
+        new_entries = list(entries)
+        expected = self._sequence_counter
+        for entry in new_entries:
+            expected += 1
+            if entry.capsule_id != self.capsule_id or entry.sequence_number != expected:
+                raise ValueError(
+                    f"Entry #{entry.sequence_number} of '{entry.capsule_id}' does not "
+                    f"continue ledger '{self.capsule_id}' at #{expected}"
+                )
+        self._sequence_counter = expected
+        self.entries.extend(new_entries)
+        for listener in self._listeners:
+            for entry in new_entries:
+                listener(entry)
+        return new_entries
+
+    def replace_suffix(self, start: int, entries: Iterable[LedgerEntry]) -> None:
+        """
+        Replace the entries from sequence number ``start`` on with ``entries``,
+        numbered ``start``, ``start + 1``, ... (merging diverged replicas).
+
+        The entry list is replaced, not changed in place, so snapshots taken
+        before stay valid. Listeners are not called: views over this ledger
+        must be rebuilt.
+        """
+        new_entries = list(entries)
+        for offset, entry in enumerate(new_entries):
+            if entry.capsule_id != self.capsule_id or entry.sequence_number != start + offset:
+                raise ValueError(
+                    f"Entry #{entry.sequence_number} of '{entry.capsule_id}' does not "
+                    f"continue ledger '{self.capsule_id}' at #{start + offset}"
+                )
+        if not 1 <= start <= len(self.entries) + 1:
+            raise ValueError(f"Ledger '{self.capsule_id}' has no entry #{start - 1}")
+        self.entries = self.entries[:start - 1] + new_entries
+        self._sequence_counter = len(self.entries)
+
+    def snapshot(self) -> LedgerSnapshot:
+        """The entries appended so far, unaffected by later appends (O(1))."""
+        return LedgerSnapshot(self.entries)
+
+    def get_entries(self, tags: Optional[List[str]] = None) -> Sequence[LedgerEntry]:
+        """A snapshot of all entries, or a list of those carrying any of ``tags``."""
+        snapshot = self.snapshot()
         if not tags:
-            return self.entries.copy()
-        return [entry for entry in self.entries if any(tag in entry.tags for tag in tags)]
+            return snapshot
+        mask = TAGS.query_mask(tags)
+        return [entry for entry in snapshot if entry.tag_mask & mask]
 
     def get_last_entry(self) -> Optional[LedgerEntry]:
         return self.entries[-1] if self.entries else None
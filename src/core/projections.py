@@ -0,0 +1,248 @@
+"""
+Projections - derived views over ledgers, kept up to date incrementally.
+
+A projection folds ledger entries into a view: pending invitations per
+recipient, starter movements per capsule, accepted invitations per sender.
+A ``Projector`` feeds its projections every entry exactly once. It
+checkpoints the last sequence number applied from each capsule's ledger, so
+catching up after a restart reads only the entries appended since then, and
+``attach`` subscribes it to a live ``Ledger`` so appends are applied as they
+happen.
+
+The views overlap the starter registry and the invitation store, but only
+as a cache: the ledgers are the record, ``projections.json`` may be deleted
+at any time (it is rebuilt from them), and commands decide from the
+registry and store. ``audit`` reports where the store and ledgers disagree.
+"""
+from typing import Any, Dict, Iterable, List, Optional, Set, Type
+
+from src.core.ledger import Ledger, LedgerEntry
+
+
+class Projection:
+    """One view. Subclasses implement ``apply`` and (de)serialize their state."""
+    name = ""
+    version = 1
+
+    def apply(self, entry: LedgerEntry) -> None:
+        raise NotImplementedError
+
+    def to_dict(self) -> Any:
+        raise NotImplementedError
+
+    def load(self, data: Any) -> None:
+        raise NotImplementedError
+
+
+# Events that end an invitation's pending state
+_CLOSING = ("invitation_accepted", "invitation_rejected", "invitation_expired")
+
+
+class PendingInvitations(Projection):
+    """Invitations sent (sender ledgers) and not yet answered or expired."""
+    name = "pending_invitations"
+
+    def __init__(self):
+        self._by_recipient: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._recipients: Dict[str, str] = {}
+        # Answers seen before their invitation (ledgers are read in any order)
+        self._closed: Set[str] = set()
+
+    def apply(self, entry: LedgerEntry) -> None:
+        event = entry.event
+        event_type = event.event_type
+        if event_type != "invitation" and event_type not in _CLOSING:
+            return
+        metadata = event._metadata or {}
+        invitation_id = metadata.get("invitation_id")
+        if invitation_id is None:
+            return
+
+        if event_type == "invitation":
+            if invitation_id in self._closed:
+                self._closed.discard(invitation_id)
+                return
+            recipient = metadata.get("recipient_id")
+            self._by_recipient.setdefault(recipient, {})[invitation_id] = {
+                "id": invitation_id,
+                "sender": metadata.get("sender_id"),
+                "recipient": recipient,
+                "slot": metadata.get("slot_type"),
+                "starter_id": metadata.get("starter_id"),
+                "sent_ns": entry.timestamp_ns,
+                "expires_ns": metadata.get("expires_ns"),
+            }
+            self._recipients[invitation_id] = recipient
+            return
+
+        recipient = self._recipients.pop(invitation_id, None)
+        if recipient is None:
+            self._closed.add(invitation_id)
+            return
+        pending = self._by_recipient[recipient]
+        del pending[invitation_id]
+        if not pending:
+            del self._by_recipient[recipient]
+
+    def pending_for(self, recipient_id: str) -> List[Dict[str, Any]]:
+        return list(self._by_recipient.get(recipient_id, {}).values())
+
+    def ids(self) -> Set[str]:
+        return set(self._recipients)
+
+    def __len__(self) -> int:
+        return len(self._recipients)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "pending": [inv for pending in self._by_recipient.values() for inv in pending.values()],
+            "closed": sorted(self._closed),
+        }
+
+    def load(self, data: Dict[str, Any]) -> None:
+        self.__init__()
+        for invitation in data.get("pending", []):
+            recipient = invitation["recipient"]
+            self._by_recipient.setdefault(recipient, {})[invitation["id"]] = invitation
+            self._recipients[invitation["id"]] = recipient
+        self._closed = set(data.get("closed", []))
+
+
+class StarterCounts(Projection):
+    """Starters generated, received by invitation and burned, per capsule."""
+    name = "starter_counts"
+    FIELDS = ("generated", "received", "burned")
+
+    def __init__(self):
+        self._counts: Dict[str, Dict[str, int]] = {}
+
+    def _add(self, capsule_id: Optional[str], field: str) -> None:
+        counts = self._counts.get(capsule_id)
+        if counts is None:
+            counts = self._counts[capsule_id] = dict.fromkeys(self.FIELDS, 0)
+        counts[field] += 1
+
+    def apply(self, entry: LedgerEntry) -> None:
+        event = entry.event
+        event_type = event.event_type
+        if event_type == "invitation_accepted":
+            self._add(entry.capsule_id, "received")
+        elif event_type == "invitation_rejected":
+            metadata = event._metadata or {}
+            if metadata.get("burned"):
+                self._add(metadata.get("sender"), "burned")
+        elif event_type == "starter":
+            action = (event._metadata or {}).get("action")
+            if action == "starter_generated":
+                self._add(event.source, "generated")
+            elif action == "starter_burned":
+                self._add(event.source, "burned")
+
+    def counts_for(self, capsule_id: str) -> Dict[str, int]:
+        return dict(self._counts.get(capsule_id) or dict.fromkeys(self.FIELDS, 0))
+
+    def to_dict(self) -> Dict[str, Dict[str, int]]:
+        return self._counts
+
+    def load(self, data: Dict[str, Dict[str, int]]) -> None:
+        self._counts = {capsule_id: dict(counts) for capsule_id, counts in data.items()}
+
+
+class AcceptedInvitations(Projection):
+    """Accepted invitations per sender (recorded in the recipients' ledgers)."""
+    name = "accepted_invitations"
+
+    def __init__(self):
+        self._by_sender: Dict[str, int] = {}
+
+    def apply(self, entry: LedgerEntry) -> None:
+        if entry.event.event_type == "invitation_accepted":
+            sender = (entry.event._metadata or {}).get("sender")
+            self._by_sender[sender] = self._by_sender.get(sender, 0) + 1
+
+    def count_for(self, sender_id: str) -> int:
+        return self._by_sender.get(sender_id, 0)
+
+    def to_dict(self) -> Dict[str, int]:
+        return self._by_sender
+
+    def load(self, data: Dict[str, int]) -> None:
+        self._by_sender = dict(data)
+
+
+DEFAULT_PROJECTIONS: List[Type[Projection]] = [
+    PendingInvitations, StarterCounts, AcceptedInvitations,
+]
+
+
+class Projector:
+    """Feeds a set of projections and checkpoints how far each ledger was read."""
+    VERSION = 1
+
+    def __init__(self, projections: Optional[Iterable[Projection]] = None):
+        if projections is None:
+            projections = [cls() for cls in DEFAULT_PROJECTIONS]
+        self.projections: Dict[str, Projection] = {p.name: p for p in projections}
+        self.positions: Dict[str, int] = {}
+
+    def __getitem__(self, name: str) -> Projection:
+        return self.projections[name]
+
+    def position(self, capsule_id: str) -> int:
+        """Sequence number of the last entry applied from ``capsule_id``'s ledger."""
+        return self.positions.get(capsule_id, 0)
+
+    def feed(self, entry: LedgerEntry) -> bool:
+        """Apply ``entry`` unless it was applied before."""
+        if entry.sequence_number <= self.positions.get(entry.capsule_id, 0):
+            return False
+        for projection in self.projections.values():
+            projection.apply(entry)
+        self.positions[entry.capsule_id] = entry.sequence_number
+        return True
+
+    def catch_up(self, ledger: Ledger) -> int:
+        """Apply the entries appended since the checkpoint; returns how many."""
+        position = self.positions.get(ledger.capsule_id, 0)
+        entries = ledger.entries
+        # Sequence numbers start at 1 without gaps, so skip straight to the position
+        fits = 0 < position <= len(entries) and entries[position - 1].sequence_number == position
+        start = position if fits else 0
+        return sum(self.feed(entry) for entry in entries[start:])
+
+    def attach(self, ledger: Ledger) -> None:
+        """Catch up with ``ledger`` and apply its future appends as they happen."""
+        self.catch_up(ledger)
+        ledger.subscribe(self.feed)
+
+    def detach(self, ledger: Ledger) -> None:
+        ledger.unsubscribe(self.feed)
+
+    def reset(self) -> None:
+        """Forget everything, e.g. after a ledger was rewritten."""
+        self.projections = {name: type(p)() for name, p in self.projections.items()}
+        self.positions = {}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "version": self.VERSION,
+            "views": {name: p.version for name, p in self.projections.items()},
+            "positions": self.positions,
+            "state": {name: p.to_dict() for name, p in self.projections.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any],
+                  projections: Optional[Iterable[Projection]] = None) -> "Projector":
+        """
+        Restore a checkpoint. If it was written for other views (or view
+        versions) the projector starts empty and rebuilds from the ledgers.
+        """
+        projector = cls(projections)
+        views = {name: p.version for name, p in projector.projections.items()}
+        if data.get("version") != cls.VERSION or data.get("views") != views:
+            return projector
+        for name, projection in projector.projections.items():
+            projection.load(data["state"][name])
+        projector.positions = dict(data.get("positions", {}))
+        return projector
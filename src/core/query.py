@@ -0,0 +1,368 @@
+"""
+Ledger queries - filter, project, order, limit and aggregate ledger entries.
+
+``Query`` is a small declarative builder over one or many ledgers::
+
+    Query(ledgers).where(event_type="invitation", sender_id="alice") \
+        .tagged("outgoing").order_by("timestamp_ns", descending=True).limit(10)
+
+Each ledger gets a ``LedgerIndex`` (kept per ledger object and extended with
+the entries appended since the last query): positions by event id, event
+type, tag and any metadata field queried for equality, plus the sequence and
+timestamp columns for range lookups. The planner picks, per ledger, the
+access path with the fewest candidate rows and checks the remaining
+conditions on those rows only; ``explain`` shows the choice. Results are
+streamed: ordering by sequence or (sorted) timestamp merges the per-ledger
+streams lazily, so ``limit`` stops early.
+"""
+import heapq
+import weakref
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from itertools import islice
+from typing import (
+    Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union,
+)
+
+from src.core.ledger import TAGS, Ledger, LedgerEntry
+
+
+def entry_field(entry: LedgerEntry, name: str) -> Any:
+    """Value of ``name`` for an entry: an entry attribute, event attribute or metadata field."""
+    event = entry.event
+    if name in ("sequence_number", "timestamp_ns", "capsule_id", "tags"):
+        return getattr(entry, name)
+    if name in ("event_id", "event_type", "source"):
+        return getattr(event, name)
+    metadata = event._metadata
+    if metadata and name in metadata:
+        return metadata[name]
+    if name in event.FIELDS:
+        return event._field_value(name)
+    return None
+
+
+# Fields answered by the fixed indexes, not by per-field metadata indexes
+_BUILTIN = ("event_id", "event_type", "capsule_id", "sequence_number", "timestamp_ns", "tags")
+
+
+class LedgerIndex:
+    """Positions of one ledger's entries, extended incrementally as it grows."""
+
+    def __init__(self):
+        self._entries: Optional[List[LedgerEntry]] = None
+        self.sequence = array("q")
+        self.timestamp_ns = array("q")
+        self.timestamps_sorted = True
+        self.by_id: Dict[str, int] = {}
+        self.by_type: Dict[str, List[int]] = {}
+        self.by_tag: Dict[int, List[int]] = {}
+        self.fields: Dict[str, Dict[Any, List[int]]] = {}
+
+    def __len__(self) -> int:
+        return len(self.sequence)
+
+    def sync(self, ledger: Ledger) -> None:
+        entries = ledger.entries
+        if entries is not self._entries or len(entries) < len(self):
+            fields = list(self.fields)
+            self.__init__()  # the list was replaced: index from scratch
+            self.fields = {name: {} for name in fields}
+            self._entries = entries
+        for position in range(len(self), len(entries)):
+            self._add(position, entries[position])
+
+    def _add(self, position: int, entry: LedgerEntry) -> None:
+        if self.timestamp_ns and entry.timestamp_ns < self.timestamp_ns[-1]:
+            self.timestamps_sorted = False
+        self.sequence.append(entry.sequence_number)
+        self.timestamp_ns.append(entry.timestamp_ns)
+        self.by_id[entry.event.event_id] = position
+        self.by_type.setdefault(entry.event.event_type, []).append(position)
+        mask = entry.tag_mask
+        bit = 1
+        while mask:
+            if mask & 1:
+                self.by_tag.setdefault(bit, []).append(position)
+            mask >>= 1
+            bit <<= 1
+        for name, postings in self.fields.items():
+            postings.setdefault(_hashable(entry_field(entry, name)), []).append(position)
+
+    def ensure_field(self, name: str) -> None:
+        """Index metadata field ``name`` for equality lookups."""
+        if name in self.fields:
+            return
+        postings: Dict[Any, List[int]] = {}
+        for position, entry in enumerate(self._entries or ()):
+            postings.setdefault(_hashable(entry_field(entry, name)), []).append(position)
+        self.fields[name] = postings
+
+
+def _hashable(value: Any) -> Any:
+    return tuple(value) if isinstance(value, list) else value
+
+
+_indexes: "weakref.WeakKeyDictionary[Ledger, LedgerIndex]" = weakref.WeakKeyDictionary()
+
+
+def ledger_index(ledger: Ledger) -> LedgerIndex:
+    """The index of ``ledger``, brought up to date with its entries."""
+    index = _indexes.get(ledger)
+    if index is None:
+        index = _indexes[ledger] = LedgerIndex()
+    index.sync(ledger)
+    return index
+
+
+class Access:
+    """One access path: candidate positions (ascending) and how they were found."""
+    __slots__ = ("description", "positions", "exact")
+
+    def __init__(self, description: str, positions: Sequence[int], exact: Tuple[str, ...]):
+        self.description = description
+        self.positions = positions
+        self.exact = exact  # conditions the path already guarantees
+
+
+class Query:
+    def __init__(self, ledgers: Union[Ledger, Iterable[Ledger]]):
+        self.ledgers: List[Ledger] = [ledgers] if isinstance(ledgers, Ledger) else list(ledgers)
+        self._equals: Dict[str, Any] = {}
+        self._tags: Optional[Tuple[str, ...]] = None
+        self._since_ns: Optional[int] = None
+        self._until_ns: Optional[int] = None
+        self._seq_start: Optional[int] = None
+        self._seq_stop: Optional[int] = None
+        self._predicates: List[Callable[[LedgerEntry], bool]] = []
+        self._order: Optional[Tuple[str, bool]] = None
+        self._limit: Optional[int] = None
+        self._fields: Optional[Tuple[str, ...]] = None
+
+    def _copy(self, **changes: Any) -> "Query":
+        query = Query.__new__(Query)
+        query.__dict__.update(self.__dict__)
+        query._equals = dict(self._equals)
+        query._predicates = list(self._predicates)
+        for name, value in changes.items():
+            setattr(query, name, value)
+        return query
+
+    # -- building ------------------------------------------------------
+
+    def where(self, **equals: Any) -> "Query":
+        """Entries whose fields (see ``entry_field``) equal the given values."""
+        query = self._copy()
+        query._equals.update(equals)
+        return query
+
+    def tagged(self, *tags: str) -> "Query":
+        """Entries carrying any of ``tags``."""
+        return self._copy(_tags=tags)
+
+    def between(self, since_ns: Optional[int] = None, until_ns: Optional[int] = None) -> "Query":
+        """Entries with ``since_ns <= timestamp_ns < until_ns``."""
+        return self._copy(_since_ns=since_ns, _until_ns=until_ns)
+
+    def sequences(self, start: Optional[int] = None, stop: Optional[int] = None) -> "Query":
+        """Entries with ``start <= sequence_number < stop``."""
+        return self._copy(_seq_start=start, _seq_stop=stop)
+
+    def filter(self, predicate: Callable[[LedgerEntry], bool]) -> "Query":
+        """Entries for which ``predicate`` is true (never uses an index)."""
+        query = self._copy()
+        query._predicates.append(predicate)
+        return query
+
+    def order_by(self, field: str, descending: bool = False) -> "Query":
+        """Order by ``field``; entries without it come last either way."""
+        return self._copy(_order=(field, descending))
+
+    def limit(self, count: int) -> "Query":
+        return self._copy(_limit=count)
+
+    def select(self, *fields: str) -> "Query":
+        """Yield dicts of ``fields`` instead of entries."""
+        return self._copy(_fields=fields)
+
+    # -- planning ------------------------------------------------------
+
+    def _accesses(self, index: LedgerIndex) -> List[Access]:
+        """Every usable access path for one ledger, full scan last."""
+        n = len(index)
+        paths: List[Access] = []
+        equals = self._equals
+        if "event_id" in equals:
+            found = index.by_id.get(equals["event_id"])
+            paths.append(Access(f"event_id = {equals['event_id']!r}",
+                                [] if found is None else [found], ("event_id",)))
+        if "event_type" in equals:
+            paths.append(Access(f"event_type = {equals['event_type']!r}",
+                                index.by_type.get(equals["event_type"], []), ("event_type",)))
+        for name, value in equals.items():
+            if name not in _BUILTIN:
+                index.ensure_field(name)
+                paths.append(Access(f"{name} = {value!r}",
+                                    index.fields[name].get(_hashable(value), []), (name,)))
+        if self._tags is not None:
+            bits = [TAGS.query_mask([tag]) for tag in self._tags]
+            lists = [index.by_tag.get(bit, []) for bit in bits if bit]
+            positions: Sequence[int] = (
+                lists[0] if len(lists) == 1 else sorted(set().union(*lists))
+            )
+            paths.append(Access(f"tags any {list(self._tags)}", positions, ("tags",)))
+        if self._seq_start is not None or self._seq_stop is not None:
+            low = bisect_left(index.sequence, self._seq_start) if self._seq_start is not None else 0
+            high = bisect_left(index.sequence, self._seq_stop) if self._seq_stop is not None else n
+            paths.append(Access(f"sequence [{self._seq_start}, {self._seq_stop})",
+                                range(low, max(low, high)), ("sequence",)))
+        if (self._since_ns is not None or self._until_ns is not None) and index.timestamps_sorted:
+            times = index.timestamp_ns
+            low = bisect_left(times, self._since_ns) if self._since_ns is not None else 0
+            high = bisect_left(times, self._until_ns) if self._until_ns is not None else n
+            paths.append(Access(f"timestamp [{self._since_ns}, {self._until_ns})",
+                                range(low, max(low, high)), ("time",)))
+        paths.append(Access("full scan", range(n), ()))
+        return paths
+
+    def _plan(self, index: LedgerIndex) -> Access:
+        return min(self._accesses(index), key=lambda access: len(access.positions))
+
+    def _residual(self, exact: Tuple[str, ...]) -> List[Callable[[LedgerEntry], bool]]:
+        checks: List[Callable[[LedgerEntry], bool]] = []
+        for name, value in self._equals.items():
+            if name not in exact:
+                value = _hashable(value)
+                checks.append(lambda e, name=name, value=value: _hashable(entry_field(e, name)) == value)
+        if self._tags is not None and "tags" not in exact:
+            mask = TAGS.query_mask(self._tags)
+            checks.append(lambda e: bool(e.tag_mask & mask))
+        if "sequence" not in exact:
+            if self._seq_start is not None:
+                checks.append(lambda e: e.sequence_number >= self._seq_start)
+            if self._seq_stop is not None:
+                checks.append(lambda e: e.sequence_number < self._seq_stop)
+        if "time" not in exact:
+            if self._since_ns is not None:
+                checks.append(lambda e: e.timestamp_ns >= self._since_ns)
+            if self._until_ns is not None:
+                checks.append(lambda e: e.timestamp_ns < self._until_ns)
+        return checks + self._predicates
+
+    def _describe_residual(self, exact: Tuple[str, ...]) -> List[str]:
+        parts = [f"{name} = {value!r}" for name, value in self._equals.items() if name not in exact]
+        if self._tags is not None and "tags" not in exact:
+            parts.append(f"tags any {list(self._tags)}")
+        if "sequence" not in exact and (self._seq_start is not None or self._seq_stop is not None):
+            parts.append(f"sequence [{self._seq_start}, {self._seq_stop})")
+        if "time" not in exact and (self._since_ns is not None or self._until_ns is not None):
+            parts.append(f"timestamp [{self._since_ns}, {self._until_ns})")
+        parts.extend("<predicate>" for _ in self._predicates)
+        return parts
+
+    def _streams_sorted(self, indexes: List[LedgerIndex]) -> bool:
+        """Whether each ledger's stream already comes out in the requested order."""
+        field = self._order[0]
+        if field == "sequence_number":
+            return True
+        return field == "timestamp_ns" and all(index.timestamps_sorted for index in indexes)
+
+    def explain(self) -> str:
+        """The plan chosen for every ledger, as text."""
+        indexes = [ledger_index(ledger) for ledger in self.ledgers]
+        total = sum(len(index) for index in indexes)
+        lines = [f"Query over {len(self.ledgers)} ledger(s), {total} entries"]
+        for ledger, index in zip(self.ledgers, indexes):
+            access = self._plan(index)
+            line = (f"  {ledger.capsule_id}: {access.description}"
+                    f" -> {len(access.positions)} of {len(index)} rows")
+            residual = self._describe_residual(access.exact)
+            if residual:
+                line += f"; filter {' and '.join(residual)}"
+            lines.append(line)
+        if self._order is not None:
+            field, descending = self._order
+            how = "merge of sorted streams" if self._streams_sorted(indexes) else "sort"
+            lines.append(f"  order by {field} {'desc' if descending else 'asc'} ({how})")
+        if self._limit is not None:
+            lines.append(f"  limit {self._limit}")
+        if self._fields is not None:
+            lines.append(f"  select {', '.join(self._fields)}")
+        return "\n".join(lines)
+
+    # -- execution -----------------------------------------------------
+
+    def _scan(self, ledger: Ledger, index: LedgerIndex, descending: bool = False) -> Iterator[LedgerEntry]:
+        access = self._plan(index)
+        checks = self._residual(access.exact)
+        entries = ledger.entries
+        positions = reversed(access.positions) if descending else access.positions
+        for position in positions:
+            entry = entries[position]
+            if all(check(entry) for check in checks):
+                yield entry
+
+    def entries(self) -> Iterator[LedgerEntry]:
+        """Matching entries, ordered and limited (ignores ``select``)."""
+        indexes = [ledger_index(ledger) for ledger in self.ledgers]
+        if self._order is None:
+            stream: Iterable[LedgerEntry] = (
+                entry for ledger, index in zip(self.ledgers, indexes)
+                for entry in self._scan(ledger, index)
+            )
+        else:
+            field, descending = self._order
+
+            def key(entry: LedgerEntry) -> Tuple[bool, Any]:
+                value = entry_field(entry, field)
+                return (value is None) != descending, value
+
+            if self._streams_sorted(indexes):
+                streams = [self._scan(ledger, index, descending)
+                           for ledger, index in zip(self.ledgers, indexes)]
+                stream = heapq.merge(*streams, key=key, reverse=descending)
+            else:
+                stream = sorted(
+                    (entry for ledger, index in zip(self.ledgers, indexes)
+                     for entry in self._scan(ledger, index)),
+                    key=key, reverse=descending,
+                )
+        if self._limit is not None:
+            stream = islice(stream, self._limit)
+        return iter(stream)
+
+    def __iter__(self) -> Iterator[Any]:
+        if self._fields is None:
+            return self.entries()
+        fields = self._fields
+        return ({name: entry_field(entry, name) for name in fields} for entry in self.entries())
+
+    def all(self) -> List[Any]:
+        return list(self)
+
+    def first(self) -> Optional[Any]:
+        return next(iter(self.limit(1)), None)
+
+    # -- aggregates ----------------------------------------------------
+
+    def count(self) -> int:
+        if self._limit is None and not self._predicates:
+            total = 0
+            for ledger in self.ledgers:
+                index = ledger_index(ledger)
+                access = self._plan(index)
+                if self._residual(access.exact):
+                    total += sum(1 for _ in self._scan(ledger, index))
+                else:
+                    total += len(access.positions)  # the index answers it alone
+            return total
+        return sum(1 for _ in self.entries())
+
+    def count_by(self, field: str) -> Dict[Any, int]:
+        """Matching entries per value of ``field``."""
+        return dict(Counter(_hashable(entry_field(entry, field)) for entry in self.entries()))
+
+    def aggregate(self, field: str, function: Callable[[List[Any]], Any]) -> Any:
+        """``function`` applied to the values of ``field`` (e.g. ``max``, ``sum``)."""
+        return function([entry_field(entry, field) for entry in self.entries()])
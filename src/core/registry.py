@@ -0,0 +1,239 @@
+"""
+Starter registry - who currently holds each starter.
+
+Maps ``starter_id`` to the capsule and slot holding it, its ownership status
+and the last ledger event that touched it, so a transfer can be validated
+with one dict lookup instead of loading every capsule.
+"""
+import json
+from enum import Enum
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from src.core.capsule import Capsule
+from src.core.ledger import Ledger, LedgerEntry
+
+
+class OwnershipStatus(Enum):
+    """Ownership status of a starter."""
+    HELD = "held"
+    OFFERED = "offered"  # Held, with outstanding invitations
+
+
+class StarterConflictError(ValueError):
+    """Raised when a starter would end up in two capsules."""
+
+
+class StarterRecord:
+    __slots__ = ("capsule_id", "slot", "offers", "last_event_id")
+
+    def __init__(
+        self,
+        capsule_id: str,
+        slot: str,
+        offers: int = 0,
+        last_event_id: Optional[str] = None,
+    ):
+        self.capsule_id = capsule_id
+        self.slot = slot
+        self.offers = offers  # invitations offering the starter that are still pending
+        self.last_event_id = last_event_id
+
+    @property
+    def status(self) -> OwnershipStatus:
+        return OwnershipStatus.OFFERED if self.offers else OwnershipStatus.HELD
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "capsule_id": self.capsule_id,
+            "slot": self.slot,
+            "status": self.status.value,
+            "offers": self.offers,
+            "last_event_id": self.last_event_id,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "StarterRecord":
+        offers = data.get("offers")
+        if offers is None:  # written before offers were counted
+            offers = int(OwnershipStatus(data["status"]) == OwnershipStatus.OFFERED)
+        return cls(
+            capsule_id=data["capsule_id"],
+            slot=data["slot"],
+            offers=offers,
+            last_event_id=data.get("last_event_id"),
+        )
+
+
+class StarterRegistry:
+    def __init__(self):
+        self._records: Dict[str, StarterRecord] = {}
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __contains__(self, starter_id: str) -> bool:
+        return starter_id in self._records
+
+    def get(self, starter_id: str) -> Optional[StarterRecord]:
+        return self._records.get(starter_id)
+
+    def owner_of(self, starter_id: str) -> Optional[str]:
+        record = self._records.get(starter_id)
+        return record.capsule_id if record else None
+
+    def assign(self, starter_id: str, capsule_id: str, slot: str,
+               event_id: Optional[str] = None) -> StarterRecord:
+        """Record ``capsule_id`` as holder of a starter it did not receive by transfer."""
+        record = self._records.get(starter_id)
+        if record is not None and record.capsule_id != capsule_id:
+            raise StarterConflictError(
+                f"Starter {starter_id} is already held by {record.capsule_id} ({record.slot})"
+            )
+        record = StarterRecord(capsule_id, slot, last_event_id=event_id)
+        self._records[starter_id] = record
+        return record
+
+    def register_capsule(self, capsule: Capsule) -> None:
+        """Register every starter currently sitting in ``capsule``'s slots."""
+        for slot, starter_id in capsule.occupied_slots():
+            self.assign(starter_id, capsule.capsule_id, slot)
+
+    def release(self, starter_id: str) -> None:
+        """Forget a starter (burned)."""
+        self._records.pop(starter_id, None)
+
+    def validate_transfer(self, starter_id: str, from_capsule_id: str, to_capsule_id: str) -> None:
+        """Raise ``StarterConflictError`` unless ``from_capsule_id`` may hand the starter over."""
+        owner = self.owner_of(starter_id)
+        if owner is None:
+            raise StarterConflictError(f"Starter {starter_id} is not registered")
+        if owner == to_capsule_id:
+            raise StarterConflictError(f"Starter {starter_id} is already held by {to_capsule_id}")
+        if owner != from_capsule_id:
+            raise StarterConflictError(
+                f"Starter {starter_id} is held by {owner}, not {from_capsule_id}"
+            )
+
+    def transfer(self, starter_id: str, from_capsule_id: str, to_capsule_id: str, slot: str,
+                 event_id: Optional[str] = None) -> StarterRecord:
+        self.validate_transfer(starter_id, from_capsule_id, to_capsule_id)
+        record = StarterRecord(to_capsule_id, slot, last_event_id=event_id)
+        self._records[starter_id] = record
+        return record
+
+    def accept_offer(self, starter_id: str, from_capsule_id: str, to_capsule_id: str, slot: str,
+                     new_starter_id: str, event_id: Optional[str] = None) -> StarterRecord:
+        """
+        ``to_capsule_id`` accepted an invitation offering ``starter_id`` into an
+        empty slot: it holds a new own starter and the sender keeps its own
+        (spec §4).
+        """
+        self.validate_transfer(starter_id, from_capsule_id, to_capsule_id)
+        self.withdraw_offer(starter_id, event_id)
+        return self.assign(new_starter_id, to_capsule_id, slot, event_id)
+
+    def mark_offered(self, starter_id: str, event_id: Optional[str] = None) -> None:
+        """An invitation offering the starter was sent."""
+        record = self._records.get(starter_id)
+        if record is not None:
+            record.offers += 1
+            record.last_event_id = event_id
+
+    def withdraw_offer(self, starter_id: str, event_id: Optional[str] = None) -> None:
+        """
+        An invitation offering the starter is no longer pending; once none
+        is, the starter is simply held again.
+        """
+        record = self._records.get(starter_id)
+        if record is not None and record.offers:
+            record.offers -= 1
+            record.last_event_id = event_id
+
+    def apply_entry(self, entry: LedgerEntry) -> None:
+        """Update ownership from one ledger entry."""
+        event = entry.event
+        metadata = event._metadata or {}
+        event_type = event.event_type
+
+        if event_type == "invitation":
+            self.mark_offered(metadata.get("starter_id"), event.event_id)
+        elif event_type == "invitation_expired":
+            self.withdraw_offer(metadata.get("starter_id"), event.event_id)
+        elif event_type == "invitation_rejected":
+            if metadata.get("burned"):
+                self.release(metadata.get("starter_id"))
+            else:
+                self.withdraw_offer(metadata.get("starter_id"), event.event_id)
+        elif event_type == "invitation_accepted":
+            if "starter_id" in metadata:  # the offered starter, when a new one was generated
+                self.withdraw_offer(metadata["starter_id"], event.event_id)
+            starter_id = metadata.get("new_starter_id")
+            sender = metadata.get("sender")
+            record = self._records.get(starter_id)
+            if record is None or record.capsule_id == sender:  # older ledgers moved the starter
+                self._records[starter_id] = StarterRecord(
+                    entry.capsule_id, metadata.get("slot"), last_event_id=event.event_id
+                )
+        elif event_type == "starter":
+            action = metadata.get("action")
+            if action == "starter_generated":
+                self._records[event.starter_id] = StarterRecord(
+                    event.source, metadata.get("slot"), last_event_id=event.event_id
+                )
+            elif action == "starter_burned":
+                self.release(event.starter_id)
+
+    def apply_ledger(self, ledger: Ledger) -> None:
+        for entry in ledger.entries:
+            self.apply_entry(entry)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {starter_id: record.to_dict() for starter_id, record in self._records.items()}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "StarterRegistry":
+        registry = cls()
+        registry._records = {
+            starter_id: StarterRecord.from_dict(record) for starter_id, record in data.items()
+        }
+        return registry
+
+    @classmethod
+    def from_capsules(cls, capsules: Iterable[Capsule]) -> "StarterRegistry":
+        """
+        Build from current slot contents. A starter found in several capsules
+        is attributed to the first one; use ``audit_capsules`` to list those.
+        """
+        registry = cls()
+        for capsule in capsules:
+            for slot, starter_id in capsule.occupied_slots():
+                if starter_id not in registry._records:
+                    registry._records[starter_id] = StarterRecord(capsule.capsule_id, slot)
+        return registry
+
+    def save_to_file(self, path: str):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    @classmethod
+    def load_from_file(cls, path: str) -> "StarterRegistry":
+        with open(path, 'r') as f:
+            data = json.load(f)
+        return cls.from_dict(data)
+
+
+def audit_capsules(capsules: Iterable[Dict[str, Any]]) -> Dict[str, List[Tuple[str, str]]]:
+    """
+    Find starters held by more than one slot.
+
+    Takes capsule dicts (as stored, e.g. a store's ``iter_capsules()``) and
+    returns ``starter_id -> [(capsule_id, slot), ...]`` for every conflict.
+    """
+    holders: Dict[str, List[Tuple[str, str]]] = {}
+    for data in capsules:
+        capsule_id = data.get("capsule_id")
+        for slot_name, slot in data.get("slots", {}).items():
+            starter_id = slot.get("starter_id")
+            if starter_id:
+                holders.setdefault(starter_id, []).append((capsule_id, slot_name))
+    return {starter_id: held for starter_id, held in holders.items() if len(held) > 1}
@@ -0,0 +1,158 @@
+"""
+Pairwise relationship states between capsules (spec §3).
+
+Each peer's Invited / Trusted / Linked / Ignored states are packed into one
+integer bitfield. The store keeps a peer set per state so bulk questions
+("all peers I trust", "all pending invites") never scan every peer.
+"""
+from enum import IntFlag
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Union
+
+
+class RelationshipState(IntFlag):
+    NONE = 0
+    INVITED = 1
+    TRUSTED = 2
+    LINKED = 4
+    IGNORED = 8
+
+
+STATE_NAMES: Dict[str, RelationshipState] = {
+    "invited": RelationshipState.INVITED,
+    "trusted": RelationshipState.TRUSTED,
+    "linked": RelationshipState.LINKED,
+    "ignored": RelationshipState.IGNORED,
+}
+
+_STATES = tuple(STATE_NAMES.values())
+
+
+def _flag(state: Union[str, RelationshipState]) -> RelationshipState:
+    if isinstance(state, str):
+        try:
+            return STATE_NAMES[state]
+        except KeyError:
+            raise ValueError(f"Unknown relationship state: {state!r}") from None
+    return RelationshipState(state)
+
+
+def _state_property(flag: RelationshipState) -> property:
+    def getter(self: "Relationship") -> bool:
+        return bool(self._store.state_of(self.peer_id) & flag)
+
+    def setter(self: "Relationship", value: bool) -> None:
+        self._store.set_state(self.peer_id, flag, value)
+
+    return property(getter, setter)
+
+
+class Relationship:
+    """Live view of the relationship with one peer."""
+    __slots__ = ("_store", "peer_id")
+
+    def __init__(self, store: "RelationshipStore", peer_id: str):
+        self._store = store
+        self.peer_id = peer_id
+
+    @property
+    def state(self) -> RelationshipState:
+        return RelationshipState(self._store.state_of(self.peer_id))
+
+    def toggle(self, state: Union[str, RelationshipState]) -> bool:
+        return self._store.toggle(self.peer_id, state)
+
+    invited = _state_property(RelationshipState.INVITED)
+    trusted = _state_property(RelationshipState.TRUSTED)
+    linked = _state_property(RelationshipState.LINKED)
+    ignored = _state_property(RelationshipState.IGNORED)
+
+    def __repr__(self) -> str:
+        return f"Relationship(peer_id={self.peer_id!r}, state={self.state!r})"
+
+
+class RelationshipStore:
+    """Peer -> state bitfield, with one peer index per state."""
+
+    def __init__(self):
+        self._bits: Dict[str, int] = {}
+        self._index: Dict[RelationshipState, Set[str]] = {flag: set() for flag in _STATES}
+        self._listeners: Optional[List[Callable[[str, int, int], None]]] = None
+
+    def add_listener(self, listener: Callable[[str, int, int], None]) -> None:
+        """Call ``listener(peer_id, old_bits, new_bits)`` after every change."""
+        if self._listeners is None:
+            self._listeners = []
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[str, int, int], None]) -> None:
+        if self._listeners and listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def __len__(self) -> int:
+        return len(self._bits)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._bits)
+
+    def get(self, peer_id: str) -> Relationship:
+        return Relationship(self, peer_id)
+
+    def state_of(self, peer_id: str) -> int:
+        return self._bits.get(peer_id, 0)
+
+    def set_bits(self, peer_id: str, bits: int) -> None:
+        """Replace a peer's whole bitfield, keeping the indexes in sync."""
+        old = self._bits.get(peer_id, 0)
+        changed = old ^ bits
+        if not changed:
+            return
+        for flag in _STATES:
+            if changed & flag:
+                if bits & flag:
+                    self._index[flag].add(peer_id)
+                else:
+                    self._index[flag].discard(peer_id)
+        if bits:
+            self._bits[peer_id] = bits
+        else:
+            del self._bits[peer_id]
+        if self._listeners:
+            for listener in self._listeners:
+                listener(peer_id, old, bits)
+
+    def set_state(self, peer_id: str, state: Union[str, RelationshipState], value: bool) -> None:
+        flag = _flag(state)
+        old = self._bits.get(peer_id, 0)
+        self.set_bits(peer_id, old | flag if value else old & ~flag)
+
+    def toggle(self, peer_id: str, state: Union[str, RelationshipState]) -> bool:
+        """Flip one state for a peer. Returns the new value."""
+        flag = _flag(state)
+        bits = self._bits.get(peer_id, 0) ^ flag
+        self.set_bits(peer_id, bits)
+        return bool(bits & flag)
+
+    def peers_with(self, state: Union[str, RelationshipState]) -> Set[str]:
+        """Peers having ``state`` on. Returns the live index; do not mutate."""
+        return self._index[_flag(state)]
+
+    def count(self, state: Union[str, RelationshipState]) -> int:
+        return len(self._index[_flag(state)])
+
+    def to_dict(self) -> Dict[str, List[str]]:
+        """Peers grouped by bitfield value: ``{"3": [peer, ...], ...}``."""
+        groups: Dict[str, List[str]] = {}
+        for peer_id, bits in self._bits.items():
+            groups.setdefault(str(bits), []).append(peer_id)
+        return groups
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "RelationshipStore":
+        store = cls()
+        for bits, peers in data.items():
+            bits = int(bits)
+            store._bits.update(dict.fromkeys(peers, bits))
+            for flag in _STATES:
+                if bits & flag:
+                    store._index[flag].update(peers)
+        return store
@@ -0,0 +1,453 @@
+"""
+Replication - reconcile two replicas of a capsule's ledger.
+
+Offline-first, both copies of a ledger keep appending: they share a prefix
+and each may have entries the other lacks past it. ``reconcile`` brings
+them to the same history in three steps, exchanging JSON-shaped messages
+over a ``Transport``:
+
+1. Find where they diverge. Each replica keeps running XORs of per-entry
+   digests (``RangeFingerprints``), so any sequence range's fingerprint is
+   one XOR. The shared range is compared ``fanout`` sub-ranges per round
+   trip, descending into the first that differs.
+2. Find the entries each diverged suffix lacks. Both suffixes are compared
+   as sets of entry keys (event id and timestamp, ``SuffixFingerprints``):
+   only key ranges whose fingerprints differ are split further, and small
+   ones are settled by listing their keys, so this costs
+   O(differences x log n) fingerprints.
+3. Copy just those entries, in batches. If only one side had appended, the
+   other appends its entries. Otherwise both replace their suffix with the
+   union ordered by timestamp (event id breaks ties; an event recorded at
+   two times is kept at the earlier), numbered on from the fork, and the
+   peer checks the result against the caller's fingerprint before keeping
+   it.
+
+``LoopbackTransport`` serves a ``ReplicaPeer`` in the same process and
+counts the bytes each message would take on the wire.
+"""
+import hashlib
+import json
+import weakref
+from bisect import bisect_left
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from src.core.ledger import Ledger, LedgerEntry
+
+
+# Sub-ranges compared per round trip
+FANOUT = 16
+# Key ranges with at most this many entries are settled by listing their keys
+LEAF_SIZE = 16
+# Entries or keys per message when copying
+BATCH_SIZE = 256
+
+# A key range [lo, hi); hi None is unbounded
+KeyRange = Tuple[str, Optional[str]]
+
+
+class ReplicationError(ValueError):
+    """The replicas cannot be reconciled, or the peer refused a request."""
+
+
+def _digest(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=16).digest(), "big")
+
+
+def entry_digest(entry: LedgerEntry) -> int:
+    return _digest(f"{entry.sequence_number}\x1f{entry.id}\x1f{entry.timestamp_ns}")
+
+
+def entry_key(entry: LedgerEntry) -> str:
+    return f"{entry.id}\x1f{entry.timestamp_ns}"
+
+
+def _hex(value: int) -> str:
+    return format(value, "032x")
+
+
+class RangeFingerprints:
+    """Running XORs of a ledger's entry digests, extended incrementally as it grows."""
+
+    def __init__(self):
+        self._entries: Optional[List[LedgerEntry]] = None
+        self._prefix: List[int] = [0]
+
+    def __len__(self) -> int:
+        return len(self._prefix) - 1
+
+    def sync(self, ledger: Ledger) -> None:
+        entries = ledger.entries
+        if entries is not self._entries or len(entries) < len(self):
+            self.__init__()  # the list was replaced: start over
+            self._entries = entries
+        prefix = self._prefix
+        for position in range(len(self), len(entries)):
+            entry = entries[position]
+            if entry.sequence_number != position + 1:
+                raise ReplicationError(
+                    f"Ledger '{ledger.capsule_id}' has entry #{entry.sequence_number} "
+                    f"at position {position + 1}"
+                )
+            prefix.append(prefix[-1] ^ entry_digest(entry))
+
+    def fingerprint(self, start: int, stop: int) -> int:
+        """Fingerprint of sequence numbers ``[start, stop)``; 0 when empty."""
+        return self._prefix[stop - 1] ^ self._prefix[start - 1]
+
+
+_fingerprints: "weakref.WeakKeyDictionary[Ledger, RangeFingerprints]" = weakref.WeakKeyDictionary()
+
+
+def ledger_fingerprints(ledger: Ledger) -> RangeFingerprints:
+    """The fingerprints of ``ledger``, brought up to date with its entries."""
+    fingerprints = _fingerprints.get(ledger)
+    if fingerprints is None:
+        fingerprints = _fingerprints[ledger] = RangeFingerprints()
+    fingerprints.sync(ledger)
+    return fingerprints
+
+
+def split_range(start: int, stop: int, parts: int) -> List[Tuple[int, int]]:
+    """``[start, stop)`` cut into at most ``parts`` contiguous, non-empty ranges."""
+    size = stop - start
+    parts = max(1, min(parts, size))
+    bounds = [start + size * i // parts for i in range(parts + 1)]
+    return list(zip(bounds, bounds[1:]))
+
+
+class SuffixFingerprints:
+    """Entries ordered by ``entry_key``, with running XORs of the key digests."""
+
+    def __init__(self, entries: Iterable[LedgerEntry]):
+        self.by_key = {entry_key(entry): entry for entry in entries}
+        self.keys = sorted(self.by_key)
+        self._prefix = [0]
+        for key in self.keys:
+            self._prefix.append(self._prefix[-1] ^ _digest(key))
+
+    def _bounds(self, lo: str, hi: Optional[str]) -> Tuple[int, int]:
+        return bisect_left(self.keys, lo), len(self.keys) if hi is None else bisect_left(self.keys, hi)
+
+    def fingerprint(self, lo: str, hi: Optional[str]) -> Tuple[int, int]:
+        """Fingerprint and number of the keys in ``[lo, hi)``."""
+        i, j = self._bounds(lo, hi)
+        return self._prefix[j] ^ self._prefix[i], j - i
+
+    def range_keys(self, lo: str, hi: Optional[str], limit: Optional[int] = None) -> List[str]:
+        i, j = self._bounds(lo, hi)
+        return self.keys[i:j if limit is None else min(j, i + limit)]
+
+    def split(self, lo: str, hi: Optional[str], parts: int) -> List[KeyRange]:
+        """``[lo, hi)`` cut at keys of this side into at most ``parts`` ranges."""
+        i, j = self._bounds(lo, hi)
+        parts = max(1, min(parts, j - i))
+        cuts = [self.keys[i + (j - i) * k // parts] for k in range(1, parts)]
+        bounds: List[Optional[str]] = [lo, *cuts, hi]
+        return list(zip(bounds, bounds[1:]))
+
+
+def merge_suffixes(*suffixes: Iterable[LedgerEntry]) -> List[LedgerEntry]:
+    """
+    The union (by event id) of diverged suffixes, in the order both replicas
+    agree on: by timestamp, then event id.
+    """
+    merged: List[LedgerEntry] = []
+    seen = set()
+    for entry in sorted((e for suffix in suffixes for e in suffix),
+                        key=lambda entry: (entry.timestamp_ns, entry.id)):
+        if entry.id not in seen:
+            seen.add(entry.id)
+            merged.append(entry)
+    return merged
+
+
+def resequence(entries: Iterable[LedgerEntry], start: int) -> List[LedgerEntry]:
+    """``entries`` numbered from ``start``; entries already numbered so are reused."""
+    numbered = []
+    for sequence_number, entry in enumerate(entries, start):
+        if entry.sequence_number != sequence_number:
+            entry = LedgerEntry(
+                event=entry.event,
+                timestamp_ns=entry.timestamp_ns,
+                capsule_id=entry.capsule_id,
+                sequence_number=sequence_number,
+                tags=entry.tags,
+            )
+        numbered.append(entry)
+    return numbered
+
+
+def merged_fingerprint(ledger: Ledger, start: int, suffix: List[LedgerEntry]) -> int:
+    """Fingerprint of the whole ledger once its entries from ``start`` on are ``suffix``."""
+    fingerprint = ledger_fingerprints(ledger).fingerprint(1, start)
+    for entry in suffix:
+        fingerprint ^= entry_digest(entry)
+    return fingerprint
+
+
+class ReplicaPeer:
+    """Answers reconciliation requests for one replica of a ledger."""
+
+    def __init__(self, ledger: Ledger, max_batch: int = BATCH_SIZE):
+        self.ledger = ledger
+        self.max_batch = max_batch
+        self._suffix: Optional[Tuple[int, List[LedgerEntry], int, SuffixFingerprints]] = None
+        self._staged: Dict[str, LedgerEntry] = {}
+        self.rewritten_from: Optional[int] = None  # set when a merge replaced entries
+
+    def handle(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        op = message.get("op")
+        handler = getattr(self, f"_{op}", None) if isinstance(op, str) else None
+        if handler is None:
+            return {"error": f"Unknown request: {op!r}"}
+        try:
+            return handler(message)
+        except (KeyError, TypeError, ValueError) as e:
+            self._staged = {}
+            return {"error": str(e)}
+
+    def _suffix_keys(self, start: int) -> SuffixFingerprints:
+        entries = self.ledger.entries
+        cached = self._suffix
+        if cached is None or cached[:3] != (start, entries, len(entries)):
+            cached = self._suffix = (start, entries, len(entries),
+                                     SuffixFingerprints(entries[start - 1:]))
+        return cached[3]
+
+    def _hello(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        if message["capsule_id"] != self.ledger.capsule_id:
+            raise ReplicationError(f"This is a replica of '{self.ledger.capsule_id}'")
+        fingerprints = ledger_fingerprints(self.ledger)
+        common = min(message["length"], len(fingerprints))
+        return {"length": len(fingerprints), "fingerprint": _hex(fingerprints.fingerprint(1, common + 1))}
+
+    def _fingerprints(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        fingerprints = ledger_fingerprints(self.ledger)
+        ranges = [(start, min(stop, len(fingerprints) + 1)) for start, stop in message["ranges"]]
+        if any(start < 1 or stop < start for start, stop in ranges):
+            raise ReplicationError("Ranges must lie within the ledger")
+        return {"fingerprints": [_hex(fingerprints.fingerprint(start, stop)) for start, stop in ranges]}
+
+    def _key_fingerprints(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        suffix = self._suffix_keys(message["start"])
+        ranges = []
+        for lo, hi in message["ranges"]:
+            fingerprint, count = suffix.fingerprint(lo, hi)
+            reply = {"fingerprint": _hex(fingerprint), "count": count}
+            if count <= LEAF_SIZE:
+                reply["keys"] = suffix.range_keys(lo, hi)
+            ranges.append(reply)
+        return {"ranges": ranges}
+
+    def _keys(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        suffix = self._suffix_keys(message["start"])
+        return {"keys": suffix.range_keys(message["lo"], message["hi"], self.max_batch)}
+
+    def _entries(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        if "keys" in message:
+            by_key = self._suffix_keys(message["start"]).by_key
+            keys = message["keys"][:self.max_batch]
+            return {"entries": [by_key[key].to_dict() for key in keys]}
+        start = max(1, message["start"])
+        stop = min(message["stop"], start + self.max_batch)
+        return {"entries": [entry.to_dict() for entry in self.ledger.entries[start - 1:stop - 1]]}
+
+    def _push(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        entries = message["entries"]
+        if len(entries) > self.max_batch:
+            raise ReplicationError(f"At most {self.max_batch} entries per push")
+        self.ledger.append_replicated(LedgerEntry.from_dict(data) for data in entries)
+        return {"length": len(self.ledger.entries)}
+
+    def _merge(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        """Stage entries for a merge from ``start``; the last batch applies it."""
+        entries = message["entries"]
+        if len(entries) > self.max_batch:
+            raise ReplicationError(f"At most {self.max_batch} entries per merge batch")
+        for data in entries:
+            entry = LedgerEntry.from_dict(data)
+            self._staged[entry_key(entry)] = entry
+        if not message.get("done"):
+            return {"staged": len(self._staged)}
+
+        start = message["start"]
+        staged, self._staged = self._staged, {}
+        suffix = resequence(merge_suffixes(self.ledger.entries[start - 1:], staged.values()), start)
+        if (start - 1 + len(suffix) != message["length"]
+                or _hex(merged_fingerprint(self.ledger, start, suffix)) != message["fingerprint"]):
+            raise ReplicationError("Merged ledgers differ; the replica changed during reconciliation")
+        self.ledger.replace_suffix(start, suffix)
+        self.rewritten_from = start
+        return {"length": len(self.ledger.entries)}
+
+
+class Transport:
+    """Carries one request to a peer and returns its reply."""
+
+    def request(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        raise NotImplementedError
+
+
+class LoopbackTransport(Transport):
+    """In-process transport to a ``ReplicaPeer``, with wire-size accounting."""
+
+    def __init__(self, peer: ReplicaPeer):
+        self.peer = peer
+        self.round_trips = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    def request(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        data = json.dumps(message).encode()
+        self.round_trips += 1
+        self.bytes_sent += len(data)
+        reply = json.dumps(self.peer.handle(json.loads(data))).encode()
+        self.bytes_received += len(reply)
+        return json.loads(reply)
+
+
+@dataclass
+class SyncResult:
+    """What one ``reconcile`` call found and copied."""
+    pulled: int = 0
+    pushed: int = 0
+    merged_from: Optional[int] = None  # both diverged: entries from here on were re-sequenced
+    round_trips: int = 0
+    fingerprints: int = 0              # range fingerprints compared
+
+
+class _Session:
+    def __init__(self, transport: Transport, result: SyncResult):
+        self.transport = transport
+        self.result = result
+
+    def call(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        self.result.round_trips += 1
+        reply = self.transport.request(message)
+        if "error" in reply:
+            raise ReplicationError(reply["error"])
+        return reply
+
+
+def _find_fork(fingerprints: RangeFingerprints, session: _Session, start: int, stop: int,
+               fanout: int) -> int:
+    """First sequence number in ``[start, stop)`` that differs; the range is known to differ."""
+    while stop - start > 1:
+        ranges = split_range(start, stop, fanout)
+        reply = session.call({"op": "fingerprints", "ranges": ranges})
+        session.result.fingerprints += len(ranges)
+        for (lo, hi), remote in zip(ranges, reply["fingerprints"]):
+            if _hex(fingerprints.fingerprint(lo, hi)) != remote:
+                start, stop = lo, hi
+                break
+        else:
+            raise ReplicationError("Peer replica changed during reconciliation")
+    return start
+
+
+def _diff_suffixes(local: SuffixFingerprints, session: _Session, start: int,
+                   fanout: int) -> Tuple[List[str], List[str]]:
+    """Keys of the suffix entries (from ``start``) missing here and missing on the peer."""
+    missing_here: List[str] = []
+    missing_there: List[str] = []
+
+    def settle(lo: str, hi: Optional[str], remote_keys: List[str]) -> None:
+        mine = set(local.range_keys(lo, hi))
+        missing_here.extend(key for key in remote_keys if key not in mine)
+        missing_there.extend(sorted(mine.difference(remote_keys)))
+
+    pending: List[KeyRange] = [("", None)]
+    while pending:
+        reply = session.call({"op": "key_fingerprints", "start": start, "ranges": pending})
+        session.result.fingerprints += len(pending)
+        split: List[KeyRange] = []
+        for (lo, hi), remote in zip(pending, reply["ranges"]):
+            fingerprint, count = local.fingerprint(lo, hi)
+            if _hex(fingerprint) == remote["fingerprint"] and count == remote["count"]:
+                continue
+            if "keys" in remote:
+                settle(lo, hi, remote["keys"])
+            elif count <= LEAF_SIZE:
+                # Few here, many there: nearly all of them are missing, so list them
+                remote_keys: List[str] = []
+                cursor = lo
+                while True:
+                    page = session.call({"op": "keys", "start": start, "lo": cursor, "hi": hi})["keys"]
+                    remote_keys.extend(page)
+                    if not page or len(remote_keys) >= remote["count"]:
+                        break
+                    cursor = page[-1] + "\0"
+                settle(lo, hi, remote_keys)
+            else:
+                split.extend(local.split(lo, hi, fanout))
+        pending = split
+    return missing_here, missing_there
+
+
+def reconcile(ledger: Ledger, transport: Transport, fanout: int = FANOUT,
+              batch_size: int = BATCH_SIZE) -> SyncResult:
+    """
+    Bring ``ledger`` and the replica behind ``transport`` to the same history.
+    Only entries the other side lacks are sent; if both sides appended since
+    they last agreed, both re-sequence their entries from the fork on.
+    """
+    result = SyncResult()
+    session = _Session(transport, result)
+    fanout = max(2, fanout)
+    fingerprints = ledger_fingerprints(ledger)
+    length = len(fingerprints)
+    hello = session.call({"op": "hello", "capsule_id": ledger.capsule_id, "length": length})
+    remote_length = hello["length"]
+    common = min(length, remote_length)
+    result.fingerprints += 1
+    fork = common + 1
+    if _hex(fingerprints.fingerprint(1, fork)) != hello["fingerprint"]:
+        fork = _find_fork(fingerprints, session, 1, fork, fanout)
+
+    if fork > remote_length:
+        # Only this side appended: the peer appends our entries
+        while remote_length < length:
+            batch = ledger.entries[remote_length:remote_length + batch_size]
+            reply = session.call({"op": "push", "entries": [entry.to_dict() for entry in batch]})
+            remote_length = reply["length"]
+            result.pushed += len(batch)
+        return result
+
+    if fork > length:
+        # Only the peer appended: append its entries
+        while length < remote_length:
+            stop = min(remote_length + 1, length + 1 + batch_size)
+            reply = session.call({"op": "entries", "start": length + 1, "stop": stop})
+            if not reply["entries"]:
+                break
+            pulled = ledger.append_replicated(LedgerEntry.from_dict(data) for data in reply["entries"])
+            length += len(pulled)
+            result.pulled += len(pulled)
+        return result
+
+    # Both appended: exchange what each suffix lacks, then merge on both sides
+    local = SuffixFingerprints(ledger.entries[fork - 1:])
+    missing_here, missing_there = _diff_suffixes(local, session, fork, fanout)
+    pulled: List[LedgerEntry] = []
+    for i in range(0, len(missing_here), batch_size):
+        reply = session.call({"op": "entries", "start": fork, "keys": missing_here[i:i + batch_size]})
+        pulled.extend(LedgerEntry.from_dict(data) for data in reply["entries"])
+    if len(pulled) != len(missing_here):
+        raise ReplicationError("Peer replica changed during reconciliation")
+
+    suffix = resequence(merge_suffixes(ledger.entries[fork - 1:], pulled), fork)
+    final = {"length": fork - 1 + len(suffix),
+             "fingerprint": _hex(merged_fingerprint(ledger, fork, suffix))}
+    batches = [missing_there[i:i + batch_size] for i in range(0, len(missing_there), batch_size)] or [[]]
+    for n, keys in enumerate(batches, 1):
+        message = {"op": "merge", "start": fork, "entries": [local.by_key[key].to_dict() for key in keys]}
+        if n == len(batches):
+            message.update(final, done=True)
+        session.call(message)
+    ledger.replace_suffix(fork, suffix)
+
+    result.pulled = len(pulled)
+    result.pushed = len(missing_there)
+    result.merged_from = fork
+    return result
@@ -0,0 +1,231 @@
+"""
+Trust graph - network-level reachability over capsule relationships.
+
+Directed edges ``capsule -> peer`` come from the peers each capsule trusts.
+Adjacency is stored in compressed sparse row (CSR) arrays; trust toggles land
+in a small overlay of added/removed edges that is folded back into the CSR
+arrays once it grows past a threshold. k-hop reachability sets are cached
+and only the cached results that could have traversed a changed edge are
+invalidated.
+"""
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from typing import Callable, Dict, FrozenSet, Iterable, List, Optional, Sequence, Set, Tuple
+
+from src.core.capsule import Capsule
+from src.core.relationships import RelationshipState
+
+try:
+    from scipy.sparse import csr_matrix
+except ImportError:  # pragma: no cover - optional dependency
+    csr_matrix = None
+
+
+class TrustGraph:
+    def __init__(
+        self,
+        edges: Iterable[Tuple[str, str]] = (),
+        cache_size: int = 4096,
+        compact_threshold: int = 1024,
+    ):
+        self.cache_size = cache_size
+        self.compact_threshold = compact_threshold
+        self._ids: Dict[str, int] = {}
+        self._names: List[str] = []
+
+        self._indptr = array("q", [0])
+        self._indices = array("q")
+        self._added: Dict[int, Set[int]] = {}
+        self._removed: Dict[int, Set[int]] = {}
+        self._delta = 0
+
+        self._cache: "OrderedDict[Tuple[int, Optional[int]], FrozenSet[int]]" = OrderedDict()
+        self._watched: Dict[str, Callable[[str, int, int], None]] = {}
+
+        adjacency: Dict[int, Set[int]] = {}
+        for source, target in edges:
+            adjacency.setdefault(self._node(source), set()).add(self._node(target))
+        self._build(adjacency)
+
+    @classmethod
+    def from_capsules(
+        cls,
+        capsules: Iterable[Capsule],
+        states: Sequence[str] = ("trusted",),
+        watch: bool = False,
+        **kwargs
+    ) -> "TrustGraph":
+        """Build from the relationships of ``capsules`` (optionally following later toggles)."""
+        capsules = list(capsules)
+        edges = [
+            (capsule.capsule_id, peer)
+            for capsule in capsules
+            for state in states
+            for peer in capsule.relationships.peers_with(state)
+        ]
+        graph = cls(edges, **kwargs)
+        if watch:
+            for capsule in capsules:
+                graph.watch(capsule, states)
+        return graph
+
+    # -- structure -------------------------------------------------------
+
+    def _node(self, name: str) -> int:
+        node = self._ids.get(name)
+        if node is None:
+            node = len(self._names)
+            self._ids[name] = node
+            self._names.append(name)
+        return node
+
+    def _build(self, adjacency: Dict[int, Set[int]]) -> None:
+        indptr = array("q", [0])
+        indices = array("q")
+        for node in range(len(self._names)):
+            indices.extend(sorted(adjacency.get(node, ())))
+            indptr.append(len(indices))
+        self._indptr = indptr
+        self._indices = indices
+        self._added = {}
+        self._removed = {}
+        self._delta = 0
+
+    def _base_range(self, node: int) -> Tuple[int, int]:
+        if node + 1 < len(self._indptr):
+            return self._indptr[node], self._indptr[node + 1]
+        return 0, 0
+
+    def _has_base_edge(self, source: int, target: int) -> bool:
+        lo, hi = self._base_range(source)
+        i = bisect_left(self._indices, target, lo, hi)
+        return i < hi and self._indices[i] == target
+
+    def _neighbours(self, node: int) -> Iterable[int]:
+        lo, hi = self._base_range(node)
+        removed = self._removed.get(node)
+        if removed:
+            yield from (v for v in self._indices[lo:hi] if v not in removed)
+        else:
+            yield from self._indices[lo:hi]
+        added = self._added.get(node)
+        if added:
+            yield from added
+
+    def _edges(self) -> Dict[int, Set[int]]:
+        return {node: set(self._neighbours(node)) for node in range(len(self._names))}
+
+    def has_edge(self, source: str, target: str) -> bool:
+        u, v = self._ids.get(source), self._ids.get(target)
+        if u is None or v is None:
+            return False
+        if v in self._added.get(u, ()):
+            return True
+        return self._has_base_edge(u, v) and v not in self._removed.get(u, ())
+
+    def set_edge(self, source: str, target: str, present: bool) -> None:
+        """Add or remove the edge ``source -> target``."""
+        if self.has_edge(source, target) == present:
+            return
+        u, v = self._node(source), self._node(target)
+        in_base = self._has_base_edge(u, v)
+        if present:
+            if in_base:
+                self._removed[u].discard(v)
+            else:
+                self._added.setdefault(u, set()).add(v)
+        else:
+            if in_base:
+                self._removed.setdefault(u, set()).add(v)
+            else:
+                self._added[u].discard(v)
+        self._invalidate(u)
+        self._delta += 1
+        if self._delta >= self.compact_threshold:
+            self.compact()
+
+    def compact(self) -> None:
+        """Fold the overlay of toggled edges back into the CSR arrays."""
+        if self._delta:
+            self._build(self._edges())
+
+    def watch(self, capsule: Capsule, states: Sequence[str] = ("trusted",)) -> None:
+        """Follow relationship toggles of ``capsule``."""
+        mask = 0
+        for state in states:
+            mask |= RelationshipState[state.upper()]
+        source = capsule.capsule_id
+
+        def on_change(peer_id: str, old_bits: int, new_bits: int) -> None:
+            if (old_bits & mask) != (new_bits & mask):
+                self.set_edge(source, peer_id, bool(new_bits & mask))
+
+        capsule.relationships.add_listener(on_change)
+        self._watched[source] = on_change
+
+    def unwatch(self, capsule: Capsule) -> None:
+        listener = self._watched.pop(capsule.capsule_id, None)
+        if listener is not None:
+            capsule.relationships.remove_listener(listener)
+
+    def to_scipy(self):
+        """Adjacency as a ``scipy.sparse.csr_matrix`` (requires SciPy)."""
+        if csr_matrix is None:
+            raise ImportError("scipy is required for TrustGraph.to_scipy()")
+        self.compact()
+        n = len(self._names)
+        return csr_matrix(([1] * len(self._indices), self._indices, self._indptr), shape=(n, n))
+
+    # -- queries ---------------------------------------------------------
+
+    def _invalidate(self, node: int) -> None:
+        # A BFS only follows out-edges of nodes it reached
+        stale = [key for key, reached in self._cache.items() if node in reached]
+        for key in stale:
+            del self._cache[key]
+
+    def _reach(self, source: int, max_hops: Optional[int]) -> FrozenSet[int]:
+        key = (source, max_hops)
+        reached = self._cache.get(key)
+        if reached is not None:
+            self._cache.move_to_end(key)
+            return reached
+
+        seen = {source}
+        frontier = [source]
+        hops = 0
+        while frontier and (max_hops is None or hops < max_hops):
+            next_frontier = []
+            for node in frontier:
+                for neighbour in self._neighbours(node):
+                    if neighbour not in seen:
+                        seen.add(neighbour)
+                        next_frontier.append(neighbour)
+            frontier = next_frontier
+            hops += 1
+
+        reached = frozenset(seen)
+        self._cache[key] = reached
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return reached
+
+    def reachable(self, source: str, max_hops: Optional[int] = None) -> Set[str]:
+        """Capsules reachable from ``source`` within ``max_hops`` trust hops (excluding itself)."""
+        node = self._ids.get(source)
+        if node is None:
+            return set()
+        return {self._names[n] for n in self._reach(node, max_hops) if n != node}
+
+    def is_reachable(self, source: str, target: str, max_hops: Optional[int] = None) -> bool:
+        node, other = self._ids.get(source), self._ids.get(target)
+        if node is None or other is None:
+            return False
+        return other in self._reach(node, max_hops)
+
+    def neighbourhood_size(self, source: str, max_hops: Optional[int] = None) -> int:
+        node = self._ids.get(source)
+        if node is None:
+            return 0
+        return len(self._reach(node, max_hops)) - 1
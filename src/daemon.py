@@ -0,0 +1,122 @@
+"""
+Node daemon - one long-running process serving CLI commands.
+
+The daemon listens on a Unix domain socket in the data directory. Each
+request is one line of JSON (``{"argv": [...]}``) answered by one line of
+JSON (``{"output": ..., "exit_code": ...}``). Requests are handled one at a
+time, so the daemon is the single writer of the data directory while it
+runs and can keep capsules, ledgers and invitation indexes in memory.
+"""
+import json
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# socket/socketserver/threading are imported on use: the CLI imports this
+# module on every invocation to look for a running daemon.
+
+SOCKET_NAME = "node.sock"
+
+# execute(argv) -> (output, exit_code)
+Executor = Callable[[List[str]], Tuple[str, int]]
+
+
+def socket_path(data_dir: Path) -> Path:
+    return Path(data_dir) / SOCKET_NAME
+
+
+class DaemonError(RuntimeError):
+    """A daemon accepted a request but did not answer it."""
+
+
+def request(path: Path, payload: Dict[str, Any], timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+    """
+    Send one request. Returns ``None`` when no daemon is listening at ``path``.
+
+    Once connected, a missing or broken reply raises ``DaemonError``: the
+    request may have run, so it must not be retried elsewhere.
+    """
+    if not path.exists():
+        return None
+    import socket
+    if not hasattr(socket, "AF_UNIX"):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(str(path))
+    except (ConnectionRefusedError, FileNotFoundError):
+        sock.close()
+        return None
+    try:
+        with sock, sock.makefile("rwb") as stream:
+            stream.write(json.dumps(payload).encode() + b"\n")
+            stream.flush()
+            line = stream.readline()
+        if not line:
+            raise DaemonError(f"The daemon at {path} closed the connection without answering")
+        return json.loads(line)
+    except (OSError, ValueError) as e:
+        raise DaemonError(f"Lost the daemon at {path}: {e}") from e
+
+
+def forward(data_dir: Path, argv: List[str]) -> Optional[Tuple[str, int]]:
+    """Run a CLI command in the daemon, if one is running for ``data_dir``."""
+    response = request(socket_path(data_dir), {"argv": argv})
+    if response is None:
+        return None
+    return response["output"], response["exit_code"]
+
+
+def is_running(data_dir: Path) -> bool:
+    try:
+        return request(socket_path(data_dir), {"ping": True}, timeout=2.0) is not None
+    except DaemonError:
+        return True  # something accepts connections there, even if it does not answer
+
+
+def stop(data_dir: Path) -> bool:
+    return request(socket_path(data_dir), {"shutdown": True}, timeout=5.0) is not None
+
+
+class NodeDaemon:
+    def __init__(self, data_dir: Path, execute: Executor):
+        import socketserver
+
+        path = socket_path(data_dir)
+        if is_running(data_dir):
+            raise RuntimeError(f"A daemon is already listening on {path}")
+        if path.exists():
+            path.unlink()  # left behind by a daemon that did not shut down cleanly
+        self.path = path
+        self.execute = execute
+        # Any callable works as the handler "class"
+        self._server = socketserver.UnixStreamServer(str(path), self._handle)
+
+    def _handle(self, sock, client_address, server) -> None:
+        with sock.makefile("rwb") as stream:
+            line = stream.readline()
+            if not line:
+                return
+            payload = json.loads(line)
+            if payload.get("shutdown"):
+                import threading
+                response = {"output": "", "exit_code": 0}
+                # shutdown() waits for serve_forever(), which is running this handler
+                threading.Thread(target=self._server.shutdown).start()
+            elif payload.get("ping"):
+                response = {"output": "", "exit_code": 0}
+            else:
+                output, exit_code = self.execute(payload["argv"])
+                response = {"output": output, "exit_code": exit_code}
+            stream.write(json.dumps(response).encode() + b"\n")
+
+    def serve(self) -> None:
+        try:
+            self._server.serve_forever()
+        finally:
+            self.server_close()
+
+    def server_close(self) -> None:
+        self._server.server_close()
+        if self.path.exists():
+            self.path.unlink()
@@ -1,7 +1,24 @@
 """
 Event system for Hivra CapsuleNet V1.
 """
-from src.events.base import Event
+from src.events.base import (
+    Event,
+    InviteEvent,
+    StarterEvent,
+    UserActionEvent,
+    UserActionType,
+    get_event_class,
+    register_event_type,
+)
 from src.events.factories import create_invitation_event
 
-__all__ = ['Event', 'create_invitation_event']
+__all__ = [
+    'Event',
+    'InviteEvent',
+    'StarterEvent',
+    'UserActionEvent',
+    'UserActionType',
+    'create_invitation_event',
+    'get_event_class',
+    'register_event_type',
+]
@@ -1,43 +1,196 @@
 """
 Simple Event system for Hivra V1.
+
+Events are ``__slots__`` classes: the common header (type, id, timestamp,
+source) and each typed event's payload live in fixed slots, and the free-form
+``metadata`` dict is only allocated when something touches it.
 """
-from dataclasses import dataclass, field
-from typing import Dict, Any
+import sys
+from enum import Enum
+from typing import Dict, Any, Optional, Tuple, Type
 from datetime import datetime
 from uuid import uuid4
 
+from src.clock import now_ns, ns_to_datetime, datetime_to_ns, parse_timestamp
+
+
+_EVENT_TYPES: Dict[str, Type["Event"]] = {}
+
+
+def register_event_type(cls: Type["Event"]) -> Type["Event"]:
+    """Class decorator registering a typed event for deserialization and bus routing."""
+    existing = _EVENT_TYPES.get(cls.EVENT_TYPE)
+    if existing is not None and existing is not cls:
+        raise ValueError(f"Event type '{cls.EVENT_TYPE}' already registered by {existing.__name__}")
+    _EVENT_TYPES[cls.EVENT_TYPE] = cls
+    return cls
+
+
+def get_event_class(event_type: str) -> Type["Event"]:
+    """Class registered for ``event_type``; plain ``Event`` if none."""
+    return _EVENT_TYPES.get(event_type, Event)
+
 
-@dataclass
 class Event:
     """Simple event with all default fields."""
-    event_type: str = "event"
-    event_id: str = field(default_factory=lambda: str(uuid4()))
-    timestamp: datetime = field(default_factory=datetime.utcnow)
-    metadata: Dict[str, Any] = field(default_factory=dict)
-    
+    __slots__ = ("event_type", "event_id", "timestamp_ns", "source", "_metadata")
+
+    EVENT_TYPE = "event"
+    # Typed payload fields, serialized next to the header
+    FIELDS: Tuple[str, ...] = ()
+
+    def __init__(
+        self,
+        event_type: Optional[str] = None,
+        event_id: Optional[str] = None,
+        timestamp_ns: Optional[int] = None,
+        metadata: Optional[Dict[str, Any]] = None,
+        source: Optional[str] = None,
+    ):
+        self.event_type = event_type or self.EVENT_TYPE
+        self.event_id = event_id or str(uuid4())
+        self.timestamp_ns = now_ns() if timestamp_ns is None else timestamp_ns
+        self.source = source
+        self._metadata = metadata or None
+
+    @property
+    def id(self) -> str:
+        return self.event_id
+
+    @property
+    def metadata(self) -> Dict[str, Any]:
+        """Free-form metadata, allocated on first access."""
+        if self._metadata is None:
+            self._metadata = {}
+        return self._metadata
+
+    @metadata.setter
+    def metadata(self, value: Optional[Dict[str, Any]]) -> None:
+        self._metadata = value or None
+
+    @property
+    def timestamp(self) -> datetime:
+        """Timestamp rendered as a naive UTC datetime."""
+        return ns_to_datetime(self.timestamp_ns)
+
+    @timestamp.setter
+    def timestamp(self, value: datetime) -> None:
+        self.timestamp_ns = datetime_to_ns(value)
+
+    def _field_value(self, name: str) -> Any:
+        value = getattr(self, name)
+        return value.value if isinstance(value, Enum) else value
+
     def to_dict(self) -> Dict[str, Any]:
-        return {
+        data = {
             "event_type": self.event_type,
             "event_id": self.event_id,
-            "timestamp": self.timestamp.isoformat(),
-            "metadata": self.metadata
+            "timestamp_ns": self.timestamp_ns,
+            "metadata": self._metadata or {},
         }
-    
+        if self.source is not None:
+            data["source"] = self.source
+        for name in self.FIELDS:
+            data[name] = self._field_value(name)
+        return data
+
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> "Event":
-        timestamp = data.get("timestamp")
-        if timestamp:
-            timestamp = datetime.fromisoformat(timestamp)
-        else:
-            timestamp = None
-        
-        event_id = data.get("event_id")
-        if not event_id:
-            event_id = str(uuid4())
-        
+        # Type names and sources repeat across a ledger; share one string each
+        event_type = sys.intern(data.get("event_type", cls.EVENT_TYPE))
+        source = data.get("source")
+        if cls is Event:
+            cls = get_event_class(event_type)
+
+        timestamp_ns = parse_timestamp(data)
+        fields = {name: data[name] for name in cls.FIELDS if name in data}
+
         return cls(
-            event_type=data.get("event_type", "event"),
-            event_id=event_id,
-            timestamp=timestamp or datetime.utcnow(),
-            metadata=data.get("metadata", {})
+            event_type=event_type,
+            event_id=data.get("event_id"),
+            timestamp_ns=timestamp_ns,
+            metadata=data.get("metadata"),
+            source=sys.intern(source) if source else source,
+            **fields
         )
+
+    def __eq__(self, other: Any) -> bool:
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.FIELDS)
+        header = f"event_type={self.event_type!r}, event_id={self.event_id!r}, source={self.source!r}"
+        return f"{self.__class__.__name__}({header}{', ' if fields else ''}{fields})"
+
+
+class UserActionType(Enum):
+    """User-initiated actions (spec §2)."""
+    ACCEPT_INVITE = "accept_invite"
+    REJECT_INVITE = "reject_invite"
+    TOGGLE_STATE = "toggle_state"
+
+
+@register_event_type
+class InviteEvent(Event):
+    """Connection offer from one capsule to another."""
+    __slots__ = ("sender_capsule_id", "target_capsule_id", "sender_starter_id")
+
+    EVENT_TYPE = "invite"
+    FIELDS = __slots__
+
+    def __init__(
+        self,
+        sender_capsule_id: Optional[str] = None,
+        target_capsule_id: Optional[str] = None,
+        sender_starter_id: Optional[str] = None,
+        **kwargs: Any
+    ):
+        super().__init__(**kwargs)
+        self.sender_capsule_id = sender_capsule_id
+        self.target_capsule_id = target_capsule_id
+        self.sender_starter_id = sender_starter_id
+
+
+@register_event_type
+class UserActionEvent(Event):
+    """AcceptInvite / RejectInvite / ToggleState issued by the user."""
+    __slots__ = (
+        "action_type", "target_capsule_id", "invite_sender_id",
+        "invite_starter_id", "state_name",
+    )
+
+    EVENT_TYPE = "user_action"
+    FIELDS = __slots__
+
+    def __init__(
+        self,
+        action_type: Any = UserActionType.TOGGLE_STATE,
+        target_capsule_id: Optional[str] = None,
+        invite_sender_id: Optional[str] = None,
+        invite_starter_id: Optional[str] = None,
+        state_name: Optional[str] = None,
+        **kwargs: Any
+    ):
+        super().__init__(**kwargs)
+        self.action_type = UserActionType(action_type)
+        self.target_capsule_id = target_capsule_id
+        self.invite_sender_id = invite_sender_id
+        self.invite_starter_id = invite_starter_id
+        self.state_name = state_name
+
+
+@register_event_type
+class StarterEvent(Event):
+    """Universal toggle event carrying a starter."""
+    __slots__ = ("starter_id",)
+
+    EVENT_TYPE = "starter"
+    FIELDS = __slots__
+
+    def __init__(self, starter_id: Optional[str] = None, **kwargs: Any):
+        super().__init__(**kwargs)
+        self.starter_id = starter_id
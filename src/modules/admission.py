@@ -0,0 +1,136 @@
+"""
+Admission control for incoming invitations.
+
+Token buckets per sender and per recipient plus a global cap on invitations
+in flight. ``admit`` is a few dict lookups and integer arithmetic, so floods
+are turned away before anything touches the ledger or the invitation store.
+"""
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+from src.clock import Clock, get_clock
+from src.core.capsule import CapsuleType
+
+
+NS_PER_SECOND = 1_000_000_000
+
+
+@dataclass(frozen=True)
+class AdmissionPolicy:
+    """Limits applied to invitations addressed to one capsule type."""
+    sender_rate: float = 1.0       # invitations per second a sender may send
+    sender_burst: int = 30
+    recipient_rate: float = 5.0    # invitations per second a recipient accepts
+    recipient_burst: int = 100
+    max_in_flight: int = 100_000   # pending invitations across all capsules
+
+
+DEFAULT_POLICIES: Dict[CapsuleType, AdmissionPolicy] = {
+    CapsuleType.PROTO: AdmissionPolicy(),
+    CapsuleType.LINKED: AdmissionPolicy(),
+    CapsuleType.GENESIS: AdmissionPolicy(sender_rate=0.5, sender_burst=10),
+}
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated_ns")
+
+    def __init__(self, tokens: float, updated_ns: int):
+        self.tokens = tokens
+        self.updated_ns = updated_ns
+
+    def try_take(self, rate: float, burst: int, now_ns: int) -> bool:
+        elapsed = now_ns - self.updated_ns
+        if elapsed > 0:
+            self.tokens = min(float(burst), self.tokens + elapsed * rate / NS_PER_SECOND)
+            self.updated_ns = now_ns
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        return False
+
+
+class AdmissionController:
+    """
+    Decides whether an invitation may enter the system.
+
+    Buckets are kept in LRU order and bounded by ``max_buckets``; an evicted
+    bucket simply comes back full, which only ever errs towards admitting.
+    """
+
+    def __init__(
+        self,
+        policies: Optional[Dict[CapsuleType, AdmissionPolicy]] = None,
+        clock: Optional[Clock] = None,
+        max_buckets: int = 100_000,
+    ):
+        self.policies = dict(DEFAULT_POLICIES)
+        if policies:
+            self.policies.update(policies)
+        self.max_buckets = max_buckets
+        self.in_flight = 0
+        self._clock = clock
+        self._buckets: "OrderedDict[Tuple[str, str], TokenBucket]" = OrderedDict()
+
+    def policy_for(self, capsule_type: CapsuleType) -> AdmissionPolicy:
+        return self.policies.get(capsule_type, DEFAULT_POLICIES[CapsuleType.PROTO])
+
+    def _take(self, key: Tuple[str, str], rate: float, burst: int, now_ns: int) -> bool:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(float(burst), now_ns)
+            self._buckets[key] = bucket
+            if len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket.try_take(rate, burst, now_ns)
+
+    def admit(
+        self,
+        sender_id: str,
+        recipient_id: str,
+        recipient_type: CapsuleType = CapsuleType.PROTO,
+    ) -> Optional[str]:
+        """
+        Admit one invitation. Returns ``None`` when admitted, otherwise the
+        reason for rejection. Admitted invitations count as in flight until
+        ``release`` is called.
+        """
+        policy = self.policy_for(recipient_type)
+        if self.in_flight >= policy.max_in_flight:
+            return "too many pending invitations"
+
+        now_ns = (self._clock or get_clock()).now_ns()
+        # Sender first, so a flooding sender drains only its own bucket
+        if not self._take(("sender", sender_id), policy.sender_rate,
+                          policy.sender_burst, now_ns):
+            return f"{sender_id} is sending invitations too fast"
+        if not self._take(("recipient", recipient_id), policy.recipient_rate,
+                          policy.recipient_burst, now_ns):
+            return f"{recipient_id} is receiving too many invitations"
+
+        self.in_flight += 1
+        return None
+
+    def release(self, count: int = 1) -> None:
+        """Invitations left the pending state (accepted, rejected, expired)."""
+        self.in_flight = max(0, self.in_flight - count)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self.in_flight,
+            "buckets": [
+                [kind, key, bucket.tokens, bucket.updated_ns]
+                for (kind, key), bucket in self._buckets.items()
+            ],
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], **kwargs: Any) -> "AdmissionController":
+        controller = cls(**kwargs)
+        controller.in_flight = data.get("in_flight", 0)
+        for kind, key, tokens, updated_ns in data.get("buckets", []):
+            controller._buckets[(kind, key)] = TokenBucket(tokens, updated_ns)
+        return controller
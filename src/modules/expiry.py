@@ -0,0 +1,90 @@
+"""
+Invitation expiry - how long invitations stay pending, per capsule type.
+
+New invitations are stamped with an ``expires_ns`` deadline from the policy
+of the recipient's capsule type. Expired invitations are found through the
+store's expiry index and swept in one pass: each gets an
+``invitation_expired`` event in its sender's ledger and withdraws its offer
+of the starter, which is held again once no other invitation offers it.
+"""
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional
+
+from src.core.capsule import CapsuleType
+from src.core.ledger import Ledger
+from src.core.registry import StarterRegistry
+from src.events import Event
+
+
+NS_PER_SECOND = 1_000_000_000
+DAY = 24 * 60 * 60
+
+
+@dataclass(frozen=True)
+class ExpiryPolicy:
+    """Time-to-live of invitations addressed to one capsule type."""
+    ttl_seconds: Optional[float] = 7 * DAY   # None: never expire
+
+    def expires_ns(self, created_ns: int) -> Optional[int]:
+        if self.ttl_seconds is None:
+            return None
+        return created_ns + int(self.ttl_seconds * NS_PER_SECOND)
+
+
+DEFAULT_EXPIRY_POLICIES: Dict[CapsuleType, ExpiryPolicy] = {
+    CapsuleType.PROTO: ExpiryPolicy(),
+    CapsuleType.LINKED: ExpiryPolicy(),
+    CapsuleType.GENESIS: ExpiryPolicy(),
+}
+
+
+def expiry_policy_for(
+    capsule_type: CapsuleType,
+    policies: Optional[Dict[CapsuleType, ExpiryPolicy]] = None,
+) -> ExpiryPolicy:
+    policies = policies or DEFAULT_EXPIRY_POLICIES
+    return policies.get(capsule_type, DEFAULT_EXPIRY_POLICIES[CapsuleType.PROTO])
+
+
+def legacy_expiry_ns(invitation: Dict, policy: ExpiryPolicy) -> Optional[int]:
+    """
+    Deadline for an invitation written before expiry existed, counted from
+    its ``timestamp`` (local time, as the CLI writes it).
+    """
+    try:
+        sent = datetime.strptime(invitation['timestamp'], "%Y-%m-%d %H:%M:%S")
+    except (KeyError, TypeError, ValueError):
+        return None
+    return policy.expires_ns(int(sent.timestamp()) * NS_PER_SECOND)
+
+
+def record_expiry(
+    expired: Iterable[Dict],
+    load_ledger: Callable[[str], Ledger],
+    registry: StarterRegistry,
+) -> Dict[str, Ledger]:
+    """
+    Record ``expired`` invitations in their senders' ledgers.
+
+    Each withdraws one offer of its starter in ``registry`` (updated in
+    place); returns the ledgers appended to, by sender, for the caller to save.
+    """
+    events: Dict[str, List] = {}
+    for invitation in expired:
+        event = Event(event_type="invitation_expired")
+        event.metadata.update({
+            "invitation_id": invitation['id'],
+            "recipient": invitation['recipient'],
+            "slot": invitation['slot'],
+            "starter_id": invitation['starter_id'],
+        })
+        events.setdefault(invitation['sender'], []).append((event, ["invitation", "expired"]))
+        registry.withdraw_offer(invitation['starter_id'], event.event_id)
+
+    ledgers = {}
+    for sender_id, sender_events in events.items():
+        ledger = load_ledger(sender_id)
+        ledger.append_many(sender_events)
+        ledgers[sender_id] = ledger
+    return ledgers
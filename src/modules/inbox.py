@@ -0,0 +1,156 @@
+"""
+Batch inbox processing - accept/reject many pending invitations in one pass.
+
+Slot availability is read once from the capsule and tracked as a bitmask
+while the batch is decided; ledger events are appended together at the end
+and every touched object is reported so the caller can persist each once.
+
+Rules (spec §4, §7):
+- Accept needs an empty slot, which gets a new own starter; the sender keeps
+  the starter it offered.
+- Reject with an empty slot burns the sender's starter (the only change to
+  a sender's capsule).
+- Reject with an occupied slot only clears the invitation.
+"""
+from typing import Callable, Dict, List, Optional, Tuple
+
+from src.core.capsule import Capsule, allocate_starter_ids, slot_index
+from src.core.ledger import Ledger
+from src.core.registry import StarterConflictError, StarterRegistry
+from src.events import Event
+
+
+ACCEPT = "accept"
+REJECT = "reject"
+
+# decide(invitation, slot_empty) -> ACCEPT, REJECT or None (leave pending)
+InboxPolicy = Callable[[Dict, bool], Optional[str]]
+
+
+def accept_if_empty(invitation: Dict, slot_empty: bool) -> Optional[str]:
+    """Accept into empty slots; leave the rest pending."""
+    return ACCEPT if slot_empty else None
+
+
+def accept_if_empty_else_reject(invitation: Dict, slot_empty: bool) -> Optional[str]:
+    """Accept into empty slots; reject (without burn) the rest."""
+    return ACCEPT if slot_empty else REJECT
+
+
+def reject_all(invitation: Dict, slot_empty: bool) -> Optional[str]:
+    return REJECT
+
+
+class InboxResult:
+    def __init__(self):
+        self.accepted: List[Dict] = []
+        self.rejected: List[Dict] = []
+        self.burned: List[Dict] = []
+        self.skipped: List[Tuple[Dict, str]] = []
+        self.remaining: List[Dict] = []
+        self.senders: Dict[str, Capsule] = {}  # whose starters were burned
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.accepted or self.rejected)
+
+
+def process_inbox(
+    capsule: Capsule,
+    ledger: Ledger,
+    invitations: List[Dict],
+    policy: InboxPolicy,
+    registry: StarterRegistry,
+    load_sender: Callable[[str], Optional[Capsule]],
+) -> InboxResult:
+    """
+    Apply ``policy`` to every invitation addressed to ``capsule``.
+
+    ``invitations`` is the full pending list; ``result.remaining`` is what
+    should be stored afterwards. ``capsule``, ``ledger``, ``registry`` and the
+    capsules in ``result.senders`` are updated in place.
+    """
+    result = InboxResult()
+    empty_mask = capsule.empty_mask
+    events: List[Tuple[Event, List[str]]] = []
+
+    def sender_capsule(sender_id: str) -> Optional[Capsule]:
+        if sender_id not in result.senders:
+            sender = load_sender(sender_id)
+            if sender is None:
+                return None
+            result.senders[sender_id] = sender
+        return result.senders[sender_id]
+
+    for invitation in invitations:
+        if invitation['recipient'] != capsule.capsule_id:
+            result.remaining.append(invitation)
+            continue
+
+        index = slot_index(invitation['slot'])
+        if index is None:
+            result.skipped.append((invitation, f"unknown slot {invitation['slot']!r}"))
+            result.remaining.append(invitation)
+            continue
+
+        slot_empty = bool(empty_mask >> index & 1)
+        decision = policy(invitation, slot_empty)
+        starter_id = invitation['starter_id']
+        sender_id = invitation['sender']
+
+        if decision == ACCEPT:
+            if not slot_empty:
+                result.skipped.append((invitation, "slot occupied"))
+                result.remaining.append(invitation)
+                continue
+            try:
+                registry.validate_transfer(starter_id, sender_id, capsule.capsule_id)
+            except StarterConflictError as e:
+                result.skipped.append((invitation, str(e)))
+                result.remaining.append(invitation)
+                continue
+
+            new_starter_id = allocate_starter_ids(1)[0]
+            capsule.set_starter(index, new_starter_id)
+            empty_mask &= ~(1 << index)
+
+            event = Event(event_type="invitation_accepted")
+            event.metadata.update({
+                "invitation_id": invitation['id'],
+                "sender": sender_id,
+                "slot": invitation['slot'],
+                "starter_id": starter_id,
+                "new_starter_id": new_starter_id,
+            })
+            registry.accept_offer(starter_id, sender_id, capsule.capsule_id,
+                                  invitation['slot'], new_starter_id, event.event_id)
+            events.append((event, ["invitation", "accepted"]))
+            result.accepted.append(invitation)
+
+        elif decision == REJECT:
+            burn = slot_empty and registry.owner_of(starter_id) == sender_id
+            if burn:
+                sender = sender_capsule(sender_id)
+                if sender is not None and sender.get_starter_id(index) == starter_id:
+                    sender.set_starter(index, None)
+                registry.release(starter_id)
+                result.burned.append(invitation)
+
+            event = Event(event_type="invitation_rejected")
+            event.metadata.update({
+                "invitation_id": invitation['id'],
+                "sender": sender_id,
+                "slot": invitation['slot'],
+                "starter_id": starter_id,
+                "burned": burn,
+            })
+            if not burn:
+                registry.withdraw_offer(starter_id, event.event_id)
+            events.append((event, ["invitation", "rejected"]))
+            result.rejected.append(invitation)
+
+        else:
+            result.remaining.append(invitation)
+
+    ledger.append_many(events)
+    return result
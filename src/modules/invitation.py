@@ -2,10 +2,12 @@ from typing import Optional, List
 from src.events.base import Event, InviteEvent, UserActionEvent, UserActionType, StarterEvent
 from src.core.capsule import Capsule
 from src.core.starter import Starter
+from src.modules.admission import AdmissionController
 
 class InvitationModule:
-    def __init__(self, capsule: Capsule):
+    def __init__(self, capsule: Capsule, admission: Optional[AdmissionController] = None):
         self.capsule = capsule
+        self.admission = admission
     
     def handle_event(self, event: Event) -> Optional[List[Event]]:
         if isinstance(event, InviteEvent):
@@ -18,6 +20,11 @@ class InvitationModule:
         if event.target_capsule_id != self.capsule.id:
             return []
         
+        if self.admission and self.admission.admit(
+            event.sender_capsule_id, event.target_capsule_id, self.capsule.capsule_type
+        ):
+            return []
+        
         relationship = self.capsule.get_relationship(event.sender_capsule_id)
         relationship.invited = True
         return []
@@ -0,0 +1,88 @@
+"""
+Storage backends for capsules, ledgers and invitations.
+
+Backends are imported on first use so that opening a JSON store does not
+pay for ``sqlite3`` (and vice versa).
+"""
+import os
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, Optional, Union
+
+if TYPE_CHECKING:
+    from src.storage.cached import CachedStore
+    from src.storage.json_store import JsonStore
+    from src.storage.sqlite_store import SqliteStore
+
+    Store = Union[JsonStore, SqliteStore, CachedStore]
+
+BACKENDS = ("json", "sqlite")
+
+DB_NAME = "capsulenet.db"
+
+
+class LedgerConflictError(ValueError):
+    """A ledger being saved does not extend the stored one (a stale writer)."""
+
+_LAZY = {
+    "CachedStore": "src.storage.cached",
+    "JsonStore": "src.storage.json_store",
+    "SqliteStore": "src.storage.sqlite_store",
+    "detect_layout": "src.storage.layout",
+    "migrate_layout": "src.storage.layout",
+}
+
+
+def __getattr__(name: str) -> Any:
+    module = _LAZY.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    import importlib
+    return getattr(importlib.import_module(module), name)
+
+
+def detect_backend(data_dir: Path) -> str:
+    """``$CAPSULENET_BACKEND`` if set, else sqlite when a database exists, else json."""
+    backend = os.environ.get("CAPSULENET_BACKEND")
+    if backend:
+        return backend
+    return "sqlite" if (Path(data_dir) / DB_NAME).exists() else "json"
+
+
+def open_store(data_dir: Path, backend: Optional[str] = None) -> "Store":
+    backend = backend or detect_backend(data_dir)
+    if backend == "json":
+        from src.storage.json_store import JsonStore
+        return JsonStore(data_dir)
+    if backend == "sqlite":
+        from src.storage.sqlite_store import SqliteStore
+        return SqliteStore(data_dir)
+    raise ValueError(f"Unknown storage backend: {backend!r}")
+
+
+def migrate(source: "Store", target: "Store") -> Dict[str, int]:
+    """Copy every capsule, ledger and pending invitation from ``source`` to ``target``."""
+    counts = {"capsules": 0, "ledgers": 0, "invitations": 0}
+    for data in source.iter_capsules():
+        target.save_capsule(data["capsule_id"], data)
+        counts["capsules"] += 1
+    for capsule_id in source.ledger_ids():
+        target.save_ledger(capsule_id, source.load_ledger(capsule_id))
+        counts["ledgers"] += 1
+    invitations = source.load_invitations()
+    target.save_invitations(invitations)
+    counts["invitations"] = len(invitations)
+    return counts
+
+
+__all__ = [
+    'BACKENDS',
+    'CachedStore',
+    'DB_NAME',
+    'JsonStore',
+    'SqliteStore',
+    'detect_backend',
+    'detect_layout',
+    'migrate',
+    'migrate_layout',
+    'open_store',
+]
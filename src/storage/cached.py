@@ -0,0 +1,329 @@
+"""
+In-memory store wrapper - a bounded LRU of capsules, ledgers and invitations.
+
+Capsule dicts (and their decoded ``Capsule`` objects, see
+``load_capsule_object``) and ``Ledger`` objects are kept in one LRU whose
+size is counted in capsules plus ledger entries; the least recently used
+items are evicted once ``max_size`` is exceeded. Pending invitations are
+held in full in an ``InvitationIndex`` (see ``invitations.py``).
+
+With ``validate=True`` every cached item remembers the backing store's
+version token for it (file identity and mtime for JSON, the database's
+``data_version`` for SQLite) and is reloaded when the token has changed, so
+writes by other processes are picked up at the cost of a ``stat``. Without
+validation the cache assumes this process is the only writer.
+
+Saves are written through to the wrapped store, or with ``write_back=True``
+only kept as dirty and written by ``flush`` (once per capsule, ledger and
+invitation store); dirty items are never evicted or revalidated. Returned
+dicts and objects are shared with the cache: treat dicts as read-only and
+save objects after changing them (or ``invalidate``).
+"""
+from collections import OrderedDict
+from typing import (
+    TYPE_CHECKING, Any, Callable, Dict, Hashable, Iterable, Iterator, List, Optional, Set, Tuple,
+)
+
+from src.storage.files import INVITATIONS_LOCK, locked
+from src.storage.invitations import InvitationIndex
+
+if TYPE_CHECKING:
+    from src.core.ledger import Ledger
+
+DEFAULT_MAX_SIZE = 100_000
+
+_MISSING = object()
+
+
+class LRUCache:
+    """Ordered mapping evicting least recently used keys beyond ``max_size``."""
+
+    def __init__(self, max_size: Optional[int] = None, sizeof: Callable[[Any], int] = lambda value: 1):
+        self.max_size = max_size
+        self.sizeof = sizeof
+        self.size = 0
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._sizes: Dict[Hashable, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        value = self._data.get(key, _MISSING)
+        if value is _MISSING:
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        self.pop(key)
+        size = self.sizeof(value)
+        self._data[key] = value
+        self._sizes[key] = size
+        self.size += size
+        if self.max_size is not None:
+            # The newest item stays even if it alone is over the limit
+            while self.size > self.max_size and len(self._data) > 1:
+                self.pop(next(iter(self._data)))
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        value = self._data.pop(key, _MISSING)
+        if value is _MISSING:
+            return default
+        self.size -= self._sizes.pop(key)
+        return value
+
+
+class _Entry:
+    __slots__ = ("version", "value", "decoded")
+
+    def __init__(self, version: Hashable, value: Any, decoded: Any = None):
+        self.version = version
+        self.value = value
+        self.decoded = decoded
+
+
+def _entry_size(entry: _Entry) -> int:
+    entries = getattr(entry.value, "entries", None)
+    return 1 + len(entries) if entries is not None else 1
+
+
+class CachedStore:
+    def __init__(self, backing, write_back: bool = False, validate: bool = False,
+                 max_size: Optional[int] = DEFAULT_MAX_SIZE):
+        self.backing = backing
+        self.backend = backing.backend
+        self.data_dir = backing.data_dir
+        self.write_back = write_back
+        self.validate = validate
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.invalidate()
+
+    def invalidate(self) -> None:
+        """Forget everything held in memory (including unflushed saves)."""
+        self._items = LRUCache(self.max_size, _entry_size)
+        self._invitations: Optional[InvitationIndex] = None
+        self._invitations_version: Hashable = None
+        self._dirty_capsules: Dict[str, _Entry] = {}
+        self._dirty_ledgers: Dict[str, _Entry] = {}
+        self._added_invitations: Dict[str, Dict] = {}
+        self._removed_invitations: Set[str] = set()
+        self._replace_invitations = False
+
+    @property
+    def dirty(self) -> bool:
+        return bool(
+            self._dirty_capsules or self._dirty_ledgers or self._added_invitations
+            or self._removed_invitations or self._replace_invitations
+        )
+
+    def _lookup(self, key: Tuple[str, str], dirty: Dict[str, _Entry],
+                version: Callable[[str], Hashable], load: Callable[[str], Any]) -> _Entry:
+        capsule_id = key[1]
+        entry = dirty.get(capsule_id)
+        if entry is not None:
+            return entry
+        entry = self._items.get(key)
+        current = version(capsule_id) if self.validate else None
+        if entry is not None and entry.version == current:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        entry = _Entry(current, load(capsule_id))
+        self._items.put(key, entry)
+        return entry
+
+    def _store(self, key: Tuple[str, str], dirty: Dict[str, _Entry],
+               version: Callable[[str], Hashable], value: Any, decoded: Any = None) -> None:
+        capsule_id = key[1]
+        if self.write_back:
+            entry = dirty[capsule_id] = _Entry(None, value, decoded)
+        else:
+            entry = _Entry(version(capsule_id) if self.validate else None, value, decoded)
+        self._items.put(key, entry)
+
+    # -- capsules ----------------------------------------------------------
+
+    def _capsule(self, capsule_id: str) -> _Entry:
+        return self._lookup(("capsule", capsule_id), self._dirty_capsules,
+                            self.backing.capsule_version, self.backing.load_capsule)
+
+    def load_capsule(self, capsule_id: str) -> Optional[Dict]:
+        return self._capsule(capsule_id).value
+
+    def load_capsule_object(self, capsule_id: str, decode: Callable[[Dict], Any]) -> Any:
+        """The capsule decoded with ``decode`` (e.g. ``Capsule.from_dict``), cached with it."""
+        entry = self._capsule(capsule_id)
+        if entry.value is None:
+            return None
+        if entry.decoded is None:
+            entry.decoded = decode(entry.value)
+        return entry.decoded
+
+    def save_capsule(self, capsule_id: str, data: Dict, decoded: Any = None) -> None:
+        """Save ``data``; ``decoded`` is the object it was encoded from, if any."""
+        if not self.write_back:
+            self.backing.save_capsule(capsule_id, data)
+        self._store(("capsule", capsule_id), self._dirty_capsules,
+                    self.backing.capsule_version, data, decoded)
+
+    def capsule_ids(self) -> List[str]:
+        ids = self.backing.capsule_ids()
+        return ids + sorted(set(self._dirty_capsules).difference(ids))
+
+    def iter_capsules(self) -> Iterator[Dict]:
+        # Straight from the backing store: a full scan would flush the LRU
+        dirty = {capsule_id: entry.value for capsule_id, entry in self._dirty_capsules.items()}
+        for data in self.backing.iter_capsules():
+            yield dirty.pop(data.get("capsule_id"), data)
+        yield from dirty.values()
+
+    def capsule_summaries(self) -> List[Dict[str, Any]]:
+        self.flush()
+        return self.backing.capsule_summaries()
+
+    def capsule_summary(self, capsule_id: str) -> Optional[Dict[str, Any]]:
+        self.flush()
+        return self.backing.capsule_summary(capsule_id)
+
+    # -- ledgers -----------------------------------------------------------
+
+    def load_ledger(self, capsule_id: str) -> "Ledger":
+        return self._lookup(("ledger", capsule_id), self._dirty_ledgers,
+                            self.backing.ledger_version, self.backing.load_ledger).value
+
+    def save_ledger(self, capsule_id: str, ledger: "Ledger") -> None:
+        if not self.write_back:
+            self.backing.save_ledger(capsule_id, ledger)
+        self._store(("ledger", capsule_id), self._dirty_ledgers,
+                    self.backing.ledger_version, ledger)
+
+    def replace_ledger(self, capsule_id: str, ledger: "Ledger") -> None:
+        """Store a rewritten ledger; written through even in write-back mode."""
+        self._dirty_ledgers.pop(capsule_id, None)
+        self.backing.replace_ledger(capsule_id, ledger)
+        version = self.backing.ledger_version(capsule_id) if self.validate else None
+        self._items.put(("ledger", capsule_id), _Entry(version, ledger))
+
+    def ledger_ids(self) -> List[str]:
+        ids = self.backing.ledger_ids()
+        return ids + sorted(set(self._dirty_ledgers).difference(ids))
+
+    # -- invitations -------------------------------------------------------
+
+    def _index(self) -> InvitationIndex:
+        if self._invitations is not None and self.validate and not self.dirty:
+            if self.backing.invitations_version() != self._invitations_version:
+                self._invitations = None
+        if self._invitations is None:
+            if self.validate:
+                self._invitations_version = self.backing.invitations_version()
+            self._invitations = InvitationIndex(self.backing.load_invitations())
+        return self._invitations
+
+    def _write_invitations(self, write: Callable[[], None]) -> bool:
+        """
+        Write through to the backing store. Returns ``False`` if another
+        process changed the invitations since they were indexed, in which
+        case the index must be reloaded rather than patched.
+        """
+        if not self.validate:
+            write()
+            return True
+        with locked(self.data_dir, INVITATIONS_LOCK):
+            fresh = self.backing.invitations_version() == self._invitations_version
+            write()
+            self._invitations_version = self.backing.invitations_version()
+        return fresh
+
+    def load_invitations(self) -> List[Dict]:
+        return list(self._index())
+
+    def save_invitations(self, invitations: List[Dict]) -> None:
+        if self.write_back:
+            self._replace_invitations = True
+            self._added_invitations = {}
+            self._removed_invitations = set()
+        else:
+            self._write_invitations(lambda: self.backing.save_invitations(invitations))
+        self._invitations = InvitationIndex(invitations)
+
+    def get_invitation(self, invitation_id: str) -> Optional[Dict]:
+        return self._index().get(invitation_id)
+
+    def invitations_for(self, recipient_id: str) -> List[Dict]:
+        return self._index().for_recipient(recipient_id)
+
+    def invitations_from(self, sender_id: str) -> List[Dict]:
+        return self._index().from_sender(sender_id)
+
+    def next_invitation_expiry(self) -> Optional[int]:
+        return self._index().next_expiry()
+
+    def expired_invitations(self, now_ns: int) -> List[Dict]:
+        return self._index().expired(now_ns)
+
+    def count_invitations(self) -> int:
+        return len(self._index())
+
+    def add_invitation(self, invitation: Dict) -> None:
+        self.add_invitations([invitation])
+
+    def add_invitations(self, invitations: List[Dict]) -> None:
+        index = self._index()
+        if self.write_back:
+            for invitation in invitations:
+                self._added_invitations[invitation['id']] = invitation
+        elif not self._write_invitations(lambda: self.backing.add_invitations(invitations)):
+            self._invitations = None
+            return
+        for invitation in invitations:
+            index.add(invitation)
+
+    def remove_invitations(self, invitation_ids: Iterable[str]) -> None:
+        index = self._index()
+        invitation_ids = list(invitation_ids)
+        if self.write_back:
+            for invitation_id in invitation_ids:
+                if self._added_invitations.pop(invitation_id, None) is None:
+                    self._removed_invitations.add(invitation_id)
+        elif not self._write_invitations(lambda: self.backing.remove_invitations(invitation_ids)):
+            self._invitations = None
+            return
+        for invitation_id in invitation_ids:
+            index.discard(invitation_id)
+
+    def flush(self) -> None:
+        """Write everything saved since the last flush."""
+        for capsule_id, entry in self._dirty_capsules.items():
+            self.backing.save_capsule(capsule_id, entry.value)
+        for capsule_id, entry in self._dirty_ledgers.items():
+            self.backing.save_ledger(capsule_id, entry.value)
+        if self._replace_invitations:
+            self.backing.save_invitations(list(self._invitations))
+        else:
+            if self._removed_invitations:
+                self.backing.remove_invitations(self._removed_invitations)
+            if self._added_invitations:
+                self.backing.add_invitations(list(self._added_invitations.values()))
+        if self.validate and self.dirty:
+            # Written by this process: remember the new versions
+            for capsule_id, entry in self._dirty_capsules.items():
+                entry.version = self.backing.capsule_version(capsule_id)
+            for capsule_id, entry in self._dirty_ledgers.items():
+                entry.version = self.backing.ledger_version(capsule_id)
+            self._invitations_version = self.backing.invitations_version()
+        self._dirty_capsules = {}
+        self._dirty_ledgers = {}
+        self._added_invitations = {}
+        self._removed_invitations = set()
+        self._replace_invitations = False
+        self.backing.flush()
+
+    def close(self) -> None:
+        self.backing.close()
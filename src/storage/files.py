@@ -0,0 +1,196 @@
+"""
+Advisory file locks and atomic file replacement for the data directory.
+
+Several CLI processes may work on one data directory at once. Each command
+takes ``flock`` locks on small files under ``<data_dir>/locks/``: one per
+capsule it modifies and one per shared file (invitations, starter registry,
+admission state, projections) it reads and rewrites, so commands on
+unrelated capsules run in parallel. Locks are re-entrant within a thread and must be taken in
+a fixed order (capsules by id, then the shared files) to rule out deadlocks;
+``locked`` sorts the names it is given and refuses to take a lock that sorts
+before one the thread already holds.
+
+Moving files between layouts (or backends) must not race any of that, so
+an open store also holds ``locks/layout.lock`` shared (``SharedLayoutLock``)
+and migrations hold it exclusively (``exclusive_layout``), waiting for
+every other process to close its store first. Batches, which rewrite whole
+files from memory when they flush, hold it exclusively as well.
+
+Files are replaced with ``atomic_write_json``: written to a temporary file in
+the same directory and renamed over the target, so readers never see a
+partially written file. Without ``fcntl`` (Windows) locking is a no-op.
+"""
+import json
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from src.storage.layout import shard_of
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+LOCK_DIR = "locks"
+
+INVITATIONS_LOCK = "invitations"
+STARTERS_LOCK = "starters"
+ADMISSION_LOCK = "admission"
+PROJECTIONS_LOCK = "projections"
+LAYOUT_LOCK = "layout"
+
+# Acquisition order after the capsule locks
+_SHARED_ORDER = {INVITATIONS_LOCK: 1, STARTERS_LOCK: 2, ADMISSION_LOCK: 3, PROJECTIONS_LOCK: 4}
+
+# (thread id, lock file) -> [fd, depth]
+_held: Dict[Tuple[int, str], List[int]] = {}
+
+# (thread id, layout lock file) held exclusively
+_migrating: Set[Tuple[int, str]] = set()
+
+
+def capsule_lock(capsule_id: str) -> str:
+    # Sharded like the capsule files, so locks/ stays small
+    return f"{shard_of(capsule_id)}/capsule-{capsule_id}"
+
+
+def _order(name: str) -> Tuple[int, str]:
+    return (_SHARED_ORDER.get(name, 0), name)
+
+
+def _held_names(lock_dir: Path) -> List[str]:
+    thread = threading.get_ident()
+    prefix = str(lock_dir) + os.sep
+    return [
+        path[len(prefix):-len(".lock")]
+        for (owner, path) in _held
+        if owner == thread and path.startswith(prefix)
+    ]
+
+
+def _lock_file(path: str, operation: int) -> int:
+    """Open ``path`` and ``flock`` it; returns the descriptor holding the lock."""
+    try:
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    except FileNotFoundError:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, operation)
+    except BaseException:
+        os.close(fd)
+        raise
+    return fd
+
+
+def _acquire(path: str) -> None:
+    key = (threading.get_ident(), path)
+    entry = _held.get(key)
+    if entry is not None:
+        entry[1] += 1
+        return
+    _held[key] = [_lock_file(path, fcntl.LOCK_EX if fcntl else 0), 1]
+
+
+def _release(path: str) -> None:
+    key = (threading.get_ident(), path)
+    entry = _held[key]
+    entry[1] -= 1
+    if entry[1] == 0:
+        del _held[key]
+        # Closing the descriptor releases the flock
+        os.close(entry[0])
+
+
+@contextmanager
+def locked(data_dir: Path, *names: str) -> Iterator[None]:
+    """Hold exclusive locks ``names`` (see ``capsule_lock``) on ``data_dir``."""
+    lock_dir = Path(data_dir) / LOCK_DIR
+    held = _held_names(lock_dir)
+    wanted = sorted(set(names) - set(held), key=_order)
+    if held and wanted and _order(wanted[0]) < max(map(_order, held)):
+        raise RuntimeError(
+            f"Lock {wanted[0]!r} must be taken before {max(held, key=_order)!r}"
+        )
+    paths = [str(lock_dir / f"{name}.lock") for name in sorted(set(names), key=_order)]
+    acquired: List[str] = []
+    try:
+        for path in paths:
+            _acquire(path)
+            acquired.append(path)
+        yield
+    finally:
+        for path in reversed(acquired):
+            _release(path)
+
+
+def _layout_lock_path(data_dir: Path) -> str:
+    return str(Path(data_dir) / LOCK_DIR / f"{LAYOUT_LOCK}.lock")
+
+
+class SharedLayoutLock:
+    """
+    Holds the layout of ``data_dir`` shared, as stores do while open, until
+    released or garbage collected. Nothing is held inside this thread's own
+    ``exclusive_layout`` block.
+    """
+
+    def __init__(self, data_dir: Path):
+        path = _layout_lock_path(data_dir)
+        if (threading.get_ident(), path) in _migrating:
+            self._fd = None
+        else:
+            self._fd = _lock_file(path, fcntl.LOCK_SH if fcntl else 0)
+
+    def release(self) -> None:
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    __del__ = release
+
+
+@contextmanager
+def exclusive_layout(data_dir: Path) -> Iterator[None]:
+    """
+    Hold the layout of ``data_dir`` exclusively, to move its files or to
+    rewrite them from memory without other writers in between. Waits
+    until stores open in other processes are closed; close this process's
+    own first. Stores this thread opens inside the block do not wait.
+    """
+    path = _layout_lock_path(data_dir)
+    fd = _lock_file(path, fcntl.LOCK_EX if fcntl else 0)
+    key = (threading.get_ident(), path)
+    _migrating.add(key)
+    try:
+        yield
+    finally:
+        _migrating.discard(key)
+        os.close(fd)
+
+
+def atomic_write_json(path: Path, data: Any, indent: Optional[int] = None) -> None:
+    """
+    Replace ``path`` with ``data`` as JSON via a temporary file and rename.
+
+    Protects against torn and interleaved writes, not against power loss
+    (the file is not fsynced).
+    """
+    path = Path(path)
+    tmp = str(path.with_name(f".{path.name}.{os.urandom(4).hex()}.tmp"))
+    # Same permissions as open(path, 'w') would give (mkstemp uses 0600)
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f, indent=indent)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
@@ -0,0 +1,103 @@
+"""
+Pending invitation index - lookups by id, recipient and sender, plus expiry.
+
+Invitations carry an ``expires_ns`` deadline (absent or ``None``: never
+expires). ``InvitationIndex`` keeps them in a dict by id, per-recipient and
+per-sender dicts (insertion ordered, so oldest first) and a heap of
+``(expires_ns, id)``. Removal leaves the heap entry behind; stale entries
+are dropped when they reach the top, so each invitation costs O(log n) to
+expire and checking whether anything is due is O(1).
+"""
+import heapq
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+def expiry_of(invitation: Dict) -> Optional[int]:
+    return invitation.get('expires_ns')
+
+
+def is_expired(invitation: Dict, now_ns: int) -> bool:
+    expires_ns = invitation.get('expires_ns')
+    return expires_ns is not None and expires_ns <= now_ns
+
+
+class InvitationIndex:
+    def __init__(self, invitations: Iterable[Dict] = ()):
+        self._by_id: Dict[str, Dict] = {}
+        self._by_recipient: Dict[str, Dict[str, Dict]] = {}
+        self._by_sender: Dict[str, Dict[str, Dict]] = {}
+        self._heap: List[Tuple[int, str]] = []
+        for invitation in invitations:
+            self.add(invitation)
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def __iter__(self) -> Iterator[Dict]:
+        return iter(self._by_id.values())
+
+    def get(self, invitation_id: str) -> Optional[Dict]:
+        return self._by_id.get(invitation_id)
+
+    def for_recipient(self, recipient_id: str) -> List[Dict]:
+        return list(self._by_recipient.get(recipient_id, {}).values())
+
+    def from_sender(self, sender_id: str) -> List[Dict]:
+        return list(self._by_sender.get(sender_id, {}).values())
+
+    def add(self, invitation: Dict) -> None:
+        invitation_id = invitation['id']
+        self.discard(invitation_id)
+        self._by_id[invitation_id] = invitation
+        self._by_recipient.setdefault(invitation['recipient'], {})[invitation_id] = invitation
+        self._by_sender.setdefault(invitation['sender'], {})[invitation_id] = invitation
+        expires_ns = expiry_of(invitation)
+        if expires_ns is not None:
+            heapq.heappush(self._heap, (expires_ns, invitation_id))
+
+    def discard(self, invitation_id: str) -> Optional[Dict]:
+        invitation = self._by_id.pop(invitation_id, None)
+        if invitation is None:
+            return None
+        for index, key in ((self._by_recipient, invitation['recipient']),
+                           (self._by_sender, invitation['sender'])):
+            bucket = index[key]
+            del bucket[invitation_id]
+            if not bucket:
+                del index[key]
+        # The heap entry goes stale; rebuild once stale entries dominate
+        if len(self._heap) > 2 * len(self._by_id) + 64:
+            self._heap = [
+                (expiry_of(inv), inv['id']) for inv in self._by_id.values()
+                if expiry_of(inv) is not None
+            ]
+            heapq.heapify(self._heap)
+        return invitation
+
+    def _is_live(self, entry: Tuple[int, str]) -> bool:
+        invitation = self._by_id.get(entry[1])
+        return invitation is not None and expiry_of(invitation) == entry[0]
+
+    def next_expiry(self) -> Optional[int]:
+        """The earliest deadline of any indexed invitation."""
+        heap = self._heap
+        while heap and not self._is_live(heap[0]):
+            heapq.heappop(heap)
+        return heap[0][0] if heap else None
+
+    def expired(self, now_ns: int) -> List[Dict]:
+        """Invitations due by ``now_ns``, earliest first; they stay indexed."""
+        next_expiry = self.next_expiry()
+        if next_expiry is None or next_expiry > now_ns:
+            return []
+        # Walk only the part of the heap at or below now_ns: O(k) for k hits
+        heap = self._heap
+        found: List[Tuple[int, str]] = []
+        stack = [0]
+        while stack:
+            i = stack.pop()
+            if i < len(heap) and heap[i][0] <= now_ns:
+                if self._is_live(heap[i]):
+                    found.append(heap[i])
+                stack.extend((2 * i + 1, 2 * i + 2))
+        return [self._by_id[invitation_id] for _, invitation_id in sorted(set(found))]
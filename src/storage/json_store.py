@@ -0,0 +1,182 @@
+"""
+JSON file store - one file per capsule and ledger, one shared invitations file.
+
+Capsule and ledger files are placed by the directory's layout (flat or
+sharded, see ``layout.py``). Invitation queries go through an
+``InvitationIndex`` (see ``invitations.py``) that is rebuilt whenever
+invitations.json is replaced, by this store or another process.
+Capsule listings come from ``manifest.json`` (see ``manifest.py``). Files
+are replaced atomically, invitation updates hold the invitations lock and
+an open store holds the layout lock shared (see ``files.py``).
+"""
+import json
+import os
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from src.storage.files import INVITATIONS_LOCK, SharedLayoutLock, atomic_write_json, locked
+from src.storage.invitations import InvitationIndex
+from src.storage.layout import CAPSULE_SUFFIX, LEDGER_SUFFIX, detect_layout
+from src.storage.manifest import CapsuleManifest
+
+if TYPE_CHECKING:
+    from src.core.ledger import Ledger
+
+
+class JsonStore:
+    backend = "json"
+
+    def __init__(self, data_dir: Path):
+        self.data_dir = Path(data_dir)
+        self.data_dir.mkdir(parents=True, exist_ok=True)
+        # Files stay where the layout puts them until the store is closed
+        self._layout_lock = SharedLayoutLock(self.data_dir)
+        self.layout = detect_layout(self.data_dir)
+        self._invitations_file = self.data_dir / "invitations.json"
+        self._invitations: Optional[InvitationIndex] = None
+        self._invitations_version: Optional[Tuple[int, int, int]] = None
+        self.manifest = CapsuleManifest(self.data_dir / "manifest.json", self.layout)
+
+    def _capsule_file(self, capsule_id: str) -> Path:
+        return self.layout.capsule_file(capsule_id)
+
+    def _ledger_file(self, capsule_id: str) -> Path:
+        return self.layout.ledger_file(capsule_id)
+
+    @staticmethod
+    def _version(path: Path) -> Optional[Tuple[int, int, int]]:
+        # Files are replaced by rename, so the inode changes on every save
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def capsule_version(self, capsule_id: str) -> Optional[Tuple[int, int, int]]:
+        return self._version(self._capsule_file(capsule_id))
+
+    def ledger_version(self, capsule_id: str) -> Optional[Tuple[int, int, int]]:
+        return self._version(self._ledger_file(capsule_id))
+
+    def invitations_version(self) -> Optional[Tuple[int, int, int]]:
+        return self._version(self._invitations_file)
+
+    # -- capsules ----------------------------------------------------------
+
+    def load_capsule(self, capsule_id: str) -> Optional[Dict]:
+        try:
+            with open(self._capsule_file(capsule_id), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save_capsule(self, capsule_id: str, data: Dict) -> None:
+        capsule_file = self._capsule_file(capsule_id)
+        atomic_write_json(capsule_file, data, indent=2)
+        self.manifest.record_capsule(capsule_id, data, capsule_file.stat().st_mtime_ns)
+
+    def capsule_ids(self) -> List[str]:
+        return self.layout.ids(CAPSULE_SUFFIX)
+
+    def _ledger_length(self, capsule_id: str) -> int:
+        return len(self.load_ledger(capsule_id).entries)
+
+    def capsule_summaries(self) -> List[Dict[str, Any]]:
+        """Type, slot occupancy and ledger length of every capsule."""
+        return self.manifest.summaries(self.load_capsule, self._ledger_length)
+
+    def capsule_summary(self, capsule_id: str) -> Optional[Dict[str, Any]]:
+        return self.manifest.summary(capsule_id, self.load_capsule, self._ledger_length)
+
+    def iter_capsules(self) -> Iterator[Dict]:
+        for capsule_id in self.capsule_ids():
+            data = self.load_capsule(capsule_id)
+            if data:
+                yield data
+
+    # -- ledgers -----------------------------------------------------------
+
+    def load_ledger(self, capsule_id: str) -> "Ledger":
+        from src.core.ledger import Ledger
+
+        try:
+            return Ledger.load_from_file(str(self._ledger_file(capsule_id)))
+        except FileNotFoundError:
+            return Ledger(capsule_id)
+
+    def save_ledger(self, capsule_id: str, ledger: "Ledger") -> None:
+        ledger_file = self._ledger_file(capsule_id)
+        atomic_write_json(ledger_file, ledger.to_dict(), indent=2)
+        self.manifest.record_ledger(capsule_id, len(ledger.entries), ledger_file.stat().st_mtime_ns)
+
+    def replace_ledger(self, capsule_id: str, ledger: "Ledger") -> None:
+        """Store ``ledger`` in place of the stored one (the whole file is rewritten anyway)."""
+        self.save_ledger(capsule_id, ledger)
+
+    def ledger_ids(self) -> List[str]:
+        return self.layout.ids(LEDGER_SUFFIX)
+
+    # -- invitations -------------------------------------------------------
+
+    def load_invitations(self) -> List[Dict]:
+        if not self._invitations_file.exists():
+            return []
+        try:
+            with open(self._invitations_file, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return []
+
+    def save_invitations(self, invitations: List[Dict]) -> None:
+        atomic_write_json(self._invitations_file, invitations, indent=2)
+
+    def _index(self) -> InvitationIndex:
+        # The file is replaced by rename on every write, so a new version
+        # means a new file; the index is rebuilt from it once
+        version = self.invitations_version()
+        if self._invitations is None or version != self._invitations_version:
+            self._invitations = InvitationIndex(self.load_invitations())
+            self._invitations_version = version
+        return self._invitations
+
+    def get_invitation(self, invitation_id: str) -> Optional[Dict]:
+        return self._index().get(invitation_id)
+
+    def invitations_for(self, recipient_id: str) -> List[Dict]:
+        return self._index().for_recipient(recipient_id)
+
+    def invitations_from(self, sender_id: str) -> List[Dict]:
+        return self._index().from_sender(sender_id)
+
+    def count_invitations(self) -> int:
+        return len(self._index())
+
+    def next_invitation_expiry(self) -> Optional[int]:
+        return self._index().next_expiry()
+
+    def expired_invitations(self, now_ns: int) -> List[Dict]:
+        return self._index().expired(now_ns)
+
+    def add_invitation(self, invitation: Dict) -> None:
+        self.add_invitations([invitation])
+
+    def add_invitations(self, new_invitations: List[Dict]) -> None:
+        with locked(self.data_dir, INVITATIONS_LOCK):
+            invitations = self.load_invitations()
+            invitations.extend(new_invitations)
+            self.save_invitations(invitations)
+
+    def remove_invitations(self, invitation_ids: Iterable[str]) -> None:
+        invitation_ids = set(invitation_ids)
+        if invitation_ids:
+            with locked(self.data_dir, INVITATIONS_LOCK):
+                self.save_invitations([
+                    inv for inv in self.load_invitations() if inv['id'] not in invitation_ids
+                ])
+
+    def flush(self) -> None:
+        self.manifest.flush()
+
+    def close(self) -> None:
+        self.flush()
+        self._layout_lock.release()
@@ -0,0 +1,186 @@
+"""
+Data directory layouts - where the JSON store keeps capsule and ledger files.
+
+The flat layout is the original one: ``<id>_capsule.json`` and
+``<id>_ledger.json`` directly in the data directory. The sharded layout puts
+them in ``capsules/<shard>/``, where the shard is the first hex digits of
+the id's CRC-32, so no directory grows past a few thousand entries even with
+millions of capsules. ``layout.json`` records which layout a directory uses;
+without it the directory is flat.
+"""
+import json
+import os
+import zlib
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+CAPSULE_SUFFIX = "_capsule.json"
+LEDGER_SUFFIX = "_ledger.json"
+
+LAYOUT_FILE = "layout.json"
+LAYOUT_VERSION = 1
+SHARD_DIR = "capsules"
+SHARD_CHARS = 2  # 256 shards
+
+LAYOUTS = ("flat", "sharded")
+
+
+def shard_of(capsule_id: str, chars: int = SHARD_CHARS) -> str:
+    return f"{zlib.crc32(capsule_id.encode('utf-8')):08x}"[:chars]
+
+
+class FlatLayout:
+    name = "flat"
+
+    def __init__(self, data_dir: Path):
+        self.data_dir = Path(data_dir)
+
+    def shard(self, capsule_id: str) -> Optional[str]:
+        return None
+
+    def directory(self, capsule_id: str) -> Path:
+        return self.data_dir
+
+    def capsule_file(self, capsule_id: str) -> Path:
+        return self.directory(capsule_id) / f"{capsule_id}{CAPSULE_SUFFIX}"
+
+    def ledger_file(self, capsule_id: str) -> Path:
+        return self.directory(capsule_id) / f"{capsule_id}{LEDGER_SUFFIX}"
+
+    def directories(self) -> List[Tuple[Optional[str], Path]]:
+        """``(shard, directory)`` for every directory holding capsule files."""
+        return [(None, self.data_dir)]
+
+    def scan(self, directory: Path) -> Iterator[Tuple[str, str, int]]:
+        """``(capsule_id, suffix, mtime_ns)`` for the capsule and ledger files in ``directory``."""
+        try:
+            it = os.scandir(directory)
+        except FileNotFoundError:
+            return
+        with it:
+            for dirent in it:
+                name = dirent.name
+                for suffix in (CAPSULE_SUFFIX, LEDGER_SUFFIX):
+                    if name.endswith(suffix):
+                        yield name[:-len(suffix)], suffix, dirent.stat().st_mtime_ns
+
+    def ids(self, suffix: str) -> List[str]:
+        return [
+            capsule_id
+            for _, directory in self.directories()
+            for capsule_id, file_suffix, _ in self.scan(directory)
+            if file_suffix == suffix
+        ]
+
+    def create(self) -> None:
+        self.data_dir.mkdir(parents=True, exist_ok=True)
+
+    def marker(self) -> Optional[Dict[str, Union[str, int]]]:
+        return None
+
+
+class ShardedLayout(FlatLayout):
+    name = "sharded"
+
+    def __init__(self, data_dir: Path, shard_chars: int = SHARD_CHARS):
+        super().__init__(data_dir)
+        self.shard_chars = shard_chars
+        self.root = self.data_dir / SHARD_DIR
+
+    def shard(self, capsule_id: str) -> str:
+        return shard_of(capsule_id, self.shard_chars)
+
+    def directory(self, capsule_id: str) -> Path:
+        return self.root / self.shard(capsule_id)
+
+    def directories(self) -> List[Tuple[str, Path]]:
+        shards = (f"{n:0{self.shard_chars}x}" for n in range(16 ** self.shard_chars))
+        return [(shard, self.root / shard) for shard in shards]
+
+    def create(self) -> None:
+        """Create every shard up front so saves never need a ``mkdir``."""
+        for _, directory in self.directories():
+            directory.mkdir(parents=True, exist_ok=True)
+
+    def marker(self) -> Dict[str, Union[str, int]]:
+        return {"layout": self.name, "version": LAYOUT_VERSION, "shard_chars": self.shard_chars}
+
+
+Layout = Union[FlatLayout, ShardedLayout]
+
+
+def detect_layout(data_dir: Path) -> Layout:
+    """The layout recorded in ``layout.json`` (flat if there is none)."""
+    try:
+        with open(Path(data_dir) / LAYOUT_FILE, 'r') as f:
+            marker = json.load(f)
+    except FileNotFoundError:
+        return FlatLayout(data_dir)
+    if marker.get("version") != LAYOUT_VERSION or marker.get("layout") not in LAYOUTS:
+        raise ValueError(f"Unsupported data directory layout: {marker}")
+    if marker["layout"] == "sharded":
+        return ShardedLayout(data_dir, marker.get("shard_chars", SHARD_CHARS))
+    return FlatLayout(data_dir)
+
+
+def migrate_layout(data_dir: Path, target: str) -> int:
+    """
+    Move every capsule and ledger file into the ``target`` layout.
+
+    Files are renamed one by one and the marker is written last, so an
+    interrupted migration leaves the old layout in charge; running it again
+    finishes the move. Holds the layout lock exclusively, so it waits for
+    stores open in other processes (close this process's first). Returns
+    the number of files moved.
+    """
+    from src.storage.files import exclusive_layout
+
+    data_dir = Path(data_dir)
+    if target not in LAYOUTS:
+        raise ValueError(f"Unknown layout: {target!r}")
+    with exclusive_layout(data_dir):
+        return _move_files(data_dir, target)
+
+
+def _move_files(data_dir: Path, target: str) -> int:
+    from src.storage.files import atomic_write_json
+
+    new = ShardedLayout(data_dir) if target == "sharded" else FlatLayout(data_dir)
+    new.create()
+    moved = 0
+    for old in (FlatLayout(data_dir), ShardedLayout(data_dir)):
+        if type(old) is type(new):
+            continue
+        for _, directory in old.directories():
+            for capsule_id, suffix, _ in list(old.scan(directory)):
+                dest = new.directory(capsule_id) / f"{capsule_id}{suffix}"
+                os.replace(directory / f"{capsule_id}{suffix}", dest)
+                moved += 1
+    marker = new.marker()
+    if marker is None:
+        _remove(data_dir / LAYOUT_FILE)
+        if (data_dir / SHARD_DIR).exists():
+            _remove_empty_shards(data_dir / SHARD_DIR)
+    else:
+        atomic_write_json(data_dir / LAYOUT_FILE, marker, indent=2)
+    return moved
+
+
+def _remove(path: Path) -> None:
+    try:
+        path.unlink()
+    except FileNotFoundError:
+        pass
+
+
+def _remove_empty_shards(root: Path) -> None:
+    for dirent in os.scandir(root):
+        if dirent.is_dir():
+            try:
+                os.rmdir(dirent.path)
+            except OSError:
+                pass  # not empty: left for the user to inspect
+    try:
+        os.rmdir(root)
+    except OSError:
+        pass
@@ -0,0 +1,197 @@
+"""
+Capsule manifest - per-capsule summaries kept next to the JSON files.
+
+``manifest.json`` maps each capsule to its type, slot occupancy and ledger
+length together with the mtimes of the files they were read from. Saves
+update the in-memory manifest and ``flush`` writes it once; listing only
+re-parses files whose mtime no longer matches, so a stale or missing
+manifest repairs itself.
+
+With the sharded layout the manifest also keeps each shard directory's
+mtime. Every save renames a file into its shard, which bumps that mtime, so
+listing skips the ``scandir`` of shards that have not changed. Shards
+modified within the last ``RACY_NS`` are always rescanned, because a change
+in the same timestamp tick as the scan would leave the mtime unchanged.
+
+With the flat layout the manifest lives in the directory it describes, so
+writing it bumps the mtime it would record. Instead, a manifest written
+right after a scan, with no rename in the directory since, gets the
+directory's new mtime as its own (``os.utime`` leaves the directory
+alone) and is marked ``scanned``. While the two mtimes still match, listing
+reads only ``manifest.json``.
+"""
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from src.storage.files import atomic_write_json
+from src.storage.layout import CAPSULE_SUFFIX, FlatLayout, Layout
+
+RACY_NS = 2_000_000_000
+
+
+def summarize_capsule(data: Dict[str, Any]) -> Dict[str, Any]:
+    slots = data.get("slots", {})
+    return {
+        "capsule_type": data.get("capsule_type"),
+        "occupied": sum(1 for slot in slots.values() if slot.get("starter_id")),
+        "slots": len(slots),
+    }
+
+
+class CapsuleManifest:
+    def __init__(self, path: Path, layout: Optional[Layout] = None):
+        self.path = Path(path)
+        self.layout = layout or FlatLayout(self.path.parent)
+        self._entries: Optional[Dict[str, Dict[str, Any]]] = None
+        self._shards: Dict[str, int] = {}
+        self._dirty = False
+        # Flat layout: mtime of the manifest if stamped after a scan, and of the directory when scanned
+        self._stamp_ns: Optional[int] = None
+        self._scanned_mtime_ns: Optional[int] = None
+
+    @property
+    def entries(self) -> Dict[str, Dict[str, Any]]:
+        if self._entries is None:
+            try:
+                with open(self.path, 'r') as f:
+                    mtime_ns = os.fstat(f.fileno()).st_mtime_ns
+                    data = json.load(f)
+                self._entries = data.get("capsules", {})
+                self._shards = data.get("shards", {})
+                self._stamp_ns = mtime_ns if data.get("scanned") else None
+            except (OSError, ValueError):
+                self._entries = {}
+        return self._entries
+
+    def _entry(self, capsule_id: str) -> Dict[str, Any]:
+        entry = self.entries.get(capsule_id)
+        if entry is None:
+            entry = self.entries[capsule_id] = {
+                "capsule_type": None, "occupied": 0, "slots": 0,
+                "ledger_length": 0, "capsule_mtime_ns": None, "ledger_mtime_ns": None,
+            }
+        entry["shard"] = self.layout.shard(capsule_id)
+        return entry
+
+    def record_capsule(self, capsule_id: str, data: Optional[Dict[str, Any]], mtime_ns: int) -> None:
+        entry = self._entry(capsule_id)
+        entry.update(summarize_capsule(data) if data else {"capsule_type": None})
+        entry["capsule_mtime_ns"] = mtime_ns
+        self._dirty = True
+
+    def record_ledger(self, capsule_id: str, length: int, mtime_ns: int) -> None:
+        entry = self._entry(capsule_id)
+        entry["ledger_length"] = length
+        entry["ledger_mtime_ns"] = mtime_ns
+        self._dirty = True
+
+    def summaries(
+        self,
+        load_capsule: Callable[[str], Optional[Dict[str, Any]]],
+        ledger_length: Callable[[str], int],
+    ) -> List[Dict[str, Any]]:
+        """Summaries for every capsule file, re-reading only files that changed."""
+        entries = self.entries
+        by_shard: Dict[Optional[str], List[str]] = {}
+        for capsule_id, entry in entries.items():
+            by_shard.setdefault(entry.get("shard"), []).append(capsule_id)
+
+        now = time.time_ns()
+        results = []
+        for shard, directory in self.layout.directories():
+            try:
+                dir_mtime_ns = os.stat(directory).st_mtime_ns
+            except FileNotFoundError:
+                continue
+            if shard is None:
+                unchanged = self._stamp_ns == dir_mtime_ns
+            else:
+                unchanged = self._shards.get(shard) == dir_mtime_ns
+            if unchanged:
+                results.extend(dict(entries[cid], capsule_id=cid) for cid in by_shard.get(shard, ()))
+                continue
+
+            capsule_mtimes: Dict[str, int] = {}
+            ledger_mtimes: Dict[str, int] = {}
+            for capsule_id, suffix, mtime_ns in self.layout.scan(directory):
+                if suffix == CAPSULE_SUFFIX:
+                    capsule_mtimes[capsule_id] = mtime_ns
+                else:
+                    ledger_mtimes[capsule_id] = mtime_ns
+            results.extend(
+                self._revalidate(capsule_id, mtime_ns, ledger_mtimes.get(capsule_id),
+                                 load_capsule, ledger_length)
+                for capsule_id, mtime_ns in capsule_mtimes.items()
+            )
+            if shard is None:
+                self._scanned_mtime_ns = dir_mtime_ns
+            elif now - dir_mtime_ns > RACY_NS:
+                self._shards[shard] = dir_mtime_ns
+            else:
+                self._shards.pop(shard, None)
+            self._dirty = True
+
+        # Capsules removed (or moved by a layout migration) since the last listing
+        if len(results) != len(entries):
+            listed = {summary["capsule_id"] for summary in results}
+            for capsule_id in [cid for cid in entries if cid not in listed]:
+                del entries[capsule_id]
+            self._dirty = True
+        return results
+
+    def summary(
+        self,
+        capsule_id: str,
+        load_capsule: Callable[[str], Optional[Dict[str, Any]]],
+        ledger_length: Callable[[str], int],
+    ) -> Optional[Dict[str, Any]]:
+        """Summary of one capsule, re-reading its files only if they changed."""
+        try:
+            mtime_ns = os.stat(self.layout.capsule_file(capsule_id)).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        try:
+            ledger_mtime_ns = os.stat(self.layout.ledger_file(capsule_id)).st_mtime_ns
+        except FileNotFoundError:
+            ledger_mtime_ns = None
+        return self._revalidate(capsule_id, mtime_ns, ledger_mtime_ns, load_capsule, ledger_length)
+
+    def _revalidate(
+        self,
+        capsule_id: str,
+        mtime_ns: int,
+        ledger_mtime_ns: Optional[int],
+        load_capsule: Callable[[str], Optional[Dict[str, Any]]],
+        ledger_length: Callable[[str], int],
+    ) -> Dict[str, Any]:
+        entry = self.entries.get(capsule_id)
+        if entry is None or entry["capsule_mtime_ns"] != mtime_ns:
+            self.record_capsule(capsule_id, load_capsule(capsule_id), mtime_ns)
+            entry = self.entries[capsule_id]
+        elif entry.get("shard") != self.layout.shard(capsule_id):
+            # Moved by a layout migration (renames keep the mtime)
+            self._entry(capsule_id)
+            self._dirty = True
+        if entry["ledger_mtime_ns"] != ledger_mtime_ns:
+            length = ledger_length(capsule_id) if ledger_mtime_ns is not None else 0
+            self.record_ledger(capsule_id, length, ledger_mtime_ns)
+        return dict(entry, capsule_id=capsule_id)
+
+    def flush(self) -> None:
+        if not self._dirty:
+            return
+        directory = self.path.parent
+        scanned = self._scanned_mtime_ns
+        stamp = scanned is not None and os.stat(directory).st_mtime_ns == scanned
+        atomic_write_json(self.path, {
+            "version": 1, "capsules": self._entries, "shards": self._shards, "scanned": stamp,
+        })
+        self._dirty = False
+        self._scanned_mtime_ns = self._stamp_ns = None
+        if stamp:
+            dir_mtime_ns = os.stat(directory).st_mtime_ns
+            os.utime(self.path, ns=(dir_mtime_ns, dir_mtime_ns))
+            self._stamp_ns = dir_mtime_ns
@@ -0,0 +1,335 @@
+"""
+SQLite store - capsules, ledgers and invitations in one WAL-mode database.
+
+Invitations are rows indexed by recipient, sender, timestamp and expiry,
+so per-capsule queries, single-invitation updates and expiry sweeps touch
+only the rows they need. Ledgers are append-only: saving a ledger inserts the entries that are
+not stored yet, and a ledger that does not extend the stored one is refused. ``capsule_summaries`` is kept current by the same
+transactions that save capsules and ledgers.
+"""
+import json
+import sqlite3
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Iterator, List, Optional
+
+from src.storage import DB_NAME, LedgerConflictError
+from src.storage.files import SharedLayoutLock
+from src.storage.manifest import summarize_capsule
+
+if TYPE_CHECKING:
+    from src.core.ledger import Ledger, LedgerEntry
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS capsules (
+    capsule_id   TEXT PRIMARY KEY,
+    capsule_type TEXT NOT NULL,
+    data         TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS ledgers (
+    capsule_id       TEXT PRIMARY KEY,
+    sequence_counter INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS ledger_entries (
+    capsule_id      TEXT NOT NULL,
+    sequence_number INTEGER NOT NULL,
+    timestamp_ns    INTEGER NOT NULL,
+    event_type      TEXT NOT NULL,
+    tags            TEXT NOT NULL,
+    event           TEXT NOT NULL,
+    PRIMARY KEY (capsule_id, sequence_number)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS invitations (
+    id         TEXT PRIMARY KEY,
+    sender     TEXT NOT NULL,
+    recipient  TEXT NOT NULL,
+    slot       TEXT NOT NULL,
+    starter_id TEXT NOT NULL,
+    timestamp  TEXT NOT NULL,
+    expires_ns INTEGER,
+    data       TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS invitations_recipient ON invitations (recipient, timestamp);
+CREATE INDEX IF NOT EXISTS invitations_sender ON invitations (sender, timestamp);
+CREATE INDEX IF NOT EXISTS invitations_timestamp ON invitations (timestamp);
+CREATE TABLE IF NOT EXISTS capsule_summaries (
+    capsule_id    TEXT PRIMARY KEY,
+    capsule_type  TEXT,
+    occupied      INTEGER NOT NULL DEFAULT 0,
+    slots         INTEGER NOT NULL DEFAULT 0,
+    ledger_length INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+
+class SqliteStore:
+    backend = "sqlite"
+
+    def __init__(self, data_dir: Path, filename: str = DB_NAME):
+        self.data_dir = Path(data_dir)
+        self.data_dir.mkdir(parents=True, exist_ok=True)
+        self.path = self.data_dir / filename
+        # Migrations set the database aside; not while it is open
+        self._layout_lock = SharedLayoutLock(self.data_dir)
+        # Commands on different capsules still queue for SQLite's single writer
+        self._conn = sqlite3.connect(str(self.path), timeout=30.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._upgrade()
+
+    def _upgrade(self) -> None:
+        """Bring databases created by older versions up to ``SCHEMA``."""
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(invitations)")}
+        with self._conn:
+            if "expires_ns" not in columns:
+                self._conn.execute("ALTER TABLE invitations ADD COLUMN expires_ns INTEGER")
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS invitations_expiry ON invitations (expires_ns)"
+            )
+
+    def data_version(self) -> int:
+        """Changes whenever another connection commits to the database."""
+        return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    # Version tokens for CachedStore: one generation for the whole database
+    def capsule_version(self, capsule_id: str) -> int:
+        return self.data_version()
+
+    def ledger_version(self, capsule_id: str) -> int:
+        return self.data_version()
+
+    def invitations_version(self) -> int:
+        return self.data_version()
+
+    # -- capsules ----------------------------------------------------------
+
+    def load_capsule(self, capsule_id: str) -> Optional[Dict]:
+        row = self._conn.execute(
+            "SELECT data FROM capsules WHERE capsule_id = ?", (capsule_id,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save_capsule(self, capsule_id: str, data: Dict) -> None:
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO capsules (capsule_id, capsule_type, data) VALUES (?, ?, ?)",
+                (capsule_id, data.get("capsule_type", ""), json.dumps(data)),
+            )
+            self._save_summary(capsule_id, data)
+
+    def _save_summary(self, capsule_id: str, data: Dict) -> None:
+        summary = summarize_capsule(data)
+        self._conn.execute(
+            "INSERT INTO capsule_summaries (capsule_id, capsule_type, occupied, slots)"
+            " VALUES (?, ?, ?, ?) ON CONFLICT (capsule_id) DO UPDATE SET"
+            " capsule_type = excluded.capsule_type, occupied = excluded.occupied,"
+            " slots = excluded.slots",
+            (capsule_id, summary["capsule_type"], summary["occupied"], summary["slots"]),
+        )
+
+    def capsule_ids(self) -> List[str]:
+        return [row[0] for row in self._conn.execute("SELECT capsule_id FROM capsules")]
+
+    def iter_capsules(self) -> Iterator[Dict]:
+        for (data,) in self._conn.execute("SELECT data FROM capsules"):
+            yield json.loads(data)
+
+    def capsule_summaries(self) -> List[Dict[str, Any]]:
+        """Type, slot occupancy and ledger length of every capsule."""
+        missing = self._conn.execute(
+            "SELECT capsule_id, data FROM capsules"
+            " WHERE capsule_id NOT IN (SELECT capsule_id FROM capsule_summaries)"
+        ).fetchall()
+        if missing:
+            # Databases written before summaries existed
+            with self._conn:
+                for capsule_id, data in missing:
+                    self._save_summary(capsule_id, json.loads(data))
+                    self._conn.execute(
+                        "UPDATE capsule_summaries SET ledger_length ="
+                        " (SELECT COUNT(*) FROM ledger_entries WHERE capsule_id = ?)"
+                        " WHERE capsule_id = ?",
+                        (capsule_id, capsule_id),
+                    )
+        return self._summaries()
+
+    def capsule_summary(self, capsule_id: str) -> Optional[Dict[str, Any]]:
+        found = self._summaries("WHERE s.capsule_id = ?", (capsule_id,))
+        if not found and self.load_capsule(capsule_id) is not None:
+            found = [s for s in self.capsule_summaries() if s["capsule_id"] == capsule_id]
+        return found[0] if found else None
+
+    def _summaries(self, where: str = "", params: tuple = ()) -> List[Dict[str, Any]]:
+        return [
+            {"capsule_id": capsule_id, "capsule_type": capsule_type, "occupied": occupied,
+             "slots": slots, "ledger_length": ledger_length}
+            for capsule_id, capsule_type, occupied, slots, ledger_length in self._conn.execute(
+                "SELECT s.capsule_id, s.capsule_type, s.occupied, s.slots, s.ledger_length"
+                " FROM capsule_summaries s JOIN capsules c ON c.capsule_id = s.capsule_id "
+                + where,
+                params,
+            )
+        ]
+
+    # -- ledgers -----------------------------------------------------------
+
+    def load_ledger(self, capsule_id: str) -> "Ledger":
+        from src.core.ledger import Ledger, LedgerEntry
+        from src.events import Event
+
+        ledger = Ledger(capsule_id)
+        row = self._conn.execute(
+            "SELECT sequence_counter FROM ledgers WHERE capsule_id = ?", (capsule_id,)
+        ).fetchone()
+        if row is None:
+            return ledger
+        ledger._sequence_counter = row[0]
+        ledger.entries = [
+            LedgerEntry(
+                event=Event.from_dict(json.loads(event)),
+                timestamp_ns=timestamp_ns,
+                capsule_id=ledger.capsule_id,
+                sequence_number=sequence_number,
+                tags=json.loads(tags),
+            )
+            for sequence_number, timestamp_ns, tags, event in self._conn.execute(
+                "SELECT sequence_number, timestamp_ns, tags, event FROM ledger_entries"
+                " WHERE capsule_id = ? ORDER BY sequence_number",
+                (capsule_id,),
+            )
+        ]
+        return ledger
+
+    def save_ledger(self, capsule_id: str, ledger: "Ledger") -> None:
+        """
+        Insert the entries past the stored ones. Raises ``LedgerConflictError``
+        if ``ledger`` lacks stored entries or its entry at the stored end is
+        a different event: it was loaded before another writer appended.
+        """
+        entries = ledger.entries
+        with self._conn:
+            row = self._conn.execute(
+                "SELECT sequence_number, event FROM ledger_entries WHERE capsule_id = ?"
+                " ORDER BY sequence_number DESC LIMIT 1",
+                (capsule_id,),
+            ).fetchone()
+            stored = row[0] if row else 0
+            if stored:
+                mine = entries[stored - 1] if len(entries) >= stored else None
+                if mine is None or mine.sequence_number != stored:
+                    raise LedgerConflictError(
+                        f"Ledger '{capsule_id}' has {stored} stored entries; "
+                        f"the one being saved has {len(entries)}"
+                    )
+                if mine.id != json.loads(row[1]).get("event_id"):
+                    raise LedgerConflictError(
+                        f"Ledger '{capsule_id}' differs from the stored one at entry #{stored}"
+                    )
+            self._insert_entries(capsule_id, ledger, entries[stored:])
+
+    def replace_ledger(self, capsule_id: str, ledger: "Ledger") -> None:
+        """Store ``ledger`` in place of the stored one, e.g. after merging replicas."""
+        with self._conn:
+            self._conn.execute("DELETE FROM ledger_entries WHERE capsule_id = ?", (capsule_id,))
+            self._insert_entries(capsule_id, ledger, ledger.entries)
+
+    def _insert_entries(self, capsule_id: str, ledger: "Ledger", new_entries: List["LedgerEntry"]) -> None:
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO ledger_entries"
+            " (capsule_id, sequence_number, timestamp_ns, event_type, tags, event)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            [
+                (capsule_id, entry.sequence_number, entry.timestamp_ns,
+                 entry.event.event_type, json.dumps(list(entry.tags)),
+                 json.dumps(entry.event.to_dict()))
+                for entry in new_entries
+            ],
+        )
+        self._conn.execute(
+            "INSERT OR REPLACE INTO ledgers (capsule_id, sequence_counter) VALUES (?, ?)",
+            (capsule_id, ledger._sequence_counter),
+        )
+        self._conn.execute(
+            "INSERT INTO capsule_summaries (capsule_id, ledger_length) VALUES (?, ?)"
+            " ON CONFLICT (capsule_id) DO UPDATE SET ledger_length = excluded.ledger_length",
+            (capsule_id, len(ledger.entries)),
+        )
+
+    def ledger_ids(self) -> List[str]:
+        return [row[0] for row in self._conn.execute("SELECT capsule_id FROM ledgers")]
+
+    # -- invitations -------------------------------------------------------
+
+    def _invitations(self, where: str = "", params: tuple = ()) -> List[Dict]:
+        return [
+            json.loads(data)
+            for (data,) in self._conn.execute(
+                f"SELECT data FROM invitations {where} ORDER BY timestamp, rowid", params
+            )
+        ]
+
+    def load_invitations(self) -> List[Dict]:
+        return self._invitations()
+
+    def save_invitations(self, invitations: List[Dict]) -> None:
+        with self._conn:
+            self._conn.execute("DELETE FROM invitations")
+            self._insert_invitations(invitations)
+
+    def _insert_invitations(self, invitations: Iterable[Dict]) -> None:
+        self._conn.executemany(
+            "INSERT INTO invitations"
+            " (id, sender, recipient, slot, starter_id, timestamp, expires_ns, data)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (inv['id'], inv['sender'], inv['recipient'], inv['slot'],
+                 inv['starter_id'], inv.get('timestamp', ''), inv.get('expires_ns'),
+                 json.dumps(inv))
+                for inv in invitations
+            ],
+        )
+
+    def get_invitation(self, invitation_id: str) -> Optional[Dict]:
+        found = self._invitations("WHERE id = ?", (invitation_id,))
+        return found[0] if found else None
+
+    def invitations_for(self, recipient_id: str) -> List[Dict]:
+        return self._invitations("WHERE recipient = ?", (recipient_id,))
+
+    def invitations_from(self, sender_id: str) -> List[Dict]:
+        return self._invitations("WHERE sender = ?", (sender_id,))
+
+    def count_invitations(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM invitations").fetchone()[0]
+
+    def next_invitation_expiry(self) -> Optional[int]:
+        return self._conn.execute("SELECT MIN(expires_ns) FROM invitations").fetchone()[0]
+
+    def expired_invitations(self, now_ns: int) -> List[Dict]:
+        return [
+            json.loads(data)
+            for (data,) in self._conn.execute(
+                "SELECT data FROM invitations WHERE expires_ns <= ? ORDER BY expires_ns, rowid",
+                (now_ns,),
+            )
+        ]
+
+    def add_invitation(self, invitation: Dict) -> None:
+        self.add_invitations([invitation])
+
+    def add_invitations(self, invitations: List[Dict]) -> None:
+        with self._conn:
+            self._insert_invitations(invitations)
+
+    def remove_invitations(self, invitation_ids: Iterable[str]) -> None:
+        with self._conn:
+            self._conn.executemany(
+                "DELETE FROM invitations WHERE id = ?", [(i,) for i in invitation_ids]
+            )
+
+    def flush(self) -> None:
+        self._conn.commit()
+
+    def close(self) -> None:
+        self._conn.close()
+        self._layout_lock.release()
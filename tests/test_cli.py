@@ -86,6 +86,291 @@ def test_cli_simulation():
         return len(files) >= 3  # At least 3 files (capsule, ledger, state)
 
 
+def test_batch_runner(tmp_path, capsys, monkeypatch):
+    """Batch operations are applied in memory and written once at the end."""
+    import cli
+    from src.storage.json_store import JsonStore
+    
+    ops = [
+        {"op": "create", "type": "genesis", "id": "alice"},
+        {"op": "create", "type": "proto", "id": "bob"},
+        {"op": "invite", "sender": "alice", "recipient": "bob", "slot": "⚡ Juice", "ref": "j"},
+        {"op": "invite", "sender": "alice", "recipient": "bob", "slot": "🌱 Seed"},
+        {"op": "accept", "capsule": "bob", "ref": "j"},
+        {"op": "accept", "capsule": "bob", "from": "alice", "slot": "🌱 Seed"},
+        {"op": "accept", "capsule": "bob", "from": "alice", "slot": "🔥 Kick"},
+    ]
+    ops_file = tmp_path / "ops.jsonl"
+    ops_file.write_text("\n".join(json.dumps(op) for op in ops) + "\n")
+    
+    manager = cli.CapsuleManager(tmp_path / "data", backend="json")
+    writes = []
+    save_capsule = JsonStore.save_capsule
+    monkeypatch.setattr(JsonStore, "save_capsule",
+                        lambda store, cid, data: (writes.append(cid), save_capsule(store, cid, data)))
+    
+    assert cli.run_batch(str(ops_file), manager) == 1
+    assert "No matching invitation" in capsys.readouterr().out
+    assert sorted(writes) == ["alice", "bob"]
+    
+    bob = Capsule.from_dict(manager.store.backing.load_capsule("bob"))
+    assert bob.get_starter_id("⚡ Juice") and bob.get_starter_id("🌱 Seed")
+    assert manager.store.backing.load_invitations() == []
+    assert len(manager.store.backing.load_ledger("bob").entries) == 2
+
+
+def test_accept_generates_new_starter(tmp_path):
+    """Accepting fills the empty slot with a new starter; the sender keeps its own (spec §4)."""
+    import cli
+    from src.core.registry import OwnershipStatus
+
+    manager = cli.CapsuleManager(tmp_path, backend="json")
+    cli.create_capsule("genesis", "alice", manager)
+    cli.create_capsule("proto", "bob", manager)
+    cli.create_capsule("proto", "carol", manager)
+    offered = manager.get_capsule("alice").get_starter_id("⚡ Juice")
+    assert cli.accept_invitation("bob", cli.send_invitation("alice", "bob", "⚡ Juice", manager), manager)
+
+    new_starter = manager.get_capsule("bob").get_starter_id("⚡ Juice")
+    assert new_starter not in (None, offered)
+    assert manager.get_capsule("alice").get_starter_id("⚡ Juice") == offered
+    registry = manager.load_starter_registry()
+    assert registry.owner_of(new_starter) == "bob"
+    assert registry.get(offered).status == OwnershipStatus.HELD
+    assert cli.send_invitation("alice", "carol", "⚡ Juice", manager)
+
+
+def _invite(data_dir, slot):
+    import cli
+
+    manager = cli.CapsuleManager(data_dir)
+    assert cli.send_invitation("alice", "bob", slot, manager)
+    manager.close()
+
+
+def test_batch_holds_off_concurrent_writers(tmp_path, monkeypatch):
+    """A command started during a batch waits for it, so the batch's flush keeps its writes."""
+    import subprocess
+    import time
+    import cli
+
+    root = Path(__file__).resolve().parent.parent
+    env = dict(os.environ, HOME=str(tmp_path), CAPSULENET_BACKEND="json")
+    ops_file = tmp_path / "ops.jsonl"
+    ops_file.write_text(json.dumps({"op": "create", "type": "genesis", "id": "alice"}) + "\n")
+
+    writers = []
+    run_batch_op = cli.run_batch_op
+
+    def run_op_then_write_elsewhere(op, manager, refs):
+        ok = run_batch_op(op, manager, refs)
+        writers.append(subprocess.Popen(
+            [sys.executable, str(root / "cli.py"), "--no-daemon", "create", "genesis", "carol"],
+            cwd=root, env=env, stdout=subprocess.DEVNULL,
+        ))
+        time.sleep(1)  # long enough for the create to finish, were it not held off
+        return ok
+
+    monkeypatch.setattr(cli, "run_batch_op", run_op_then_write_elsewhere)
+    data_dir = tmp_path / ".capsulenet"
+    assert cli.run_batch(str(ops_file), cli.CapsuleManager(data_dir, backend="json")) == 0
+    assert writers[0].wait(timeout=30) == 0
+
+    registry = cli.CapsuleManager(data_dir, backend="json").load_starter_registry()
+    assert sorted(record["capsule_id"] for record in registry.to_dict().values()) == \
+        ["alice"] * 5 + ["carol"] * 5
+
+
+def test_concurrent_invites_keep_every_update(tmp_path):
+    """Parallel processes sending from one capsule serialize on its lock."""
+    import multiprocessing
+    import cli
+
+    manager = cli.CapsuleManager(tmp_path, backend="json")
+    cli.create_capsule("genesis", "alice", manager)
+    cli.create_capsule("proto", "bob", manager)
+    manager.close()
+
+    ctx = multiprocessing.get_context("fork")
+    slots = ["⚡ Juice", "💥 Spark", "🌱 Seed", "📡 Pulse", "🔥 Kick"]
+    workers = [ctx.Process(target=_invite, args=(tmp_path, slot)) for slot in slots]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert all(worker.exitcode == 0 for worker in workers)
+
+    manager = cli.CapsuleManager(tmp_path)
+    assert sorted(inv['slot'] for inv in manager.invitations_for("bob")) == sorted(slots)
+    # Five starters generated, then five invitations
+    assert len(manager.load_ledger("alice").entries) == 2 * len(slots)
+
+
+def test_invites_hold_shared_locks_only_around_their_updates(tmp_path, monkeypatch):
+    import cli
+    from src.storage import files
+
+    manager = cli.CapsuleManager(tmp_path, backend="json")
+    cli.create_capsule("genesis", "alice", manager)
+    cli.create_capsule("proto", "bob", manager)
+    held = []
+    load_ledger = manager.load_ledger
+    def spy(capsule_id):
+        held.extend(os.path.basename(path) for _, path in files._held)
+        return load_ledger(capsule_id)
+    monkeypatch.setattr(manager, "load_ledger", spy)
+
+    assert cli.accept_invitation("bob", cli.send_invitation("alice", "bob", "⚡ Juice", manager), manager)
+    assert held and not {"invitations.lock", "starters.lock", "admission.lock"} & set(held)
+    assert any(name.startswith("capsule-") for name in held)
+
+def test_cached_manager_follows_other_writers(tmp_path):
+    """A daemon's cached registry and current capsule pick up --no-daemon writes."""
+    import cli
+
+    daemon = cli.CapsuleManager(tmp_path, backend="json")
+    daemon.enable_cache()
+    cli.create_capsule("genesis", "alice", daemon)
+    assert len(daemon.load_starter_registry()) == 5
+
+    other = cli.CapsuleManager(tmp_path, backend="json")
+    cli.create_capsule("genesis", "carol", other)
+    cli.create_capsule("proto", "dave", other)
+    assert daemon.get_current_capsule_id() == "dave"
+    assert cli.send_invitation("carol", "dave", "⚡ Juice", daemon)
+    assert len(cli.CapsuleManager(tmp_path).load_starter_registry()) == 10
+
+
+def test_invitations_expire(tmp_path, capsys):
+    """Unanswered invitations are swept before the next invitation command."""
+    import cli
+    from src.clock import FakeClock, set_clock
+    from src.core.registry import OwnershipStatus
+    from src.modules.expiry import DAY, NS_PER_SECOND
+
+    clock = FakeClock(start_ns=1_700_000_000 * NS_PER_SECOND)
+    previous = set_clock(clock)
+    try:
+        manager = cli.CapsuleManager(tmp_path, backend="sqlite")
+        cli.create_capsule("genesis", "alice", manager)
+        cli.create_capsule("proto", "bob", manager)
+        old = cli.send_invitation("alice", "bob", "⚡ Juice", manager)
+        clock.advance(DAY * NS_PER_SECOND)
+        cli.send_invitation("alice", "bob", "🌱 Seed", manager)
+        starter_id = manager.get_invitation(old)["starter_id"]
+
+        clock.advance(6 * DAY * NS_PER_SECOND)
+        capsys.readouterr()
+        cli.show_invitations("bob", manager)
+        assert old not in capsys.readouterr().out  # hidden, not yet swept
+        assert not cli.accept_invitation("bob", old, manager)
+        assert "not found" in capsys.readouterr().out
+
+        assert [inv["slot"] for inv in manager.invitations_for("bob")] == ["🌱 Seed"]
+        assert manager.load_starter_registry().get(starter_id).status == OwnershipStatus.HELD
+        events = [e.event.event_type for e in manager.load_ledger("alice").entries]
+        assert events == ["starter"] * 5 + ["invitation", "invitation", "invitation_expired"]
+        assert cli.expire_invitations(manager) == 0
+        manager.close()
+    finally:
+        set_clock(previous)
+
+
+def test_projections_catch_up_from_checkpoint(tmp_path):
+    """Views are rebuilt from ledgers once, then only new entries are read."""
+    import cli
+
+    manager = cli.CapsuleManager(tmp_path, backend="json")
+    cli.create_capsule("genesis", "alice", manager)
+    cli.create_capsule("proto", "bob", manager)
+    juice = cli.send_invitation("alice", "bob", "⚡ Juice", manager)
+    cli.send_invitation("alice", "bob", "🌱 Seed", manager)
+    cli.accept_invitation("bob", juice, manager)
+
+    projector = manager.load_projections()
+    assert projector.positions == {"alice": 7, "bob": 1}
+    assert projector["starter_counts"].counts_for("alice") == {"generated": 5, "received": 0, "burned": 0}
+    assert [inv["slot"] for inv in projector["pending_invitations"].pending_for("bob")] == ["🌱 Seed"]
+    assert projector["accepted_invitations"].count_for("alice") == 1
+
+    loaded = []
+    manager = cli.CapsuleManager(tmp_path, backend="json")
+    load_ledger = manager.load_ledger
+    manager.load_ledger = lambda capsule_id: (loaded.append(capsule_id), load_ledger(capsule_id))[1]
+    cli.process_inbox_command("bob", "accept", manager)
+    loaded.clear()
+    projector = manager.load_projections()
+    assert loaded == ["bob"]
+    assert projector["pending_invitations"].pending_for("bob") == []
+    assert projector["starter_counts"].counts_for("bob")["received"] == 2
+
+
+def test_sync_copies_only_missing_entries(tmp_path, capsys):
+    """Replicas in two data directories converge without copying whole ledgers."""
+    import shutil
+    import cli
+
+    manager = cli.CapsuleManager(tmp_path / "laptop", backend="json")
+    cli.create_capsule("genesis", "alice", manager)
+    cli.create_capsule("proto", "bob", manager)
+    cli.send_invitation("alice", "bob", "⚡ Juice", manager)
+    manager.close()
+    shutil.copytree(tmp_path / "laptop", tmp_path / "phone")
+
+    laptop = cli.CapsuleManager(tmp_path / "laptop", backend="json")
+    cli.send_invitation("alice", "bob", "🌱 Seed", laptop)
+    capsys.readouterr()
+    assert cli.sync_replica("alice", str(tmp_path / "phone"), laptop)
+    assert "pulled 0, pushed 1 entries" in capsys.readouterr().out
+
+    phone = cli.CapsuleManager(tmp_path / "phone", backend="json")
+    assert [e.id for e in phone.load_ledger("alice").entries] == \
+        [e.id for e in laptop.load_ledger("alice").entries]
+    cli.send_invitation("alice", "bob", "💥 Spark", phone)
+    cli.send_invitation("alice", "bob", "📡 Pulse", laptop)
+    capsys.readouterr()
+    assert cli.sync_replica("alice", str(tmp_path / "laptop"), phone)
+    assert "merged their histories from entry #8 on" in capsys.readouterr().out
+
+    laptop.invalidate_cache()
+    merged = [e.id for e in phone.load_ledger("alice").entries]
+    assert len(merged) == 9 and merged == [e.id for e in laptop.load_ledger("alice").entries]
+    assert [e.sequence_number for e in phone.load_ledger("alice").entries] == list(range(1, 10))
+
+
+# Generous enough for a loaded CI machine; a cold import is ~30 ms locally
+IMPORT_BUDGET_US = 250_000
+
+
+def test_startup_import_budget(tmp_path):
+    """`list` must not pay for the core model, events, sqlite3 or socketserver."""
+    import subprocess
+
+    root = Path(__file__).resolve().parent.parent
+    env = dict(os.environ, HOME=str(tmp_path), CAPSULENET_BACKEND="json")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", str(root / "cli.py"), "--no-daemon", "list"],
+        cwd=root, env=env, capture_output=True, text=True, check=True,
+    )
+    timings = {}
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, name = line.split("|")
+            if cumulative.strip().isdigit():
+                timings[name.strip()] = int(cumulative)
+
+    heavy = {"src.core", "src.events", "src.modules", "sqlite3", "socketserver", "numpy", "scipy"}
+    assert heavy.isdisjoint(timings)
+    assert "src.storage.json_store" in timings
+
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import cli"],
+        cwd=root, env=env, capture_output=True, text=True, check=True,
+    )
+    line = next(l for l in result.stderr.splitlines() if l.rstrip().endswith("| cli"))
+    assert int(line.split("|")[1]) < IMPORT_BUDGET_US
+
+
 def main():
     """Run CLI tests."""
     print("=" * 60)
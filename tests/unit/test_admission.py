@@ -0,0 +1,63 @@
+import pytest
+from dataclasses import replace
+from src.clock import FakeClock
+from src.core.capsule import CapsuleType
+from src.modules.admission import AdmissionController, AdmissionPolicy
+
+POLICY = AdmissionPolicy(sender_rate=1.0, sender_burst=3, recipient_rate=1.0,
+                         recipient_burst=5, max_in_flight=100)
+
+def _controller(clock, **policy):
+    policies = {CapsuleType.PROTO: replace(POLICY, **policy)}
+    return AdmissionController(policies=policies, clock=clock)
+
+def test_sender_bucket_limits_and_refills():
+    clock = FakeClock(start_ns=0)
+    admission = _controller(clock)
+    assert [admission.admit("a", f"r{i}") for i in range(3)] == [None, None, None]
+    assert "too fast" in admission.admit("a", "r9")
+    
+    clock.advance(1_000_000_000)
+    assert admission.admit("a", "r9") is None
+    assert admission.admit("a", "r9") is not None
+
+def test_flooding_sender_does_not_starve_recipient():
+    clock = FakeClock(start_ns=0)
+    admission = _controller(clock)
+    for _ in range(50):
+        admission.admit("spammer", "b")
+    assert admission.admit("friend", "b") is None
+
+def test_recipient_bucket():
+    admission = _controller(FakeClock(start_ns=0), sender_burst=100)
+    results = [admission.admit(f"s{i}", "b") for i in range(6)]
+    assert results[:5] == [None] * 5
+    assert "receiving too many" in results[5]
+
+def test_in_flight_cap_and_release():
+    admission = _controller(FakeClock(start_ns=0), max_in_flight=2, sender_burst=10)
+    assert admission.admit("a", "b") is None
+    assert admission.admit("a", "c") is None
+    assert admission.admit("a", "d") == "too many pending invitations"
+    admission.release()
+    assert admission.admit("a", "d") is None
+
+def test_policy_per_capsule_type():
+    admission = AdmissionController(
+        policies={CapsuleType.LINKED: AdmissionPolicy(recipient_burst=1)},
+        clock=FakeClock(start_ns=0),
+    )
+    assert admission.admit("a", "b", CapsuleType.LINKED) is None
+    assert admission.admit("c", "b", CapsuleType.LINKED) is not None
+    assert admission.admit("c", "d", CapsuleType.PROTO) is None
+
+def test_state_round_trip():
+    clock = FakeClock(start_ns=0)
+    admission = _controller(clock)
+    for _ in range(3):
+        admission.admit("a", "b")
+    restored = AdmissionController.from_dict(
+        admission.to_dict(), policies={CapsuleType.PROTO: POLICY}, clock=clock
+    )
+    assert restored.in_flight == 3
+    assert restored.admit("a", "b") is not None
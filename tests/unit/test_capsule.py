@@ -22,3 +22,58 @@ def test_capsule_relationship_management():
     
     rel.invited = True
     assert capsule.get_relationship("b").invited == True
+
+def test_create_many_genesis_has_unique_starters():
+    from src.core.capsule import SLOT_TYPES
+    capsules = Capsule.create_many([f"g{i}" for i in range(20)], CapsuleType.GENESIS)
+    assert [c.capsule_id for c in capsules] == [f"g{i}" for i in range(20)]
+    starter_ids = [slot.starter_id for c in capsules for slot in c.slots.values()]
+    assert len(starter_ids) == 20 * len(SLOT_TYPES)
+    assert len(set(starter_ids)) == len(starter_ids)
+    assert all(len(s) == 36 and s[14] == "4" for s in starter_ids)
+
+def test_create_many_proto_is_empty():
+    capsules = Capsule.create_many(["p1", "p2"], CapsuleType.PROTO)
+    assert all(c.is_slot_empty(name) for c in capsules for name in c.slots)
+
+def test_from_dict_round_trip_keeps_starters():
+    capsule = Capsule(capsule_id="g", capsule_type=CapsuleType.GENESIS)
+    capsule.add_connection("conn1")
+    restored = Capsule.from_dict(capsule.to_dict())
+    assert restored == capsule
+
+def test_slot_bitmask_operations():
+    capsule = Capsule(capsule_id="p", capsule_type=CapsuleType.PROTO)
+    assert capsule.has_empty_slot()
+    assert capsule.find_empty_slot() == 0
+    
+    capsule.occupy_slot(0, "s0")
+    capsule.get_slot("🌱 Seed").starter_id = "s2"
+    assert capsule.occupied_mask == 0b00101
+    assert capsule.find_empty_slot() == 1
+    assert not capsule.is_slot_empty("⚡ Juice")
+    assert not capsule.is_slot_empty("seed")
+    assert capsule.is_slot_empty("💥 Spark")
+    assert capsule.is_slot_empty("unknown")
+    
+    for index in (1, 3, 4):
+        capsule.occupy_slot(index, f"s{index}")
+    assert not capsule.has_empty_slot()
+    assert capsule.find_empty_slot() is None
+    
+    capsule.set_starter("kick", None)
+    assert capsule.find_empty_slot() == 4
+
+def test_capsule_is_slotted():
+    capsule = Capsule(capsule_id="g", capsule_type=CapsuleType.GENESIS)
+    assert not hasattr(capsule, "__dict__")
+    assert capsule.occupied_mask == 0b11111
+
+def test_locked_flag_round_trip():
+    capsule = Capsule(capsule_id="p", capsule_type=CapsuleType.PROTO)
+    capsule.get_slot("📡 Pulse").is_locked = True
+    data = capsule.to_dict()
+    assert data["slots"]["📡 Pulse"]["is_locked"] is True
+    restored = Capsule.from_dict(data)
+    assert restored.get_slot("pulse").is_locked
+    assert restored == capsule
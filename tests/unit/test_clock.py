@@ -0,0 +1,62 @@
+import pytest
+from datetime import datetime, timezone
+from src.clock import (
+    CoarseClock, FakeClock, set_clock, ns_to_datetime, datetime_to_ns, parse_timestamp,
+)
+from src.core.ledger import Ledger, LedgerEntry
+from src.events.base import Event
+
+@pytest.fixture
+def fake_clock():
+    clock = FakeClock(start_ns=1_700_000_000_000_000_000, step_ns=1000)
+    previous = set_clock(clock)
+    yield clock
+    set_clock(previous)
+
+def test_event_uses_injected_clock(fake_clock):
+    first = Event()
+    second = Event()
+    assert first.timestamp_ns == 1_700_000_000_000_000_000
+    assert second.timestamp_ns == first.timestamp_ns + 1000
+    assert first.timestamp == datetime(2023, 11, 14, 22, 13, 20)
+
+def test_datetime_round_trip():
+    value = datetime(2026, 1, 31, 12, 30, 15, 123456)
+    assert ns_to_datetime(datetime_to_ns(value)) == value
+    aware = value.replace(tzinfo=timezone.utc)
+    assert datetime_to_ns(aware) == datetime_to_ns(value)
+
+def test_parse_legacy_iso_timestamp():
+    data = {"timestamp": "2026-01-31T12:30:15.123456"}
+    assert ns_to_datetime(parse_timestamp(data)) == datetime(2026, 1, 31, 12, 30, 15, 123456)
+    assert parse_timestamp({"timestamp_ns": 42}) == 42
+    assert parse_timestamp({}) is None
+
+def test_ledger_serializes_integer_timestamps():
+    ledger = Ledger("c1", clock=FakeClock(start_ns=5000, step_ns=5000))
+    ledger.append(Event(event_type="test"))
+    ledger.append(Event(event_type="test"))
+    assert [e.timestamp_ns for e in ledger.entries] == [5000, 10000]
+    
+    restored = Ledger.from_dict(ledger.to_dict())
+    assert [e.timestamp_ns for e in restored.entries] == [5000, 10000]
+
+def test_legacy_ledger_entry_loads():
+    entry = LedgerEntry.from_dict({
+        "id": "e1",
+        "event": {"event_type": "test", "event_id": "e1",
+                  "timestamp": "2026-01-31T00:00:00", "metadata": {}},
+        "timestamp": "2026-01-31T00:00:01",
+        "capsule_id": "c1",
+        "sequence_number": 1,
+        "tags": [],
+    })
+    assert entry.timestamp == datetime(2026, 1, 31, 0, 0, 1)
+    assert entry.event.timestamp == datetime(2026, 1, 31)
+
+def test_coarse_clock_caches_readings():
+    clock = CoarseClock(refresh_every=1000)
+    readings = {clock.now_ns() for _ in range(10)}
+    assert len(readings) == 1
+    clock.refresh()
+    assert clock.now_ns() >= readings.pop()
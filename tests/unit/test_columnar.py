@@ -0,0 +1,58 @@
+import pytest
+from src.clock import FakeClock
+from src.core.columnar import LedgerColumns, np
+from src.core.ledger import Ledger
+from src.events import create_invitation_event, Event
+
+MODES = [False] + ([True] if np is not None else [])
+
+def _ledger(capsule_id, senders):
+    ledger = Ledger(capsule_id, clock=FakeClock(start_ns=0, step_ns=10))
+    for i, sender in enumerate(senders):
+        event = create_invitation_event(f"inv{i}", sender, capsule_id, f"s{i}", sender, "⚡ Juice")
+        ledger.append(event, tags=["invitation", "outgoing"])
+    accepted = Event(event_type="invitation_accepted")
+    accepted.metadata["sender"] = senders[0]
+    ledger.append(accepted, tags=["invitation", "accepted"])
+    return ledger
+
+@pytest.fixture(params=MODES)
+def columns(request):
+    ledgers = [_ledger("b", ["a", "a", "c"]), _ledger("d", ["a"])]
+    return LedgerColumns.from_ledgers(ledgers, fields=["sender_id"], use_numpy=request.param)
+
+def test_columns_lengths(columns):
+    assert len(columns) == 6
+    assert list(columns.sequence) == [1, 2, 3, 4, 1, 2]
+
+def test_select_filters(columns):
+    assert columns.count(event_type="invitation") == 4
+    assert columns.count(tags=["accepted"]) == 2
+    assert columns.count(sender_id="a", capsule_id="b") == 2
+    assert columns.count(since_ns=10, until_ns=30) == 3
+    assert columns.count(event_type="missing") == 0
+    assert columns.count(tags=["never-seen"]) == 0
+
+def test_group_by(columns):
+    assert columns.count_by("sender_id") == {"a": 3, "c": 1}
+    assert columns.count_by("event_type") == {"invitation": 4, "invitation_accepted": 2}
+    rows = columns.select(capsule_id="d")
+    assert columns.count_by("event_type", rows) == {"invitation": 1, "invitation_accepted": 1}
+
+def test_tag_counts_and_rate(columns):
+    counts = columns.tag_counts()
+    assert counts["invitation"] == 6
+    assert counts["outgoing"] == 4
+    assert counts["accepted"] == 2
+    assert columns.rate(20) == {0: 4, 20: 2}
+
+@pytest.mark.parametrize("use_numpy", MODES)
+def test_unhashable_metadata_values(use_numpy):
+    ledger = Ledger("a")
+    for labels in (["x", "y"], ["x", "y"], {"k": [1]}, None):
+        event = Event(event_type="tagged")
+        event.metadata["labels"] = labels
+        ledger.append(event)
+    columns = LedgerColumns.from_ledger(ledger, fields=["labels"], use_numpy=use_numpy)
+    assert columns.count_by("labels") == {("x", "y"): 2, (("k", (1,)),): 1}
+    assert columns.count(labels=["x", "y"]) == 2
@@ -0,0 +1,52 @@
+import socket
+import threading
+import pytest
+from src import daemon
+
+pytestmark = pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="needs Unix sockets")
+
+def test_forward_and_stop(tmp_path):
+    calls = []
+    def execute(argv):
+        calls.append(argv)
+        return f"ran {' '.join(argv)}\n", 3 if argv == ["fail"] else 0
+
+    assert daemon.forward(tmp_path, ["list"]) is None
+    server = daemon.NodeDaemon(tmp_path, execute)
+    thread = threading.Thread(target=server.serve)
+    thread.start()
+    try:
+        assert daemon.is_running(tmp_path)
+        assert daemon.forward(tmp_path, ["status", "alice"]) == ("ran status alice\n", 0)
+        assert daemon.forward(tmp_path, ["fail"]) == ("ran fail\n", 3)
+        with pytest.raises(RuntimeError):
+            daemon.NodeDaemon(tmp_path, execute)
+    finally:
+        assert daemon.stop(tmp_path)
+        thread.join(5)
+    assert calls == [["status", "alice"], ["fail"]]
+    assert not daemon.socket_path(tmp_path).exists()
+    assert not daemon.is_running(tmp_path)
+
+def test_stale_socket_is_replaced(tmp_path):
+    daemon.socket_path(tmp_path).write_text("")
+    assert daemon.forward(tmp_path, ["list"]) is None
+    server = daemon.NodeDaemon(tmp_path, lambda argv: ("", 0))
+    server.server_close()
+
+def test_lost_reply_is_an_error_not_no_daemon(tmp_path):
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(str(daemon.socket_path(tmp_path)))
+    listener.listen(1)
+    def accept_and_drop():
+        conn, _ = listener.accept()
+        conn.makefile("rb").readline()
+        conn.close()  # died mid-command
+    thread = threading.Thread(target=accept_and_drop)
+    thread.start()
+    try:
+        with pytest.raises(daemon.DaemonError):
+            daemon.forward(tmp_path, ["invite", "bob", "⚡ Juice"])
+    finally:
+        thread.join(5)
+        listener.close()
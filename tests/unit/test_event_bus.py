@@ -1,6 +1,6 @@
 import pytest
 from src.coordinator.event_bus import EventBus
-from src.events.base import Event
+from src.events.base import Event, StarterEvent
 
 def test_bus_subscription():
     bus = EventBus()
@@ -24,3 +24,18 @@ def test_bus_publish():
     bus.publish(event)
     
     assert results == ["test"]
+
+def test_bus_routes_by_class_and_type_name():
+    from src.core.ledger import Ledger
+    from src.core.state import State
+    from src.core.capsule import CapsuleType
+    bus = EventBus()
+    seen = []
+    
+    bus.subscribe(StarterEvent, lambda e, l, s: seen.append("class"))
+    bus.subscribe("starter", lambda e, l, s: seen.append("name"), priority=1)
+    bus.subscribe(Event, lambda e, l, s: seen.append("base"))
+    
+    bus.publish(StarterEvent(starter_id="s1"), Ledger("a"), State("a", CapsuleType.PROTO))
+    assert seen[0] == "name"
+    assert sorted(seen[1:]) == ["base", "class"]
@@ -30,3 +30,43 @@ def test_user_action_event():
     )
     assert event.action_type == UserActionType.ACCEPT_INVITE
     assert event.target_capsule_id == "capsule_123"
+
+def test_typed_events_have_no_instance_dict():
+    for event in (Event(), StarterEvent(starter_id="s1"), InviteEvent(), UserActionEvent()):
+        assert not hasattr(event, "__dict__")
+
+def test_metadata_allocated_lazily():
+    event = InviteEvent(sender_capsule_id="a")
+    assert event._metadata is None
+    event.metadata["note"] = "x"
+    assert event.to_dict()["metadata"] == {"note": "x"}
+
+def test_typed_event_round_trip():
+    event = UserActionEvent(
+        source="b",
+        action_type=UserActionType.REJECT_INVITE,
+        invite_sender_id="a",
+        invite_starter_id="s1"
+    )
+    data = event.to_dict()
+    assert data["event_type"] == "user_action"
+    assert data["action_type"] == "reject_invite"
+    
+    restored = Event.from_dict(data)
+    assert isinstance(restored, UserActionEvent)
+    assert restored == event
+    assert restored.action_type == UserActionType.REJECT_INVITE
+
+def test_ledger_restores_typed_events():
+    from src.core.ledger import Ledger
+    ledger = Ledger("b")
+    ledger.append(InviteEvent(source="a", sender_capsule_id="a", target_capsule_id="b"))
+    restored = Ledger.from_dict(ledger.to_dict())
+    event = restored.entries[0].event
+    assert isinstance(event, InviteEvent)
+    assert event.target_capsule_id == "b"
+
+def test_unregistered_type_stays_generic():
+    restored = Event.from_dict({"event_type": "invitation", "metadata": {"sender_id": "a"}})
+    assert type(restored) is Event
+    assert restored.metadata["sender_id"] == "a"
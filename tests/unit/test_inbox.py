@@ -0,0 +1,83 @@
+from src.core.capsule import Capsule, CapsuleType
+from src.core.ledger import Ledger
+from src.core.registry import StarterRegistry
+from src.modules.inbox import (
+    accept_if_empty, accept_if_empty_else_reject, process_inbox, reject_all,
+)
+
+def _setup():
+    senders = {
+        cid: Capsule(capsule_id=cid, capsule_type=CapsuleType.GENESIS)
+        for cid in ("a", "c")
+    }
+    proto = Capsule(capsule_id="b", capsule_type=CapsuleType.PROTO)
+    registry = StarterRegistry()
+    for sender in senders.values():
+        registry.register_capsule(sender)
+    return senders, proto, registry
+
+def _invite(n, sender, slot, recipient="b"):
+    return {"id": f"inv{n}", "sender": sender.capsule_id, "recipient": recipient,
+            "slot": slot, "starter_id": sender.get_starter_id(slot)}
+
+def test_accepts_in_arrival_order_and_persists_once():
+    senders, proto, registry = _setup()
+    a, c = senders["a"], senders["c"]
+    invitations = [
+        _invite(1, a, "⚡ Juice"), _invite(2, c, "⚡ Juice"),
+        _invite(3, c, "🔥 Kick"), _invite(4, a, "🌱 Seed", recipient="z"),
+    ]
+    ledger = Ledger("b")
+    result = process_inbox(proto, ledger, invitations, accept_if_empty, registry, senders.get)
+
+    assert [inv["id"] for inv in result.accepted] == ["inv1", "inv3"]
+    assert [inv["id"] for inv in result.remaining] == ["inv2", "inv4"]
+    new_starter = proto.get_starter_id("⚡ Juice")
+    assert new_starter not in (None, invitations[0]["starter_id"])
+    assert a.get_starter_id("⚡ Juice") == invitations[0]["starter_id"]
+    assert registry.owner_of(new_starter) == "b"
+    assert registry.owner_of(invitations[2]["starter_id"]) == "c"
+    assert result.senders == {}
+    assert len(ledger.entries) == 2
+    assert ledger.entries[0].timestamp_ns == ledger.entries[1].timestamp_ns
+
+def test_reject_burns_only_when_slot_empty():
+    senders, proto, registry = _setup()
+    a = senders["a"]
+    invitations = [_invite(1, a, "⚡ Juice"), _invite(2, a, "🔥 Kick")]
+    proto.set_starter("🔥 Kick", "held")
+    ledger = Ledger("b")
+    result = process_inbox(proto, ledger, invitations, reject_all, registry, senders.get)
+
+    assert [inv["id"] for inv in result.burned] == ["inv1"]
+    assert list(result.senders) == ["a"]
+    assert a.get_starter_id("⚡ Juice") is None
+    assert a.get_starter_id("🔥 Kick") == invitations[1]["starter_id"]
+    assert registry.get(invitations[0]["starter_id"]) is None
+    assert [e.event.metadata["burned"] for e in ledger.entries] == [True, False]
+    assert result.remaining == []
+
+def test_accept_else_reject_tracks_slots_within_batch():
+    senders, proto, registry = _setup()
+    a, c = senders["a"], senders["c"]
+    invitations = [_invite(1, a, "💥 Spark"), _invite(2, c, "💥 Spark")]
+    ledger = Ledger("b")
+    result = process_inbox(proto, ledger, invitations, accept_if_empty_else_reject,
+                           registry, senders.get)
+
+    assert [inv["id"] for inv in result.accepted] == ["inv1"]
+    assert [inv["id"] for inv in result.rejected] == ["inv2"]
+    assert result.burned == []
+    assert c.get_starter_id("💥 Spark") == invitations[1]["starter_id"]
+
+def test_conflicting_transfer_is_skipped():
+    senders, proto, registry = _setup()
+    a = senders["a"]
+    invitation = _invite(1, a, "📡 Pulse")
+    registry.transfer(invitation["starter_id"], "a", "x", "📡 Pulse", event_id="e")
+    result = process_inbox(proto, Ledger("b"), [invitation], accept_if_empty,
+                           registry, senders.get)
+
+    assert result.accepted == []
+    assert result.remaining == [invitation]
+    assert len(result.skipped) == 1
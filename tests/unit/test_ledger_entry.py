@@ -0,0 +1,54 @@
+import pytest
+from src.core.ledger import Ledger, LedgerEntry, TAGS
+from src.events.base import Event
+
+def test_entry_is_slotted():
+    entry = LedgerEntry(Event(), tags=["invitation"])
+    assert not hasattr(entry, "__dict__")
+    assert entry.id == entry.event.event_id
+
+def test_tags_share_interned_tuple():
+    ledger = Ledger("a")
+    first = ledger.append(Event(), tags=["invitation", "outgoing"])
+    second = ledger.append(Event(), tags=["outgoing", "invitation"])
+    assert first.tags == ("invitation", "outgoing")
+    assert first.tags is second.tags
+    assert first.tag_mask == TAGS.mask(["invitation", "outgoing"])
+
+def test_get_entries_by_tag_mask():
+    ledger = Ledger("a")
+    ledger.append(Event(), tags=["invitation", "outgoing"])
+    ledger.append(Event(), tags=["invitation", "accepted"])
+    ledger.append(Event())
+    assert len(ledger.get_entries(tags=["accepted"])) == 1
+    assert len(ledger.get_entries(tags=["invitation"])) == 2
+    assert ledger.get_entries(tags=["never-used-tag"]) == []
+
+def test_loaded_strings_are_interned():
+    ledger = Ledger("capsule-x")
+    ledger.append(Event(event_type="invitation"), tags=["invitation"])
+    ledger.append(Event(event_type="invitation"), tags=["invitation"])
+    import json
+    restored = Ledger.from_dict(json.loads(json.dumps(ledger.to_dict())))
+    first, second = restored.entries
+    assert first.event.event_type is second.event.event_type
+    assert first.capsule_id is second.capsule_id
+    assert restored.to_dict() == ledger.to_dict()
+
+def test_snapshot_is_a_stable_prefix_without_copying():
+    import threading
+    ledger = Ledger("a")
+    for _ in range(3):
+        ledger.append(Event())
+    snapshot = ledger.get_entries()
+    assert snapshot._entries is ledger.entries
+
+    writer = threading.Thread(target=lambda: [ledger.append(Event()) for _ in range(1000)])
+    writer.start()
+    seen = [list(snapshot) for _ in range(50)]
+    writer.join()
+    assert all(s == seen[0] == ledger.entries[:3] for s in seen)
+    assert len(snapshot) == 3 and len(ledger.snapshot()) == 1003
+    assert snapshot[-1] is ledger.entries[2] and snapshot[1:] == ledger.entries[1:3]
+    with pytest.raises(IndexError):
+        snapshot[3]
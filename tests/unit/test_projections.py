@@ -0,0 +1,56 @@
+import json
+from src.core.ledger import Ledger
+from src.core.projections import PendingInvitations, Projector
+from src.events import Event, create_invitation_event
+
+def _accepted(invitation_id, sender="a"):
+    event = Event(event_type="invitation_accepted")
+    event.metadata.update({"invitation_id": invitation_id, "sender": sender, "slot": "⚡ Juice"})
+    return event
+
+def test_attached_projector_follows_appends():
+    sender, recipient = Ledger("a"), Ledger("b")
+    projector = Projector()
+    projector.attach(sender)
+    projector.attach(recipient)
+
+    sender.append(create_invitation_event("inv1", "a", "b", "s1", "a", "⚡ Juice"))
+    sender.append(create_invitation_event("inv2", "a", "b", "s2", "a", "🌱 Seed"))
+    pending = projector["pending_invitations"]
+    assert [inv["id"] for inv in pending.pending_for("b")] == ["inv1", "inv2"]
+
+    recipient.append_many([(_accepted("inv1"), ["invitation"])])
+    assert [inv["id"] for inv in pending.pending_for("b")] == ["inv2"]
+    assert projector["accepted_invitations"].count_for("a") == 1
+    assert projector["starter_counts"].counts_for("b")["received"] == 1
+    assert projector.positions == {"a": 2, "b": 1}
+
+    projector.detach(sender)
+    sender.append(Event(event_type="other"))
+    assert projector.position("a") == 2
+
+def test_checkpoint_catch_up_reads_only_new_entries():
+    sender = Ledger("a")
+    sender.append(create_invitation_event("inv1", "a", "b", "s1", "a", "⚡ Juice"))
+    projector = Projector()
+    assert projector.catch_up(sender) == 1
+
+    restored = Projector.from_dict(json.loads(json.dumps(projector.to_dict())))
+    assert restored.catch_up(sender) == 0
+    sender.append(create_invitation_event("inv2", "a", "b", "s2", "a", "⚡ Juice"))
+    assert restored.catch_up(sender) == 1
+    assert restored["pending_invitations"].ids() == {"inv1", "inv2"}
+
+    # Written for other views: starts empty and rebuilds
+    stale = dict(projector.to_dict(), views={"pending_invitations": 0})
+    assert Projector.from_dict(stale).positions == {}
+
+def test_answer_seen_before_invitation():
+    pending = PendingInvitations()
+    projector = Projector([pending])
+    recipient, sender = Ledger("b"), Ledger("a")
+    recipient.append(_accepted("inv1"))
+    sender.append(create_invitation_event("inv1", "a", "b", "s1", "a", "⚡ Juice"))
+    projector.catch_up(recipient)
+    projector.catch_up(sender)
+    assert len(pending) == 0 and pending.to_dict() == {"pending": [], "closed": []}
@@ -0,0 +1,56 @@
+from src.clock import FakeClock
+from src.core.ledger import Ledger
+from src.core.query import Query, entry_field, ledger_index
+from src.events import Event, create_invitation_event
+
+def _ledger(capsule_id, recipients, start_ns=0):
+    ledger = Ledger(capsule_id, clock=FakeClock(start_ns=start_ns, step_ns=10))
+    for i, recipient in enumerate(recipients):
+        event = create_invitation_event(f"{capsule_id}{i}", capsule_id, recipient, f"s{i}", capsule_id, "⚡ Juice")
+        ledger.append(event, tags=["invitation", "outgoing"])
+    ledger.append(Event(event_type="other"), tags=["misc"])
+    return ledger
+
+def test_planner_picks_smallest_index():
+    ledger = _ledger("a", ["b"] * 50 + ["c"])
+    query = Query(ledger).where(event_type="invitation", recipient_id="c")
+    assert "recipient_id = 'c' -> 1 of 52 rows; filter event_type = 'invitation'" in query.explain()
+    assert [e.event.metadata["recipient_id"] for e in query] == ["c"]
+
+    by_id = Query(ledger).where(event_id=ledger.entries[7].id).tagged("outgoing")
+    assert "event_id" in by_id.explain().splitlines()[1]
+    assert by_id.first() is ledger.entries[7]
+    assert "sequence [10, 13) -> 3 of 52" in Query(ledger).sequences(10, 13).explain()
+    assert "timestamp [100, 130) -> 3 of 52" in Query(ledger).between(100, 130).explain()
+    assert Query(ledger).tagged("misc", "nope").count() == 1
+
+def test_merge_order_limit_and_select():
+    ledgers = [_ledger("a", ["x", "y"], start_ns=0), _ledger("b", ["x"], start_ns=5)]
+    query = Query(ledgers).where(event_type="invitation").order_by("timestamp_ns", descending=True)
+    assert "merge of sorted streams" in query.explain()
+    assert [e.timestamp_ns for e in query] == [10, 5, 0]
+    assert query.limit(2).select("capsule_id", "recipient_id").all() == [
+        {"capsule_id": "a", "recipient_id": "y"}, {"capsule_id": "b", "recipient_id": "x"},
+    ]
+    assert Query(ledgers).tagged("invitation").count_by("recipient_id") == {"x": 2, "y": 1}
+    assert Query(ledgers).aggregate("sequence_number", max) == 3
+
+def test_index_follows_appends_and_unsorted_time():
+    ledger = _ledger("a", ["b"])
+    assert Query(ledger).where(recipient_id="c").count() == 0
+    ledger.append(create_invitation_event("late", "a", "c", "s9", "a", "🌱 Seed"))
+    assert Query(ledger).where(recipient_id="c").count() == 1
+    assert len(ledger_index(ledger)) == 3
+
+    ledger.append(Event(event_type="skewed"))
+    ledger.entries[-1].timestamp_ns = -1
+    ledger.entries = list(ledger.entries)  # replaced list: index is rebuilt
+    query = Query(ledger).between(0, 1000).order_by("timestamp_ns")
+    assert "full scan" in query.explain() and "(sort)" in query.explain()
+    assert len(query.all()) == 3
+
+def test_order_by_a_field_some_entries_lack():
+    ledger = _ledger("a", ["y", "x"])  # its last entry has no recipient
+    recipients = lambda query: [entry_field(e, "recipient_id") for e in query]
+    assert recipients(Query(ledger).order_by("recipient_id")) == ["x", "y", None]
+    assert recipients(Query(ledger).order_by("recipient_id", descending=True)) == ["y", "x", None]
@@ -0,0 +1,96 @@
+import json
+import pytest
+from src.core.capsule import Capsule, CapsuleType
+from src.core.ledger import Ledger
+from src.core.registry import (
+    OwnershipStatus, StarterConflictError, StarterRegistry, audit_capsules,
+)
+from src.events import Event, StarterEvent, create_invitation_event
+
+def _genesis_registry():
+    genesis = Capsule(capsule_id="a", capsule_type=CapsuleType.GENESIS)
+    registry = StarterRegistry()
+    registry.register_capsule(genesis)
+    return genesis, registry
+
+def test_register_and_transfer():
+    genesis, registry = _genesis_registry()
+    starter_id = genesis.get_starter_id("⚡ Juice")
+    assert registry.owner_of(starter_id) == "a"
+    
+    registry.transfer(starter_id, "a", "b", "⚡ Juice", event_id="e1")
+    record = registry.get(starter_id)
+    assert (record.capsule_id, record.slot, record.last_event_id) == ("b", "⚡ Juice", "e1")
+    
+    with pytest.raises(StarterConflictError):
+        registry.validate_transfer(starter_id, "a", "c")
+    with pytest.raises(StarterConflictError):
+        registry.validate_transfer(starter_id, "b", "b")
+
+def test_accept_offer_generates_new_starter():
+    genesis, registry = _genesis_registry()
+    starter_id = genesis.get_starter_id("⚡ Juice")
+    registry.mark_offered(starter_id, event_id="e0")
+    registry.accept_offer(starter_id, "a", "b", "⚡ Juice", "new", event_id="e1")
+    assert registry.owner_of(starter_id) == "a"
+    assert registry.get(starter_id).status == OwnershipStatus.HELD
+    assert (registry.owner_of("new"), registry.get("new").last_event_id) == ("b", "e1")
+    with pytest.raises(StarterConflictError):
+        registry.accept_offer(starter_id, "c", "b", "⚡ Juice", "other")
+
+def test_double_assignment_rejected():
+    genesis, registry = _genesis_registry()
+    with pytest.raises(StarterConflictError):
+        registry.assign(genesis.get_starter_id("🔥 Kick"), "other", "🔥 Kick")
+
+def test_maintained_from_ledger_events():
+    genesis, registry = _genesis_registry()
+    starter_id = genesis.get_starter_id("🌱 Seed")
+    
+    sender_ledger = Ledger("a")
+    sender_ledger.append(create_invitation_event("inv1", "a", "b", starter_id, "a", "🌱 Seed"))
+    sender_ledger.append(create_invitation_event("inv2", "a", "c", starter_id, "a", "🌱 Seed"))
+    registry.apply_ledger(sender_ledger)
+    assert registry.get(starter_id).status == OwnershipStatus.OFFERED
+    
+    for still_offered in (True, False):  # inv2 keeps it offered, then expires too
+        expired = Event(event_type="invitation_expired")
+        expired.metadata.update({"starter_id": starter_id})
+        registry.apply_entry(sender_ledger.append(expired))
+        assert (registry.get(starter_id).status == OwnershipStatus.OFFERED) == still_offered
+    
+    recipient_ledger = Ledger("b")
+    accepted = Event(event_type="invitation_accepted")
+    accepted.metadata.update({"sender": "a", "slot": "🌱 Seed", "new_starter_id": starter_id})
+    recipient_ledger.append(accepted)
+    recipient_ledger.append(StarterEvent(
+        starter_id=genesis.get_starter_id("📡 Pulse"), source="b",
+        metadata={"action": "starter_burned"},
+    ))
+    registry.apply_ledger(recipient_ledger)
+    assert registry.owner_of(starter_id) == "b"
+    assert registry.get(starter_id).status == OwnershipStatus.HELD
+    assert genesis.get_starter_id("📡 Pulse") not in registry
+
+def test_serialization_round_trip():
+    _, registry = _genesis_registry()
+    restored = StarterRegistry.from_dict(json.loads(json.dumps(registry.to_dict())))
+    assert restored.to_dict() == registry.to_dict()
+
+@pytest.mark.parametrize("backend", ["json", "sqlite"])
+def test_audit_capsules_of_a_store(tmp_path, backend):
+    from src.storage import migrate_layout, open_store
+
+    if backend == "json":
+        migrate_layout(tmp_path, "sharded")
+    store = open_store(tmp_path, backend)
+    genesis = Capsule(capsule_id="a", capsule_type=CapsuleType.GENESIS)
+    proto = Capsule(capsule_id="b", capsule_type=CapsuleType.PROTO)
+    proto.occupy_slot("⚡ Juice", genesis.get_starter_id("⚡ Juice"))
+    for capsule in (genesis, proto):
+        store.save_capsule(capsule.capsule_id, capsule.to_dict())
+    
+    conflicts = audit_capsules(store.iter_capsules())
+    store.close()
+    assert list(conflicts) == [genesis.get_starter_id("⚡ Juice")]
+    assert sorted(conflicts[genesis.get_starter_id("⚡ Juice")]) == [("a", "⚡ Juice"), ("b", "⚡ Juice")]
@@ -0,0 +1,47 @@
+import json
+import pytest
+from src.core.capsule import Capsule, CapsuleType
+from src.core.relationships import RelationshipState, RelationshipStore
+
+def test_states_are_independent_toggles():
+    store = RelationshipStore()
+    rel = store.get("b")
+    rel.invited = True
+    assert rel.toggle("trusted") is True
+    assert rel.state == RelationshipState.INVITED | RelationshipState.TRUSTED
+    rel.invited = False
+    assert rel.toggle(RelationshipState.TRUSTED) is False
+    assert len(store) == 0
+
+def test_per_state_indexes():
+    store = RelationshipStore()
+    for i in range(10):
+        store.set_state(f"p{i}", "invited", True)
+        if i % 2:
+            store.set_state(f"p{i}", "trusted", True)
+    store.toggle("p1", "trusted")
+    assert store.count("invited") == 10
+    assert store.peers_with("trusted") == {"p3", "p5", "p7", "p9"}
+    assert store.peers_with("linked") == set()
+
+def test_unknown_state_rejected():
+    with pytest.raises(ValueError):
+        RelationshipStore().toggle("b", "friends")
+
+def test_serialization_groups_by_bitfield():
+    store = RelationshipStore()
+    store.set_state("a", "trusted", True)
+    store.set_state("b", "trusted", True)
+    store.set_state("c", "ignored", True)
+    data = json.loads(json.dumps(store.to_dict()))
+    assert data == {"2": ["a", "b"], "8": ["c"]}
+    restored = RelationshipStore.from_dict(data)
+    assert restored.peers_with("trusted") == {"a", "b"}
+    assert restored.get("c").ignored
+
+def test_capsule_relationships_persist():
+    capsule = Capsule(capsule_id="a", capsule_type=CapsuleType.PROTO)
+    capsule.get_relationship("b").invited = True
+    restored = Capsule.from_dict(capsule.to_dict())
+    assert restored.get_relationship("b").invited
+    assert restored == capsule
@@ -0,0 +1,74 @@
+import pytest
+from src.core.ledger import Ledger
+from src.core.replication import (
+    LoopbackTransport, ReplicaPeer, ReplicationError, ledger_fingerprints, reconcile,
+)
+from src.events import Event
+
+def _ledger(count, capsule_id="a"):
+    ledger = Ledger(capsule_id)
+    for i in range(count):
+        ledger.append(Event(event_type=f"e{i}"), tags=["misc"])
+    return ledger
+
+def test_only_missing_entries_travel_in_batches():
+    ahead = _ledger(1000)
+    behind = Ledger.from_dict(ahead.to_dict())
+    ahead.append_many([(Event(event_type="new"), ["misc"])] * 5)
+    behind.entries = behind.entries[:990]
+    behind._sequence_counter = 990
+
+    transport = LoopbackTransport(ReplicaPeer(ahead))
+    result = reconcile(behind, transport, batch_size=4)
+    assert (result.pulled, result.pushed, result.merged_from) == (15, 0, None)
+    assert result.round_trips == 1 + 4
+    assert [e.to_dict() for e in behind.entries] == [e.to_dict() for e in ahead.entries]
+    assert transport.bytes_received < len(str(ahead.to_dict())) // 20
+
+    behind.append(Event(event_type="offline"))
+    result = reconcile(behind, LoopbackTransport(ReplicaPeer(ahead)))
+    assert (result.pulled, result.pushed) == (0, 1) and len(ahead.entries) == 1006
+    assert reconcile(behind, LoopbackTransport(ReplicaPeer(ahead))).round_trips == 1
+
+def test_diverged_replicas_merge_and_converge():
+    left = _ledger(4096)
+    right = Ledger.from_dict(left.to_dict())
+    right.entries = right.entries[:3000]
+    right._sequence_counter = 3000
+    left.entries[2000 - 1].event.event_id = "rewritten"
+    right.append(Event(event_type="offline"))
+
+    result = reconcile(left, LoopbackTransport(ReplicaPeer(right)), fanout=16)
+    assert result.merged_from == 2000
+    assert (result.pulled, result.pushed) == (2, 1097)
+    assert [e.to_dict() for e in left.entries] == [e.to_dict() for e in right.entries]
+    assert len(left.entries) == 4098
+    assert [e.sequence_number for e in left.entries] == list(range(1, 4099))
+    assert reconcile(left, LoopbackTransport(ReplicaPeer(right))).round_trips == 1
+
+def test_few_differences_cost_few_fingerprints():
+    left = _ledger(5000)
+    right = Ledger.from_dict(left.to_dict())
+    left.append(Event(event_type="left"))
+    right.append(Event(event_type="right"))
+    # Later entries both replicas received from a third one
+    right.append_replicated(left.append_many([(Event(event_type="shared"), None)] * 1000))
+
+    transport = LoopbackTransport(ReplicaPeer(right))
+    result = reconcile(left, transport)
+    assert result.merged_from == 5001 and (result.pulled, result.pushed) == (1, 1)
+    assert result.fingerprints < 200
+    assert transport.bytes_sent + transport.bytes_received < len(str(left.to_dict())) // 20
+    assert [e.id for e in left.entries] == [e.id for e in right.entries]
+
+def test_peer_refuses_other_capsules_and_gaps():
+    with pytest.raises(ReplicationError, match="replica of 'b'"):
+        reconcile(_ledger(1), LoopbackTransport(ReplicaPeer(_ledger(1, "b"))))
+    peer = ReplicaPeer(_ledger(3))
+    entry = _ledger(5).entries[4].to_dict()
+    assert "does not continue" in peer.handle({"op": "push", "entries": [entry]})["error"]
+    assert "error" in peer.handle({"op": "drop"})
+
+    fingerprints = ledger_fingerprints(peer.ledger)
+    assert fingerprints.fingerprint(1, 4) == fingerprints.fingerprint(1, 2) ^ fingerprints.fingerprint(2, 4)
+    assert fingerprints.fingerprint(2, 2) == 0
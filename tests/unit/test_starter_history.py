@@ -0,0 +1,50 @@
+import json
+import pytest
+from src.core.capsule import Starter, StarterHistory, StarterStatus
+
+def _starter():
+    return Starter(starter_id="s1", capsule_id="a", slot_type="⚡ Juice")
+
+def test_status_follows_toggle_parity():
+    starter = _starter()
+    assert starter.status == StarterStatus.OFF
+    starter.add_event(1)
+    assert starter.status == StarterStatus.ON
+    starter.add_event(4)
+    assert starter.status == StarterStatus.OFF
+    starter.toggle()
+    assert starter.status == StarterStatus.ON
+    assert list(starter.history) == [1, 4]
+
+def test_truncate_keeps_status():
+    starter = _starter()
+    for seq in range(1, 8):
+        starter.add_event(seq)
+    assert starter.status == StarterStatus.ON
+    assert starter.history.truncate(5) == 5
+    assert list(starter.history) == [6, 7]
+    assert starter.history.toggle_count == 7
+    assert starter.status == StarterStatus.ON
+
+def test_round_trip_is_compact():
+    starter = _starter()
+    for seq in range(1, 1001):
+        starter.add_event(seq)
+    starter.history.truncate(10)
+    data = json.loads(json.dumps(starter.to_dict()))
+    assert isinstance(data["history"]["refs"], str)
+    
+    restored = Starter.from_dict(data)
+    assert restored == starter
+    assert restored.status == starter.status
+    assert restored.history.toggle_count == 1000
+
+def test_legacy_history_list():
+    restored = Starter.from_dict({
+        "starter_id": "s1", "capsule_id": "a", "slot_type": "⚡ Juice",
+        "status": "on", "created_at": "x", "history": ["e1", "e2", "e3"],
+        "traits": {},
+    })
+    assert restored.status == StarterStatus.ON
+    assert restored.history.toggle_count == 3
+    assert len(restored.history) == 0
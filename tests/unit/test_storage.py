@@ -0,0 +1,394 @@
+import multiprocessing
+import os
+import pytest
+from src.core.capsule import Capsule, CapsuleType
+from src.core.ledger import Ledger
+from src.events import Event
+from src.storage import (
+    CachedStore, JsonStore, SqliteStore, detect_backend, migrate, open_store,
+)
+from src.storage import files, layout
+from src.storage.cached import LRUCache
+from src.storage.invitations import InvitationIndex
+
+@pytest.fixture(params=["json", "sqlite"])
+def store(request, tmp_path):
+    store = open_store(tmp_path, request.param)
+    yield store
+    store.close()
+
+def _invitation(n, sender="a", recipient="b"):
+    return {"id": f"inv{n}", "sender": sender, "recipient": recipient, "slot": "⚡ Juice",
+            "starter_id": f"s{n}", "timestamp": f"2026-01-01 00:00:{n:02d}"}
+
+def test_capsule_roundtrip(store):
+    capsule = Capsule(capsule_id="a", capsule_type=CapsuleType.GENESIS)
+    store.save_capsule("a", capsule.to_dict())
+    assert Capsule.from_dict(store.load_capsule("a")) == capsule
+    assert store.capsule_ids() == ["a"]
+    assert store.load_capsule("missing") is None
+
+def test_ledger_appends_incrementally(store):
+    ledger = Ledger("a")
+    ledger.append(Event(event_type="one"), tags=["x"])
+    store.save_ledger("a", ledger)
+    ledger.append(Event(event_type="two"), tags=["y"])
+    store.save_ledger("a", ledger)
+
+    loaded = store.load_ledger("a")
+    assert [e.event.event_type for e in loaded.entries] == ["one", "two"]
+    assert loaded.entries[1].tags == ("y",)
+    assert loaded.entries[1].timestamp_ns == ledger.entries[1].timestamp_ns
+    assert loaded._sequence_counter == 2
+    assert store.load_ledger("none").entries == []
+
+def test_sqlite_refuses_stale_ledger(tmp_path):
+    from src.storage import LedgerConflictError
+    store = open_store(tmp_path, "sqlite")
+    ledger = Ledger("a")
+    ledger.append(Event(event_type="one"))
+    store.save_ledger("a", ledger)
+    stale = store.load_ledger("a")
+    ledger.append(Event(event_type="two"))
+    store.save_ledger("a", ledger)
+
+    stale.append(Event(event_type="lost"))
+    with pytest.raises(LedgerConflictError, match="differs .* #2"):
+        store.save_ledger("a", stale)
+    with pytest.raises(LedgerConflictError, match="2 stored entries"):
+        store.save_ledger("a", Ledger("a"))
+    assert [e.event.event_type for e in store.load_ledger("a").entries] == ["one", "two"]
+    store.close()
+
+def test_invitation_queries(store):
+    for n, (sender, recipient) in enumerate([("a", "b"), ("c", "b"), ("a", "d")]):
+        store.add_invitation(_invitation(n, sender, recipient))
+    assert [inv["id"] for inv in store.invitations_for("b")] == ["inv0", "inv1"]
+    assert [inv["id"] for inv in store.invitations_from("a")] == ["inv0", "inv2"]
+    assert store.get_invitation("inv1")["sender"] == "c"
+    assert store.count_invitations() == 3
+
+    store.remove_invitations(["inv0", "inv2"])
+    assert [inv["id"] for inv in store.load_invitations()] == ["inv1"]
+
+def test_expired_invitation_queries(store):
+    for n, expires_ns in enumerate([30, None, 10, 20]):
+        store.add_invitation(dict(_invitation(n), expires_ns=expires_ns))
+    cached = CachedStore(store)
+    for view in (store, cached):
+        assert view.next_invitation_expiry() == 10
+        assert [inv["id"] for inv in view.expired_invitations(20)] == ["inv2", "inv3"]
+        assert view.expired_invitations(9) == []
+    cached.remove_invitations(["inv2"])
+    assert store.next_invitation_expiry() == cached.next_invitation_expiry() == 20
+
+def test_json_store_indexes_invitations(tmp_path, monkeypatch):
+    store, other = JsonStore(tmp_path), JsonStore(tmp_path)
+    store.add_invitation(dict(_invitation(1), expires_ns=10))
+    assert store.next_invitation_expiry() == 10
+    loads = []
+    load = JsonStore.load_invitations
+    monkeypatch.setattr(JsonStore, "load_invitations", lambda self: loads.append(1) or load(self))
+    for _ in range(3):
+        assert store.invitations_for("b") and store.expired_invitations(5) == []
+    assert loads == []  # unchanged file: served from the index
+    other.add_invitation(dict(_invitation(2), expires_ns=5))
+    assert [inv["id"] for inv in store.expired_invitations(5)] == ["inv2"]
+    store.close()
+    other.close()
+
+def test_invitation_index_expiry_heap():
+    index = InvitationIndex(dict(_invitation(n), expires_ns=100 - n) for n in range(100))
+    assert index.next_expiry() == 1
+    assert [inv["id"] for inv in index.expired(3)] == ["inv99", "inv98", "inv97"]
+    index.discard("inv99")
+    index.add(dict(_invitation(98), expires_ns=500))  # re-dated: old heap entry is stale
+    assert [inv["id"] for inv in index.expired(3)] == ["inv97"]
+    assert index.next_expiry() == 3 and len(index) == 99
+
+    for n in range(90):
+        index.discard(f"inv{n}")
+    assert len(index._heap) <= 2 * len(index) + 64
+    assert [inv["id"] for inv in index.for_recipient("b")] == [f"inv{n}" for n in (90, 91, 92, 93, 94, 95, 96, 97, 98)]
+
+def test_sqlite_uses_wal(tmp_path):
+    store = SqliteStore(tmp_path)
+    assert store._conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    store.close()
+
+def test_migrate_json_to_sqlite(tmp_path):
+    source = JsonStore(tmp_path)
+    source.save_capsule("a", Capsule(capsule_id="a", capsule_type=CapsuleType.PROTO).to_dict())
+    ledger = Ledger("a")
+    ledger.append(Event(event_type="created"))
+    source.save_ledger("a", ledger)
+    source.add_invitation(_invitation(1))
+    assert detect_backend(tmp_path) == "json"
+
+    target = SqliteStore(tmp_path)
+    assert migrate(source, target) == {"capsules": 1, "ledgers": 1, "invitations": 1}
+    assert detect_backend(tmp_path) == "sqlite"
+    assert target.load_ledger("a").entries[0].event.event_type == "created"
+    assert target.invitations_for("b") == source.invitations_for("b")
+    target.close()
+
+def test_capsule_summaries(store):
+    capsule = Capsule(capsule_id="a", capsule_type=CapsuleType.GENESIS)
+    store.save_capsule("a", capsule.to_dict())
+    ledger = Ledger("a")
+    ledger.append(Event())
+    store.save_ledger("a", ledger)
+    capsule.set_starter("⚡ Juice", None)
+    store.save_capsule("a", capsule.to_dict())
+
+    (summary,) = store.capsule_summaries()
+    assert summary["capsule_id"] == "a"
+    assert summary["capsule_type"] == "genesis"
+    assert (summary["occupied"], summary["slots"], summary["ledger_length"]) == (4, 5, 1)
+    assert store.capsule_summary("a") == summary
+    assert store.capsule_summary("missing") is None
+
+def test_manifest_revalidates_changed_files(tmp_path):
+    store = JsonStore(tmp_path)
+    store.save_capsule("a", Capsule(capsule_id="a", capsule_type=CapsuleType.PROTO).to_dict())
+    store.close()
+    assert (tmp_path / "manifest.json").exists()
+
+    # Written behind the store's back: newer mtime, different contents
+    other = Capsule(capsule_id="b", capsule_type=CapsuleType.GENESIS).to_dict()
+    JsonStore(tmp_path).save_capsule("b", other)
+    capsule_file = tmp_path / "a_capsule.json"
+    capsule_file.write_text(capsule_file.read_text().replace('"proto"', '"linked"'))
+    mtime = capsule_file.stat().st_mtime
+    os.utime(capsule_file, (mtime + 1, mtime + 1))
+
+    store = JsonStore(tmp_path)
+    summaries = {s["capsule_id"]: s for s in store.capsule_summaries()}
+    assert summaries["a"]["capsule_type"] == "linked"
+    assert summaries["b"]["occupied"] == 5
+
+    capsule_file.unlink()
+    assert [s["capsule_id"] for s in store.capsule_summaries()] == ["b"]
+
+def test_flat_listing_trusts_a_scanned_manifest(tmp_path, monkeypatch):
+    store = JsonStore(tmp_path)
+    for n in range(5):
+        store.save_capsule(f"c{n}", {"capsule_id": f"c{n}", "capsule_type": "proto", "slots": {}})
+    store.close()
+    store = JsonStore(tmp_path)
+    assert len(store.capsule_summaries()) == 5
+    store.close()
+
+    store = JsonStore(tmp_path)
+    scanned = []
+    scan = store.layout.scan
+    monkeypatch.setattr(store.layout, "scan", lambda d: scanned.append(d) or scan(d))
+    assert len(store.capsule_summaries()) == 5
+    assert scanned == []
+
+    JsonStore(tmp_path).save_capsule("c1", {"capsule_id": "c1", "capsule_type": "genesis", "slots": {}})
+    summaries = {s["capsule_id"]: s for s in store.capsule_summaries()}
+    assert scanned == [tmp_path] and summaries["c1"]["capsule_type"] == "genesis"
+
+def test_cached_store_serves_from_memory(tmp_path):
+    backing = JsonStore(tmp_path)
+    store = CachedStore(backing)
+    store.save_capsule("a", {"capsule_id": "a"})
+    store.add_invitation(_invitation(1, "a", "b"))
+    store.add_invitation(_invitation(2, "c", "b"))
+    assert store.load_ledger("a") is store.load_ledger("a")
+
+    # Changes behind the cache are not seen until invalidated
+    backing.save_capsule("a", {"capsule_id": "a", "changed": True})
+    assert "changed" not in store.load_capsule("a")
+    store.invalidate()
+    assert store.load_capsule("a")["changed"]
+
+    store.remove_invitations(["inv1"])
+    assert [inv["id"] for inv in store.invitations_for("b")] == ["inv2"]
+    assert store.invitations_from("a") == []
+    assert [inv["id"] for inv in backing.load_invitations()] == ["inv2"]
+
+def test_cached_store_write_back(tmp_path):
+    backing = SqliteStore(tmp_path)
+    store = CachedStore(backing, write_back=True)
+    store.save_capsule("a", {"capsule_id": "a", "capsule_type": "proto", "slots": {}})
+    ledger = store.load_ledger("a")
+    ledger.append(Event())
+    store.save_ledger("a", ledger)
+    store.add_invitation(_invitation(1))
+    store.add_invitation(_invitation(2))
+    store.remove_invitations(["inv1"])
+
+    assert store.dirty
+    assert backing.load_capsule("a") is None and backing.count_invitations() == 0
+    assert store.capsule_ids() == ["a"]
+
+    store.flush()
+    assert not store.dirty
+    assert backing.load_capsule("a")["capsule_id"] == "a"
+    assert len(backing.load_ledger("a").entries) == 1
+    assert [inv["id"] for inv in backing.load_invitations()] == ["inv2"]
+    store.close()
+
+def test_atomic_write_json(tmp_path):
+    path = tmp_path / "data.json"
+    files.atomic_write_json(path, {"a": 1})
+    files.atomic_write_json(path, [1, 2], indent=2)
+    assert path.read_text() == "[\n  1,\n  2\n]"
+    assert os.listdir(tmp_path) == ["data.json"]
+
+    with pytest.raises(TypeError):
+        files.atomic_write_json(path, {"bad": object()})
+    assert os.listdir(tmp_path) == ["data.json"]
+
+def test_locks_are_reentrant_and_ordered(tmp_path):
+    a, b = files.capsule_lock("a"), files.capsule_lock("b")
+    with files.locked(tmp_path, files.STARTERS_LOCK, b, a):
+        with files.locked(tmp_path, a, files.STARTERS_LOCK, files.ADMISSION_LOCK):
+            pass
+        # Capsule locks come before the shared files
+        with pytest.raises(RuntimeError):
+            with files.locked(tmp_path, files.capsule_lock("c")):
+                pass
+        with pytest.raises(RuntimeError):
+            with files.locked(tmp_path, files.INVITATIONS_LOCK):
+                pass
+    assert not files._held
+
+def _add_invitations(data_dir, worker):
+    store = JsonStore(data_dir)
+    for n in range(10):
+        store.add_invitation(dict(_invitation(n, sender=f"w{worker}"), id=f"w{worker}-{n}"))
+
+@pytest.mark.skipif(files.fcntl is None, reason="needs fcntl")
+def test_concurrent_invitation_adds(tmp_path):
+    ctx = multiprocessing.get_context("fork")
+    workers = [ctx.Process(target=_add_invitations, args=(tmp_path, w)) for w in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert JsonStore(tmp_path).count_invitations() == 40
+
+def test_sharded_layout_migration(tmp_path):
+    store = JsonStore(tmp_path)
+    for capsule_id in ("a", "b", "c"):
+        store.save_capsule(capsule_id, Capsule(capsule_id=capsule_id, capsule_type=CapsuleType.PROTO).to_dict())
+    ledger = Ledger("a")
+    ledger.append(Event())
+    store.save_ledger("a", ledger)
+    assert len(store.capsule_summaries()) == 3
+    store.close()
+
+    assert layout.migrate_layout(tmp_path, "sharded") == 4
+    store = JsonStore(tmp_path)
+    assert store.layout.name == "sharded"
+    assert (tmp_path / "capsules" / layout.shard_of("a") / "a_capsule.json").exists()
+    assert not (tmp_path / "a_capsule.json").exists()
+    assert sorted(store.capsule_ids()) == ["a", "b", "c"] and store.ledger_ids() == ["a"]
+    summaries = {s["capsule_id"]: s for s in store.capsule_summaries()}
+    assert summaries["a"]["ledger_length"] == 1 and summaries["a"]["shard"] == layout.shard_of("a")
+    store.close()
+
+    assert layout.migrate_layout(tmp_path, "flat") == 4
+    assert not (tmp_path / "layout.json").exists() and not (tmp_path / "capsules").exists()
+    assert sorted(JsonStore(tmp_path).capsule_ids()) == ["a", "b", "c"]
+
+    (tmp_path / "layout.json").write_text('{"layout": "sharded", "version": 99}')
+    with pytest.raises(ValueError):
+        layout.detect_layout(tmp_path)
+
+@pytest.mark.skipif(files.fcntl is None, reason="needs fcntl")
+def test_migrations_wait_for_open_stores(tmp_path):
+    import fcntl
+
+    def layout_is_free():
+        fd = os.open(tmp_path / "locks" / "layout.lock", os.O_RDWR)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
+        finally:
+            os.close(fd)
+
+    store = JsonStore(tmp_path)
+    other = SqliteStore(tmp_path)
+    assert not layout_is_free()
+    store.close()
+    other.close()
+    assert layout_is_free()
+    with files.exclusive_layout(tmp_path):
+        assert not layout_is_free()
+        JsonStore(tmp_path).close()  # stores opened by the migration itself do not wait
+    assert layout_is_free()
+
+def test_manifest_skips_unchanged_shards(tmp_path, monkeypatch):
+    layout.migrate_layout(tmp_path, "sharded")
+    store = JsonStore(tmp_path)
+    for n in range(20):
+        store.save_capsule(f"c{n}", {"capsule_id": f"c{n}", "capsule_type": "proto", "slots": {}})
+    # Out of the racy window: shard mtimes are trusted from now on
+    old = os.stat(tmp_path).st_mtime - 10
+    for shard in (tmp_path / "capsules").iterdir():
+        os.utime(shard, (old, old))
+    assert len(store.capsule_summaries()) == 20
+
+    scanned = []
+    scan = store.layout.scan
+    monkeypatch.setattr(store.layout, "scan", lambda d: scanned.append(d) or scan(d))
+    assert len(store.capsule_summaries()) == 20
+    assert scanned == []
+
+    store.save_capsule("c1", {"capsule_id": "c1", "capsule_type": "genesis", "slots": {}})
+    summaries = {s["capsule_id"]: s for s in store.capsule_summaries()}
+    assert scanned == [store.layout.directory("c1")]
+    assert summaries["c1"]["capsule_type"] == "genesis" and len(summaries) == 20
+
+def test_lru_cache_evicts_by_size():
+    cache = LRUCache(max_size=5, sizeof=len)
+    cache.put("a", "xx")
+    cache.put("b", "xx")
+    assert cache.get("a") == "xx"  # "b" is now least recently used
+    cache.put("c", "xx")
+    assert "b" not in cache and cache.size == 4
+    cache.put("d", "x" * 9)  # too big on its own: kept, everything else evicted
+    assert len(cache) == 1 and cache.get("d")
+
+def test_cached_store_validates_versions(store, tmp_path):
+    cached = CachedStore(store, validate=True)
+    other = open_store(tmp_path, store.backend)
+    other.save_capsule("a", Capsule(capsule_id="a", capsule_type=CapsuleType.PROTO).to_dict())
+    other.flush()
+
+    capsule = cached.load_capsule_object("a", Capsule.from_dict)
+    assert cached.load_capsule_object("a", Capsule.from_dict) is capsule
+    assert (cached.hits, cached.misses) == (1, 1)
+
+    # Written by another process (connection): reloaded on the next lookup
+    other.save_capsule("a", Capsule(capsule_id="a", capsule_type=CapsuleType.GENESIS).to_dict())
+    other.add_invitation(_invitation(1, "a", "b"))
+    other.flush()
+    assert cached.load_capsule_object("a", Capsule.from_dict).capsule_type == CapsuleType.GENESIS
+    assert [inv["id"] for inv in cached.invitations_for("b")] == ["inv1"]
+
+    # Own writes keep the entry valid
+    ledger = cached.load_ledger("a")
+    ledger.append(Event())
+    cached.save_ledger("a", ledger)
+    hits = cached.hits
+    assert cached.load_ledger("a") is ledger and cached.hits == hits + 1
+    cached.add_invitation(_invitation(2, "a", "b"))
+    assert cached.count_invitations() == 2 == other.count_invitations()
+    other.close()
+
+def test_cached_store_keeps_dirty_items_past_eviction(tmp_path):
+    store = CachedStore(JsonStore(tmp_path), write_back=True, validate=True, max_size=2)
+    for n in range(5):
+        store.save_capsule(f"c{n}", {"capsule_id": f"c{n}"})
+    assert len(store._items) == 2
+    assert [store.load_capsule(f"c{n}")["capsule_id"] for n in range(5)] == [f"c{n}" for n in range(5)]
+    store.flush()
+    assert sorted(store.backing.capsule_ids()) == [f"c{n}" for n in range(5)]
+    assert store.load_capsule("c0") == {"capsule_id": "c0"}
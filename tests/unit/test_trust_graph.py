@@ -0,0 +1,55 @@
+import pytest
+from src.core.capsule import Capsule, CapsuleType
+from src.core.trust_graph import TrustGraph
+
+def _chain_graph(**kwargs):
+    return TrustGraph([("a", "b"), ("b", "c"), ("c", "d"), ("x", "a")], **kwargs)
+
+def test_k_hop_reachability():
+    graph = _chain_graph()
+    assert graph.is_reachable("a", "c", max_hops=2)
+    assert not graph.is_reachable("a", "d", max_hops=2)
+    assert graph.is_reachable("a", "d")
+    assert not graph.is_reachable("d", "a")
+    assert graph.reachable("a", max_hops=1) == {"b"}
+    assert graph.neighbourhood_size("x") == 4
+    assert graph.neighbourhood_size("unknown") == 0
+
+def test_toggles_invalidate_cache():
+    graph = _chain_graph(compact_threshold=100)
+    assert graph.neighbourhood_size("a") == 3
+    assert graph.neighbourhood_size("x") == 4
+    
+    graph.set_edge("b", "c", False)
+    assert graph.reachable("a") == {"b"}
+    assert graph.neighbourhood_size("x") == 2
+    
+    graph.set_edge("b", "e", True)
+    assert graph.reachable("a") == {"b", "e"}
+    assert graph.has_edge("b", "e") and not graph.has_edge("b", "c")
+
+def test_compaction_preserves_edges():
+    graph = _chain_graph(compact_threshold=2)
+    graph.set_edge("d", "a", True)
+    graph.set_edge("a", "b", False)
+    assert graph._delta == 0
+    assert graph.has_edge("d", "a") and not graph.has_edge("a", "b")
+    assert graph.reachable("c") == {"d", "a"}
+
+def test_watch_follows_trust_toggles():
+    a = Capsule(capsule_id="a", capsule_type=CapsuleType.PROTO)
+    b = Capsule(capsule_id="b", capsule_type=CapsuleType.PROTO)
+    b.get_relationship("c").trusted = True
+    graph = TrustGraph.from_capsules([a, b], watch=True)
+    
+    assert not graph.is_reachable("a", "c", max_hops=2)
+    a.get_relationship("b").toggle("trusted")
+    assert graph.is_reachable("a", "c", max_hops=2)
+    a.get_relationship("b").invited = True
+    assert graph.is_reachable("a", "c", max_hops=2)
+    a.get_relationship("b").toggle("trusted")
+    assert not graph.is_reachable("a", "b")
+    
+    graph.unwatch(a)
+    a.get_relationship("b").trusted = True
+    assert not graph.is_reachable("a", "b")